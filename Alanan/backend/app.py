@@ -4,6 +4,7 @@ import google.generativeai as genai
 import json
 from pydantic import BaseModel
 import os
+import sys
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +34,28 @@ json_path = os.path.join(BASE_DIR, "diseases.json")
 with open(json_path, encoding="utf-8") as f:
     diseases_data = json.load(f)
 
+sys.path.append(os.path.abspath(os.path.join(BASE_DIR, "..", "..")))
+from common.bm25 import RankingEngines, requested_ranking, requested_top_k
+from common.export import export_response
+from common.lookup import RecordLookup
+from common.profiling import install_profiler
+from common.resilience import ModelGuard, ModelUnavailable, generativeai_timeout, unavailable_response
+from common.search_index import SearchIndex
+
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "alanan")
+# Deadlines, retries and circuit breaker for the Gemini calls
+gemini = ModelGuard("alanan", generativeai_timeout)
+# 503 + Retry-After when Gemini is down or too slow
+app.register_error_handler(ModelUnavailable, unavailable_response)
+
+# Symptom search index, built once at startup
+disease_index = SearchIndex(diseases_data)
+# key_id lookups for the detail page
+disease_lookup = RecordLookup(diseases_data)
+# BM25/TF-IDF ranked matching, used when the form or query asks for rank=bm25
+ranking_engines = RankingEngines(diseases_data)
+
 # Pydantic model for disease data validation
 class Diagnosis(BaseModel):
     key_id: str
@@ -50,15 +73,18 @@ def home():
         if not symptom:
             return render_template("index.html", error="Please enter a symptom.")
 
-        matches = []
-        for disease in diseases_data:
-            word_synonyms = disease.get("word_synonyms", "").lower().split(";")
-            synonyms = disease.get("synonyms", [])
-            if isinstance(synonyms, str):
-                synonyms = synonyms.split(",")
+        ranking = requested_ranking(request.values)
+        if ranking != "match":
+            # Top k diseases by score, with the score and matched terms shown per row
+            ranked = ranking_engines.search(ranking, symptom, requested_top_k(request.values))
+            matches = [disease for disease, _, _ in ranked]
+            scores = {disease["key_id"]: (score, terms) for disease, score, terms in ranked}
+            return render_template("results.html", matches=matches, symptom=symptom, scores=scores)
 
-            if symptom in word_synonyms or any(symptom in syn.lower() for syn in synonyms):
-                matches.append(disease)
+        # Exact word_synonyms entry or substring of any synonym
+        match_ids = set(disease_index.lookup_ids(symptom, "word_synonyms"))
+        match_ids.update(disease_index.search_ids(symptom, fields=("synonyms",)))
+        matches = disease_index.get_records(sorted(match_ids))
 
         return render_template("results.html", matches=matches, symptom=symptom)
 
@@ -66,16 +92,17 @@ def home():
 
 @app.route("/diseases", methods=["GET"])
 def get_diseases():
-    return jsonify(diseases_data)
+    return export_response(diseases_data, request)
 
 @app.route("/disease/<disease_id>")
 def disease_details(disease_id):
-    disease = next((d for d in diseases_data if d["key_id"] == disease_id), None)
-    return render_template("disease.html", disease=disease) if disease else "Not Found"
+    disease = disease_lookup.get(disease_id)
+    return render_template("disease.html", disease=disease) if disease else ("Not Found", 404)
 
 @app.route('/chat', methods=['GET'])
 def get_chat():
-    response = client.generate_content(
+    response = gemini.call(
+        client.generate_content,
         contents=[
             "You are a disease diagnosing staff",
             "Create a basic diagnosis for a patient with the following symptoms: black skin spots, swelling, fever, vomiting, and headache.",
@@ -90,7 +117,8 @@ def get_diagnosis():
     data = request.get_json()
     symptoms = data.get("symptoms", "").lower()
     
-    response = client.generate_content(
+    response = gemini.call(
+        client.generate_content,
         contents=[
             "This is the existing data in JSON format: " + json.dumps(diseases_data),
             "Match the closest disease with the following symptoms: " + symptoms,
@@ -4,14 +4,35 @@ from google import genai
 from pydantic import BaseModel
 import json
 import os
+import sys
 import requests
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.admission import AdmissionControl
+from common.export import export_response
+from common.profiling import install_profiler
+from common.ranking import SymptomRanker, diagnose_with_shortlist
+from common.resilience import DEGRADED_HEADERS, ModelGuard, ModelUnavailable, degraded_results, genai_timeout, unavailable_response
+from common.search_index import SearchIndex
+from common.streaming import chunk_texts, sse_response, stream_text, wants_stream
+
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "azarcon")
+# Keep handlers free for local routes while model calls pile up
+admission = AdmissionControl(app, "azarcon", {"POST get_chat", "get_diagnosis"})
+# 503 + Retry-After for model calls without a local fallback
+app.register_error_handler(ModelUnavailable, unavailable_response)
 
 # Load diseases data
 with open(os.path.join(os.path.dirname(__file__), 'diseases.json')) as f:
     diseases = json.load(f)
 
+# Local ranker that picks the candidate records sent to Gemini
+disease_ranker = SymptomRanker(diseases)
+# Name and ICD-10 code index for /lookup
+lookup_index = SearchIndex(diseases, fields=("primary_name", "icd10cm_codes"))
+
 if os.getenv("RENDER") is None:  # 'RENDER' is set automatically on Render's environment
     load_dotenv()
 
@@ -21,6 +42,8 @@ if not api_key:
     raise ValueError("GEMINI_API_KEY is missing from environment variables.")
 
 client = genai.Client(api_key=api_key)
+# Deadlines, retries and circuit breaker for every Gemini call
+gemini = ModelGuard("azarcon", genai_timeout)
 
 
 class Diagnosis(BaseModel):
@@ -39,7 +62,7 @@ def index():
 
 @app.route('/diseases', methods=['GET'])
 def get_diseases():
-    return jsonify(diseases)
+    return export_response(diseases, request)
 
 @app.route('/match', methods=['POST'])
 def match_diseases():
@@ -59,15 +82,14 @@ def lookup_disease():
     print(f"Query: {query}")
     results = []
 
-    for disease in diseases:
-        if query in disease.get('primary_name', '').lower() or query in disease.get('icd10cm_codes', '').lower():
-            results.append({
-                'primary_name': disease.get('primary_name'),
-                'synonyms': disease.get('synonyms', []),
-                'info_links': disease.get('info_link_data', []),
-                'icd10cm_codes': disease.get('icd10cm_codes', ''),
-                'is_procedure': disease.get('is_procedure', False)
-            })
+    for disease in lookup_index.search(query):
+        results.append({
+            'primary_name': disease.get('primary_name'),
+            'synonyms': disease.get('synonyms', []),
+            'info_links': disease.get('info_link_data', []),
+            'icd10cm_codes': disease.get('icd10cm_codes', ''),
+            'is_procedure': disease.get('is_procedure', False)
+        })
 
     return jsonify(results)
 
@@ -76,14 +98,23 @@ def get_chat():
     diagnosis = None
     if request.method == 'POST':
         symptoms = request.form.get('symptoms', '').lower()
-        response = client.models.generate_content(
+        contents = [
+            "You are a disease diagnosing staff",
+            f"Create a basic diagnosis for a patient with the following symptoms: {symptoms}.",
+            "The patient has been experiencing the symptoms for a week already",
+            "Provide an accurate diagnosis"
+        ]
+        if wants_stream():
+            # Stream the diagnosis as Server-Sent Events while it is generated
+            def generate():
+                yield from chunk_texts(gemini.stream(
+                    client.models.generate_content_stream, model="gemini-2.0-flash", contents=contents
+                ))
+            return sse_response(stream_text(generate(), "Azarcon /chat"))
+        response = gemini.call(
+            client.models.generate_content,
             model="gemini-2.0-flash",
-            contents=[
-                "You are a disease diagnosing staff",
-                f"Create a basic diagnosis for a patient with the following symptoms: {symptoms}.",
-                "The patient has been experiencing the symptoms for a week already",
-                "Provide an accurate diagnosis"
-            ]
+            contents=contents
         )
         diagnosis = response.text
     return render_template('chat.html', diagnosis=diagnosis)
@@ -91,21 +122,31 @@ def get_chat():
 @app.route('/diagnosis', methods=['GET'])
 def get_diagnosis():
     symptoms = request.args.get('symptoms', '').lower()
-    response = client.models.generate_content(
-    model="gemini-2.0-flash",
-    contents=[
-    "This is the existing data in JSON format: " + json.dumps(diseases),
-    "Match the closest disease with following symptoms: " + symptoms,
-    "Include the info_link_data in the response.",
-    "Return the top three matching items with primary name, description, and possible remedies."
-    ],
-
-    config={
-    "response_mime_type": "application/json",
-    "response_schema": list[Diagnosis]
-    }
-    )
-    return jsonify(json.loads(response.text))
+
+    def ask(candidates):
+        response = gemini.call(
+        client.models.generate_content,
+        model="gemini-2.0-flash",
+        contents=[
+        "This is the existing data in JSON format: " + json.dumps(candidates),
+        "Match the closest disease with following symptoms: " + symptoms,
+        "Include the info_link_data in the response.",
+        "Return the top three matching items with primary name, description, and possible remedies."
+        ],
+
+        config={
+        "response_mime_type": "application/json",
+        "response_schema": list[Diagnosis]
+        }
+        )
+        return json.loads(response.text)
+
+    # Only the locally ranked shortlist goes into the prompt
+    try:
+        return jsonify(diagnose_with_shortlist(ask, disease_ranker, symptoms))
+    except ModelUnavailable:
+        # Model is down or too slow: answer from the local ranker instead
+        return jsonify(degraded_results(disease_ranker, symptoms)), 200, DEGRADED_HEADERS
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
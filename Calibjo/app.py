@@ -2,8 +2,18 @@ from flask import Flask, jsonify, render_template, request
 from dotenv import load_dotenv, dotenv_values
 from google import genai
 import json
+import os
+import sys
 from pydantic import BaseModel
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.admission import AdmissionControl
+from common.export import export_response
+from common.profiling import install_profiler
+from common.ranking import SymptomRanker, diagnose_with_shortlist
+from common.resilience import DEGRADED_HEADERS, ModelGuard, ModelUnavailable, degraded_results, genai_timeout, unavailable_response
+from common.structured import StructuredOutputError, StructuredParser
+
 class Diagnosis(BaseModel):
     key_id: str
     primary_name: str
@@ -17,8 +27,16 @@ load_dotenv()
 config = dotenv_values(".env")
 
 client = genai.Client(api_key=config['GEMINI_API_KEY'])
+# Deadlines, retries and circuit breaker for every Gemini call
+gemini = ModelGuard("calibjo", genai_timeout)
 
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "calibjo")
+# Keep handlers free for local routes while model calls pile up
+admission = AdmissionControl(app, "calibjo", {"get_chat", "get_diagnosis"})
+# 503 + Retry-After for model calls without a local fallback
+app.register_error_handler(ModelUnavailable, unavailable_response)
 
 diseases = []
 
@@ -26,17 +44,24 @@ diseases = []
 with open('diseases.json') as f:
     diseases = json.load(f)
 
+# Local ranker that picks the candidate records sent to Gemini
+disease_ranker = SymptomRanker(diseases)
+# Validates and repairs the list[Diagnosis] replies of /diagnosis
+diagnosis_parser = StructuredParser(list[Diagnosis])
+DIAGNOSIS_COUNT = 3
+
 @app.route("/")
 def home():
     return render_template("index.html")
 
 @app.route('/diseases', methods=['GET'])
 def get_diseases():
-    return jsonify(diseases)
+    return export_response(diseases, request)
 
 @app.route('/chat', methods=['GET'])
 def get_chat():
-    response = client.models.generate_content(
+    response = gemini.call(
+    client.models.generate_content,
     model="gemini-2.0-flash",
     contents=[
         "You a disease diagnosing staff",
@@ -49,19 +74,43 @@ def get_chat():
 @app.route('/diagnosis', methods=['GET'])
 def get_diagnosis():
     symptoms = request.args.get('symptoms', '').lower()
-    response = client.models.generate_content(
-    model="gemini-2.0-flash",
-    contents=[
-        "This is the existing data in JSON format: " + json.dumps(diseases),
-        "Match the closest disease with following symptoms: " + symptoms,
-        "Include the info_link_data in the response.",
-        "Return the top three matching items."
-    ],
-    config={
-        "response_mime_type": "application/json",
-         "response_schema": list[Diagnosis]
-    }
-)
+
+    def generate(candidates, instructions):
+        response = gemini.call(
+        client.models.generate_content,
+        model="gemini-2.0-flash",
+        contents=[
+            "This is the existing data in JSON format: " + json.dumps(candidates),
+            "Match the closest disease with following symptoms: " + symptoms,
+            "Include the info_link_data in the response.",
+            *instructions
+        ],
+        config={
+            "response_mime_type": "application/json",
+             "response_schema": list[Diagnosis]
+        }
+    )
+        return response.text
+
+    def ask(candidates):
+        def complete(have, missing):
+            # Only the items that were cut off or failed validation
+            return generate(candidates, [
+                "These items were already returned: " + json.dumps([item["key_id"] for item in have]),
+                f"Return only the next {missing} matching items."
+            ])
+
+        text = generate(candidates, ["Return the top three matching items."])
+        return diagnosis_parser.parse(text, complete, expected=DIAGNOSIS_COUNT)
+
+    # Only the locally ranked shortlist goes into the prompt
+    try:
+        return jsonify(diagnose_with_shortlist(ask, disease_ranker, symptoms))
+    except ModelUnavailable:
+        # Model is down or too slow: answer from the local ranker instead
+        return jsonify(degraded_results(disease_ranker, symptoms)), 200, DEGRADED_HEADERS
+    except StructuredOutputError as e:
+        return jsonify({"error": "Invalid response from AI", "raw_response": e.raw}), 500
 
 if __name__ == '__main__':
     app.run(debug=True)      
\ No newline at end of file
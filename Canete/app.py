@@ -1,11 +1,20 @@
 import os
+import sys
 from flask import Flask, jsonify, render_template, request
 from dotenv import load_dotenv, dotenv_values
 import json
-import re
 import google.generativeai as genai
 from pydantic import BaseModel
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.autocomplete import PrefixIndex, SuggestionEnricher, enrichment_enabled
+from common.context_cache import ContextCache, LegacyGenaiBackend
+from common.export import export_response
+from common.metrics import Metrics
+from common.profiling import install_profiler
+from common.resilience import ModelGuard, ModelUnavailable, context_cache_timeout, generativeai_timeout, unavailable_response
+from common.structured import StructuredOutputError, StructuredParser, repair_json
+
 class Diagnosis(BaseModel):
     key_id: str
     primary_name: str
@@ -14,6 +23,15 @@ class Diagnosis(BaseModel):
     synonyms: list[str]
     info_link_data: list[list[str]]
 
+# Shape of each /diagnosis item requested in DIAGNOSIS_DETAILS
+class DiagnosisDetails(BaseModel):
+    primary_name: str
+    description: str
+    causes: str | list[str]
+    effects: str | list[str]
+    remedies: str | list[str]
+    info_link_data: list
+
 # Load API key
 load_dotenv()
 config = dotenv_values(".env")
@@ -23,6 +41,11 @@ genai.configure(api_key=config['GEMINI_API_KEY'])
 
 # Initialize Flask app
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "canete")
+# Request and model call metrics, served at /metrics
+metrics = Metrics("canete")
+metrics.init_app(app)
 
 # Get the absolute path to the diseases.json file
 diseases_path = os.path.join(os.path.dirname(__file__), 'diseases.json')
@@ -43,48 +66,98 @@ except json.JSONDecodeError:
 with open(diseases_path) as f:
     diseases = json.load(f)
 
+# The disease list is uploaded once as Gemini cached content for /diagnosis.
+# Older google-generativeai releases have no caching API; the list is then
+# sent inline with every prompt as before.
+dataset_context = ContextCache(
+    LegacyGenaiBackend(genai),
+    'gemini-1.5-flash-latest',
+    [f"Here is a list of diseases and their details in JSON format: {json.dumps(diseases)}\n"],
+)
+metrics.register("context_cache", dataset_context.stats,
+                 {"hits": "cached_requests", "misses": "inline_requests",
+                  "created": "created", "refreshed": "refreshed", "failures": "failures"})
+# Deadlines, retries and circuit breaker for the Gemini calls
+gemini = ModelGuard("canete", context_cache_timeout)
+suggestions_gemini = ModelGuard("canete-suggestions", generativeai_timeout)
+metrics.register("circuit_breaker", gemini.breaker.stats, ("trips", "recent_calls"))
+diagnosis_call = metrics.wrap("diagnosis", dataset_context.generate_content)
+
+def generate_diagnosis(contents):
+    return gemini.call(diagnosis_call, contents)
+
+DIAGNOSIS_COUNT = 3
+DIAGNOSIS_DETAILS = (
+    "- primary_name: The name of the disease\n"
+    "- description: A brief overview of the disease\n"
+    "- causes: Common causes of the disease\n"
+    "- effects: How the disease affects a person\n"
+    "- remedies: Up to three effective treatments or home remedies\n"
+    "- info_link_data: A list containing a URL and the title for further reading\n"
+    "Return the response in valid JSON format without any additional text or markdown formatting."
+)
+diagnosis_parser = StructuredParser(list[DiagnosisDetails])
+
+# Local prefix index for /symptom-suggestions
+symptom_index = PrefixIndex(diseases)
+SUGGESTION_LIMIT = 10
+# Below this many local hits Gemini is asked for more in the background
+SUGGESTION_MIN_HITS = int(os.getenv("SYMPTOM_SUGGESTIONS_MIN_HITS", "3"))
+
+def fetch_ai_suggestions(query):
+    model = genai.GenerativeModel('gemini-1.5-flash-latest')  # Use a faster model
+    response = suggestions_gemini.call(
+        metrics.wrap("symptom_suggestions", model.generate_content),
+        f"Suggest possible symptoms based on the following input: {query}\n"
+        "Return a JSON array of symptom names without any additional text or markdown formatting."
+    )
+    # Fences, chatter and a cut-off tail are handled by the shared repair
+    suggestions, _ = repair_json(response.text)
+    if not isinstance(suggestions, list):
+        raise StructuredOutputError("Expected a JSON array of symptom names", response.text)
+    return [item for item in suggestions if isinstance(item, str)]
+
+suggestion_enricher = SuggestionEnricher(fetch_ai_suggestions)
+
 @app.route("/")
 def home():
     return render_template("index.html")
 
 @app.route('/diseases', methods=['GET'])
 def get_diseases():
-    return jsonify(diseases)
+    return export_response(diseases, request)
 
 @app.route('/diagnosis', methods=['GET'])
 def get_diagnosis():
     symptoms = request.args.get('symptoms', '').lower()
 
     try:
-        # Initialize the generative model
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')  
-
-        # Generate content
-        response = model.generate_content(
-            f"Here is a list of diseases and their details in JSON format: {json.dumps(diseases)}\n"
+        # Generate content against the cached disease list
+        response = generate_diagnosis([
             f"Based on the following symptoms: {symptoms}\n"
-            "Identify the top 3 most likely diseases and provide the following details for each:\n"
-            "- primary_name: The name of the disease\n"
-            "- description: A brief overview of the disease\n"
-            "- causes: Common causes of the disease\n"
-            "- effects: How the disease affects a person\n"
-            "- remedies: Up to three effective treatments or home remedies\n"
-            "- info_link_data: A list containing a URL and the title for further reading\n"
-            "Return the response in valid JSON format without any additional text or markdown formatting."
-        )
+            f"Identify the top {DIAGNOSIS_COUNT} most likely diseases and provide the following details for each:\n"
+            + DIAGNOSIS_DETAILS
+        ])
 
         raw_response = response.text
-        print("AI Raw Response:", raw_response)  # Debugging output
 
-        # Remove markdown code block formatting (```json ... ```)
-        cleaned_response = re.sub(r"```json\s*([\s\S]*?)\s*```", r"\1", raw_response).strip()
+        def complete(have, missing):
+            # Ask only for the diseases that were cut off or malformed
+            return generate_diagnosis([
+                f"Based on the following symptoms: {symptoms}\n"
+                f"These diseases were already identified: {json.dumps([item['primary_name'] for item in have])}\n"
+                f"Identify the next {missing} most likely diseases and provide the following details for each:\n"
+                + DIAGNOSIS_DETAILS
+            ]).text
 
         try:
-            diagnosis_data = json.loads(cleaned_response)
+            diagnosis_data = diagnosis_parser.parse(raw_response, complete, expected=DIAGNOSIS_COUNT)
             return jsonify(diagnosis_data)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Invalid response from AI", "raw_response": cleaned_response}), 500
+        except StructuredOutputError as e:
+            return jsonify({"error": "Invalid response from AI", "raw_response": e.raw}), 500
 
+    except ModelUnavailable:
+        return unavailable_response()
     except Exception as e:
         return jsonify({"error": f"Failed to generate response: {str(e)}"}), 500
 
@@ -92,30 +165,15 @@ def get_diagnosis():
 def get_symptom_suggestions():
     query = request.args.get('query', '').lower()
 
-    try:
-        # Initialize the generative model
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')  # Use a faster model
-
-        # Generate content
-        response = model.generate_content(
-            f"Suggest possible symptoms based on the following input: {query}\n"
-            "Return a JSON array of symptom names without any additional text or markdown formatting."
-        )
+    # Answered from the local index; Gemini never blocks this request
+    suggestions = symptom_index.suggest(query, SUGGESTION_LIMIT)
+    if len(suggestions) < SUGGESTION_MIN_HITS and enrichment_enabled():
+        # AI suggestions fetched for an earlier request with this query
+        for symptom in suggestion_enricher.lookup(query):
+            if symptom not in suggestions:
+                suggestions.append(symptom)
 
-        raw_response = response.text
-        print("AI Raw Response:", raw_response)  # Debugging output
-
-        # Remove markdown code block formatting (```json ... ```)
-        cleaned_response = re.sub(r"```json\s*([\s\S]*?)\s*```", r"\1", raw_response).strip()
-
-        try:
-            suggestions = json.loads(cleaned_response)
-            return jsonify(suggestions)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Invalid response from AI", "raw_response": cleaned_response}), 500
-
-    except Exception as e:
-        return jsonify({"error": f"Failed to generate response: {str(e)}"}), 500
+    return jsonify(suggestions[:SUGGESTION_LIMIT])
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
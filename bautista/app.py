@@ -5,7 +5,18 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from pydantic import BaseModel
 import os
-
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.admission import AdmissionControl
+from common.bm25 import RankingEngines, requested_ranking, requested_top_k
+from common.export import export_response
+from common.lookup import RecordLookup
+from common.profiling import install_profiler
+from common.ranking import SymptomRanker, diagnose_with_shortlist
+from common.resilience import DEGRADED_HEADERS, ModelGuard, ModelUnavailable, degraded_results, generativeai_timeout, unavailable_response
+from common.structured import StructuredOutputError, StructuredParser
+from common.streaming import chunk_texts, sse_response, stream_text, wants_stream
 
 # Load environment variables
 load_dotenv()
@@ -14,12 +25,27 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # Configure Google Gemini API
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel("gemini-2.0-flash")
+# Deadlines, retries and circuit breaker for every Gemini call
+gemini = ModelGuard("bautista", generativeai_timeout)
 
 # Load disease dataset
 with open("diseases.json") as f:
     diseases = json.load(f)
 
+# Local ranker that picks the candidate records sent to Gemini
+disease_ranker = SymptomRanker(diseases)
+# Exact name and synonym lookups for the detail page
+disease_lookup = RecordLookup(diseases)
+# BM25/TF-IDF ranked matching, used for /diagnose?rank=bm25
+ranking_engines = RankingEngines(diseases)
+
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "bautista")
+# Keep handlers free for local routes while model calls pile up
+admission = AdmissionControl(app, "bautista", {"POST get_chat", "diagnosis"})
+# 503 + Retry-After for model calls without a local fallback
+app.register_error_handler(ModelUnavailable, unavailable_response)
 CORS(app)
 
 class Diagnosis(BaseModel):
@@ -30,6 +56,10 @@ class Diagnosis(BaseModel):
     synonyms: list[str]
     info_link_data: list[list[str]]
 
+# Validates and repairs the list[Diagnosis] replies of /diagnosis
+diagnosis_parser = StructuredParser(list[Diagnosis])
+DIAGNOSIS_COUNT = 3
+
 @app.route("/")
 def home():
     """Render the home page."""
@@ -38,18 +68,13 @@ def home():
 @app.route("/diseases", methods=["GET"])
 def get_diseases():
     """Returns all diseases in the dataset."""
-    return jsonify(diseases)
+    return export_response(diseases, request)
 
 @app.route("/disease/<string:name>")
 def disease_detail(name):
     """Render the disease detail page."""
-    name_lower = name.lower()
-    disease = next(
-        (disease for disease in diseases if
-         disease["primary_name"].lower() == name_lower or
-         any(syn.lower() == name_lower for syn in disease.get("synonyms", []))),
-        None
-    )
+    matches = disease_lookup.name(name)
+    disease = matches[0] if matches else None
 
     if disease:
         return render_template("disease_detail.html", disease=disease)
@@ -65,6 +90,17 @@ def diagnose():
     if not symptoms:
         return jsonify({"error": "Please provide symptoms as a query parameter"}), 400
 
+    ranking = requested_ranking(request.args)
+    if ranking != "match":
+        # Top k diseases ranked by BM25/TF-IDF score, e.g. /diagnose?symptoms=fever,headache&rank=bm25
+        possible_diseases = [
+            {"name": disease["primary_name"], "score": score, "matched_terms": terms}
+            for disease, score, terms in ranking_engines.search(ranking, symptoms, requested_top_k(request.args))
+        ]
+        if not possible_diseases:
+            return jsonify({"possible_diseases": [], "message": "No matching diseases found. Try different symptoms."})
+        return jsonify({"possible_diseases": possible_diseases})
+
     symptoms_list = [s.strip().lower() for s in symptoms.split(",")]
     possible_diseases = []
 
@@ -93,14 +129,18 @@ def get_chat():
     diagnosis = None
     if request.method == 'POST':
         symptoms = request.form.get('symptoms', '').lower()
-        response = model.generate_content(
-            contents=[
-                f"You are a disease diagnosing staff.",
-                f"Create a basic diagnosis for a patient with the following symptoms: {symptoms}.",
-                "The patient has been experiencing the symptoms for a week already.",
-                "Provide an accurate diagnosis."
-            ]
-        )
+        contents = [
+            f"You are a disease diagnosing staff.",
+            f"Create a basic diagnosis for a patient with the following symptoms: {symptoms}.",
+            "The patient has been experiencing the symptoms for a week already.",
+            "Provide an accurate diagnosis."
+        ]
+        if wants_stream():
+            # Stream the diagnosis as Server-Sent Events while it is generated
+            def generate():
+                yield from chunk_texts(gemini.stream(model.generate_content, contents=contents, stream=True))
+            return sse_response(stream_text(generate(), "bautista /chat"))
+        response = gemini.call(model.generate_content, contents=contents)
         
         # Extract only the 'text' field from the response
         if hasattr(response, 'text'):
@@ -112,19 +152,39 @@ def get_chat():
 def diagnosis():
     # Returns the top three matching diseases based on the symptoms
     symptoms = request.get_json()["symptoms"]
-    response = client.models.generate_content(
-    model="gemini-2.0-flash", 
-    contents=[
-        "This is the existing data in JSON format: " + json.dumps(diseases),
-        "Match the closest disease with following symptoms: " + symptoms,
-        "Include the info_link_data in the response.",
-        "Return the top three matching items."],
-    config = {
-        "response_mime_type": "application/json",
-        "response_schema": list[Diagnosis]},
-    )
-    
-    return json.loads(response.text)
+
+    def generate(candidates, instructions):
+        response = gemini.call(
+        model.generate_content,
+        contents=[
+            "This is the existing data in JSON format: " + json.dumps(candidates),
+            "Match the closest disease with following symptoms: " + symptoms,
+            "Include the info_link_data in the response.",
+            *instructions],
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": list[Diagnosis]},
+        )
+        return response.text
+
+    def ask(candidates):
+        def complete(have, missing):
+            # Only the items that were cut off or failed validation
+            return generate(candidates, [
+                "These items were already returned: " + json.dumps([item["key_id"] for item in have]),
+                f"Return only the next {missing} matching items."])
+
+        text = generate(candidates, ["Return the top three matching items."])
+        return diagnosis_parser.parse(text, complete, expected=DIAGNOSIS_COUNT)
+
+    # Only the locally ranked shortlist goes into the prompt
+    try:
+        return jsonify(diagnose_with_shortlist(ask, disease_ranker, symptoms))
+    except ModelUnavailable:
+        # Model is down or too slow: answer from the local ranker instead
+        return jsonify(degraded_results(disease_ranker, symptoms)), 200, DEGRADED_HEADERS
+    except StructuredOutputError as e:
+        return jsonify({"error": "Invalid response from AI", "raw_response": e.raw}), 500
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,275 @@
+"""Microbenchmarks for the search and match implementations behind the apps.
+
+Every matcher is built over diseases.json and over synthetic expansions of
+it. Each copy beyond the first gets a new key_id and a numbered name
+("Asthma type 7"), so names stay unique and the vocabulary grows with the
+data. Then a fixed query corpus is run against each one, and the suite
+reports:
+
+- build time;
+- p50/p99/mean latency per query;
+- peak bytes allocated per query (tracemalloc, measured in a separate
+  pass so it does not skew the timings).
+
+Results are written as JSON so runs can be diffed:
+
+    python benchmarks/bench_matchers.py                       # 1x, 10x, 100x
+    python benchmarks/bench_matchers.py --scales 1,10 --matchers bm25,fulltext
+    python benchmarks/bench_matchers.py --compare benchmarks/results/old.json
+
+Matchers whose index would not fit a scale (see ``MAX_SCALE``) are
+recorded as skipped instead of run.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from common.autocomplete import PrefixIndex
+from common.bitmap import BitmapIndex
+from common.bm25 import BM25Index
+from common.fulltext import FullTextIndex
+from common.fuzzy import FuzzyIndex
+from common.lookup import RecordLookup
+from common.ranking import SymptomRanker
+from common.search_index import SearchIndex
+from common.slugs import SlugIndex
+
+DEFAULT_DATASET = os.path.join(ROOT, "valencia", "diseases.json")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_SCALES = (1, 10, 100)
+# Seconds spent timing one matcher at one scale, at least one run per query
+DEFAULT_BUDGET = 2.0
+# Ratio above which --compare flags a latency regression
+REGRESSION_RATIO = 1.2
+
+SYMPTOM_QUERIES = [
+    "fever", "headache", "nausea, vomiting", "stiff neck", "chest pain",
+    "shortness of breath", "rash", "abdominal pain", "cough, fever",
+    "joint pain swelling", "blurred vision", "fatigue", "vomit", "xylophone", "a",
+]
+NAME_QUERIES = [
+    "diabetes", "asthma", "meningitis", "pneumonia", "hepatitis b", "heart attack",
+    "flu", "migrane", "tuberclosis", "astma", "zzzz",
+]
+BOOLEAN_QUERIES = [
+    "fever AND rash", "headache OR migraine", "pain AND NOT chronic",
+    "(cough OR wheeze) AND fever", '"stiff neck"', "vomiting NOT (fever OR rash)",
+]
+SLUG_QUERIES = [
+    "Asthma", "Meningitis-fungal", "diabetes", "Heart.*attack", "(a+)+$", "no-such-disease",
+]
+PREFIX_QUERIES = ["fe", "hea", "nau", "sto", "ch", "br", "swel", "x"]
+
+
+def linear_match(records, symptoms):
+    """The inline loop of duhina and malatuba /diagnosis (ranking=match)."""
+    symptom_list = [symptom.strip() for symptom in symptoms.lower().split(",")]
+    results = []
+    for disease in records:
+        word_synonyms = disease.get("word_synonyms", "").lower()
+        synonyms = [synonym.lower() for synonym in disease.get("synonyms", [])]
+        if any(symptom in word_synonyms or symptom in synonyms for symptom in symptom_list):
+            results.append(disease)
+    return results
+
+
+# name -> (routes using it, build(records), run(index, query), query corpus)
+MATCHERS = {
+    "linear_scan": ("duhina, malatuba /diagnosis (ranking=match)",
+                    lambda records: records, linear_match, SYMPTOM_QUERIES),
+    "search_index": ("togonon find_matching_diseases, valencia /search, Azarcon /lookup",
+                     SearchIndex,
+                     lambda index, q: index.search(q, fields=("word_synonyms", "synonyms")),
+                     SYMPTOM_QUERIES),
+    "search_page": ("valencia, trojillo, navarra /search (top 50)",
+                    SearchIndex, lambda index, q: index.search_page(q, 50), SYMPTOM_QUERIES),
+    "symptom_ranker": ("diagnosis shortlists (valencia, sapasap, Calibjo, ...)",
+                       SymptomRanker, lambda index, q: index.rank(q), SYMPTOM_QUERIES),
+    "bm25": ("duhina, malatuba, bautista, Alanan ?rank=bm25",
+             lambda records: BM25Index(records, scheme="bm25"),
+             lambda index, q: index.search(q, 20), SYMPTOM_QUERIES),
+    "tfidf": ("duhina, malatuba, bautista, Alanan ?rank=tfidf",
+              lambda records: BM25Index(records, scheme="tfidf"),
+              lambda index, q: index.search(q, 20), SYMPTOM_QUERIES),
+    "bitmap_any": ("biaca find_matching_diseases (symptom list)",
+                   BitmapIndex,
+                   lambda index, q: index.get_records(index.any_of(q.split(","))),
+                   SYMPTOM_QUERIES),
+    "bitmap_query": ("biaca find_matching_diseases (boolean query)",
+                     BitmapIndex, lambda index, q: index.get_records(index.query(q)),
+                     BOOLEAN_QUERIES),
+    "fulltext": ("delrosario index()",
+                 FullTextIndex, lambda index, q: index.search(q), SYMPTOM_QUERIES + NAME_QUERIES),
+    "fuzzy": ("trojillo /search?fuzzy=1",
+              FuzzyIndex, lambda index, q: index.search(q), NAME_QUERIES),
+    "slugs": ("dalisay disease(), procedure()",
+              SlugIndex, lambda index, q: index.find(q), SLUG_QUERIES),
+    "prefix": ("Canete /symptom-suggestions",
+               PrefixIndex, lambda index, q: index.suggest(q), PREFIX_QUERIES),
+    "lookup_name": ("navarra, sapasap, gasis detail pages",
+                    RecordLookup, lambda index, q: index.name(q), NAME_QUERIES),
+}
+
+# Largest scale each matcher is built at; its index grows faster than the data
+MAX_SCALE = {
+    "bitmap_any": 10,    # one record-count-wide bitset per distinct attribute value
+    "bitmap_query": 10,
+    "fulltext": 10,      # 1- to 3-gram postings over every field
+}
+
+
+def expand(records, scale):
+    """``records`` repeated ``scale`` times, copies renamed so names and ids stay unique."""
+    expanded = list(records)
+    for copy in range(1, scale):
+        for record in records:
+            record = dict(record)
+            record["key_id"] = f"{record['key_id']}-x{copy}"
+            record["primary_name"] = f"{record['primary_name']} type {copy}"
+            expanded.append(record)
+    return expanded
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench(name, records, budget):
+    """Build one matcher over ``records`` and time its query corpus.
+
+    Diagnostics the matchers print (e.g. a slug search hitting its budget)
+    go to devnull, as they would to a log, instead of cluttering the table.
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _bench(name, records, budget)
+
+
+def _bench(name, records, budget):
+    _, build, run, queries = MATCHERS[name]
+    started = time.perf_counter()
+    index = build(records)
+    build_seconds = time.perf_counter() - started
+
+    samples = []
+    deadline = time.perf_counter() + budget
+    while True:
+        for query in queries:
+            started = time.perf_counter_ns()
+            run(index, query)
+            samples.append((time.perf_counter_ns() - started) / 1e6)
+        if time.perf_counter() >= deadline:
+            break
+
+    allocations = []
+    tracemalloc.start()
+    for query in queries:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        run(index, query)
+        allocations.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        "build_seconds": round(build_seconds, 4),
+        "queries": len(queries),
+        "samples": len(samples),
+        "p50_ms": round(percentile(samples, 0.50), 4),
+        "p99_ms": round(percentile(samples, 0.99), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "alloc_peak_p50_bytes": int(percentile(allocations, 0.50)),
+        "alloc_peak_max_bytes": int(max(allocations)),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the latency ratio to a previous run for every matcher/scale in both."""
+    with open(baseline_path) as f:
+        baseline = {(entry["matcher"], entry["scale"]): entry for entry in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for entry in results:
+        old = baseline.get((entry["matcher"], entry["scale"]))
+        if not old or "p50_ms" not in old or "p50_ms" not in entry:
+            continue
+        ratios = [entry[key] / old[key] if old[key] else 1.0 for key in ("p50_ms", "p99_ms")]
+        flag = "  REGRESSION" if max(ratios) > REGRESSION_RATIO else ""
+        print(f"  {entry['matcher']:<15} {entry['scale']:>4}x  p50 x{ratios[0]:.2f}  p99 x{ratios[1]:.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                        help="comma separated multiples of the dataset (default 1,10,100)")
+    parser.add_argument("--matchers", default=",".join(MATCHERS),
+                        help="comma separated subset of: " + ", ".join(MATCHERS))
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help="seconds of timing per matcher and scale")
+    parser.add_argument("--output", help="JSON file for the results (default benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.matchers.split(",") if name.strip()]
+    unknown = [name for name in names if name not in MATCHERS]
+    if unknown:
+        parser.error(f"unknown matchers: {', '.join(unknown)}")
+    scales = [int(scale) for scale in args.scales.split(",")]
+
+    with open(args.dataset, encoding="utf-8") as f:
+        base = json.load(f)
+
+    results = []
+    print(f"{'matcher':<15} {'scale':>5} {'records':>8} {'build s':>8} {'p50 ms':>9} {'p99 ms':>9} {'alloc p50':>10}")
+    for scale in scales:
+        records = expand(base, scale)
+        for name in names:
+            entry = {"matcher": name, "used_by": MATCHERS[name][0], "scale": scale, "records": len(records)}
+            if scale > MAX_SCALE.get(name, scale):
+                entry["skipped"] = f"index too large above {MAX_SCALE[name]}x"
+                print(f"{name:<15} {scale:>4}x {len(records):>8}  skipped ({entry['skipped']})")
+            else:
+                entry.update(bench(name, records, args.budget))
+                print(f"{name:<15} {scale:>4}x {len(records):>8} {entry['build_seconds']:>8.2f} "
+                      f"{entry['p50_ms']:>9.3f} {entry['p99_ms']:>9.3f} {entry['alloc_peak_p50_bytes']:>10}")
+            results.append(entry)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "dataset": os.path.relpath(args.dataset, ROOT),
+                "dataset_records": len(base),
+                "budget_seconds": args.budget,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
 from flask import Flask, jsonify, request, render_template
 import json
-import re
+import os
+import sys
 from chat import chat_bp   
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.admission import AdmissionControl
+from common.bitmap import BitmapIndex, QueryError
+from common.profiling import install_profiler
+
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "biaca")
 
 # Register Blueprint for chatbot
 app.register_blueprint(chat_bp, url_prefix='/chat')
+# Keep handlers free for local routes while model calls pile up
+admission = AdmissionControl(app, "biaca", {"chat.chat_message", "chat.get_diagnosis"})
 
 # Load diseases data safely
 try:
@@ -15,6 +25,9 @@ try:
 except FileNotFoundError:
     diseases_list = []
 
+# Symptom term -> record bitmap index for /diagnose
+disease_bitmaps = BitmapIndex(diseases_list)
+
 @app.route('/')
 def home():
     """Render the homepage."""
@@ -25,55 +38,48 @@ def chat_page():
     """Render the chatbot interface."""
     return render_template('chat.html')
 
-# Function to find matching diseases based on symptoms
-def find_matching_diseases(selected_symptoms):
-    matching_diseases = []
-
-    for disease in diseases_list:
-        searchable_attributes = set()
-
-        if disease.get('primary_name'):
-            searchable_attributes.add(disease['primary_name'].lower())
-
-        if disease.get('word_synonyms'):
-            searchable_attributes.update(disease['word_synonyms'].lower().split(';'))
-
-        if disease.get('synonyms'):
-            searchable_attributes.update([syn.lower() for syn in disease['synonyms']])
-
-        if disease.get('icd10cm'):
-            searchable_attributes.update([code['code'].lower() for code in disease['icd10cm']])
-
-        if disease.get('term_icd9_text'):
-            searchable_attributes.add(disease['term_icd9_text'].lower())
-
-        # Check if any symptom matches
-        for symptom in selected_symptoms:
-            symptom_lower = symptom.lower()
-            if any(re.search(re.escape(symptom_lower), attr) for attr in searchable_attributes):
-                matching_diseases.append({
-                    'disease_name': disease['primary_name'],
-                    'icd_code': ', '.join(d['code'] for d in disease.get('icd10cm', [])),
-                    'link': disease['info_link_data'][0][0] if disease.get('info_link_data') else None
-                })
-                break  # Stop after the first match to prevent duplicates
-
-    return matching_diseases
+# Function to find matching diseases based on symptoms and/or a boolean query
+def find_matching_diseases(selected_symptoms, query=None):
+    matches = disease_bitmaps.all if query else 0
+    if selected_symptoms:
+        # A disease matches when any symptom is part of one of its attributes
+        matches = disease_bitmaps.any_of(selected_symptoms)
+    if query:
+        # e.g. "fever AND rash NOT fungal"
+        matches &= disease_bitmaps.query(query)
+
+    return [{
+        'disease_name': disease['primary_name'],
+        'icd_code': ', '.join(d['code'] for d in disease.get('icd10cm', [])),
+        'link': disease['info_link_data'][0][0] if disease.get('info_link_data') else None
+    } for disease in disease_bitmaps.get_records(matches)]
 
 @app.route('/diagnose', methods=['POST'])
 def diagnose():
     """Diagnose diseases based on provided symptoms."""
-    data = request.json
-    selected_symptoms = data.get('symptoms', [])
-    other_symptom = data.get('other_symptom', '').strip()
-
-    if not selected_symptoms and not other_symptom:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    selected_symptoms = data.get('symptoms') or []
+    other_symptom = data.get('other_symptom') or ''
+    query = data.get('query') or ''
+    if not isinstance(selected_symptoms, list) or not all(isinstance(symptom, str) for symptom in selected_symptoms):
+        return jsonify({'error': 'symptoms must be a list of strings'}), 400
+    if not isinstance(other_symptom, str) or not isinstance(query, str):
+        return jsonify({'error': 'other_symptom and query must be strings'}), 400
+    other_symptom = other_symptom.strip()
+    query = query.strip()
+
+    if not selected_symptoms and not other_symptom and not query:
         return jsonify({'error': 'No symptoms provided'}), 400
 
     if other_symptom:
         selected_symptoms.append(other_symptom)
 
-    matching_diseases = find_matching_diseases(selected_symptoms)
+    try:
+        matching_diseases = find_matching_diseases(selected_symptoms, query)
+    except QueryError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
 
     if matching_diseases:
         return jsonify(matching_diseases)
@@ -3,10 +3,19 @@ from dotenv import load_dotenv
 import google.generativeai as genai
 import json
 import os  
+import sys
 from pydantic import BaseModel
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.context_cache import ContextCache, LegacyGenaiBackend
+from common.resilience import ModelGuard, ModelUnavailable, context_cache_timeout, unavailable_response
+from common.streaming import chunk_texts, sse_response, stream_text, wants_stream
+from common.export import export_response
+
 # Define the Blueprint
 chat_bp = Blueprint('chat', __name__)
+# 503 + Retry-After when Gemini is down or too slow
+chat_bp.register_error_handler(ModelUnavailable, unavailable_response)
 
 # Pydantic model for structured diagnosis data
 class Diagnosis(BaseModel):
@@ -37,10 +46,20 @@ try:
 except FileNotFoundError:
     diseases = []
 
+# The disease data is the same for every prompt, so it is uploaded once as
+# Gemini cached content and each request only sends its own question
+dataset_context = ContextCache(
+    LegacyGenaiBackend(genai),
+    "gemini-2.0-flash",
+    [f"This is the existing data in JSON format: {json.dumps(diseases)}"],
+)
+# Deadlines, retries and circuit breaker for the Gemini calls
+gemini = ModelGuard("biaca", context_cache_timeout)
+
 @chat_bp.route("/diseases", methods=['GET'])
 def get_diseases():
     """Returns the list of diseases from the JSON file."""
-    return jsonify(diseases)
+    return export_response(diseases, request)
 
 @chat_bp.route("/message", methods=['POST'])
 def chat_message():
@@ -50,12 +69,18 @@ def chat_message():
     if not user_input:
         return jsonify({"error": "Message cannot be empty"}), 400
 
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    response = model.generate_content([
-        f"You are a medical assistant. Use the following disease data to answer user questions:",
-        json.dumps(diseases),  
+    contents = [
+        f"You are a medical assistant. Use the disease data above to answer user questions.",
         f"User query: {user_input}. If relevant, reference the diseases.json data for an accurate response."
-    ])
+    ]
+
+    if wants_stream():
+        # Stream the reply as Server-Sent Events while it is generated
+        def generate():
+            yield from chunk_texts(gemini.stream(dataset_context.generate_content, contents, stream=True))
+        return sse_response(stream_text(generate(), "biaca /chat/message"))
+
+    response = gemini.call(dataset_context.generate_content, contents)
 
     reply = response.text if hasattr(response, 'text') else response.candidates[0].content
     return jsonify({"reply": reply})
@@ -69,9 +94,7 @@ def get_diagnosis():
     if not symptoms:
         return jsonify({"error": "Symptoms parameter is required"}), 400
 
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    response = model.generate_content([
-        f"This is the existing data in JSON format: {json.dumps(diseases)}",
+    response = gemini.call(dataset_context.generate_content, [
         f"Match the closest disease with the following symptoms: {symptoms}",
         "Include the info_link_data in the response.",
         "Return the top three matching items in valid JSON format."
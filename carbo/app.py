@@ -1,9 +1,18 @@
 import os
+import sys
 from flask import Flask, jsonify, render_template_string, request
 from dotenv import load_dotenv
 import json
-import re
 import google.generativeai as genai
+from pydantic import BaseModel
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.context_cache import ContextCache, LegacyGenaiBackend
+from common.export import export_response
+from common.metrics import Metrics
+from common.profiling import install_profiler
+from common.resilience import ModelGuard, ModelUnavailable, context_cache_timeout, unavailable_response
+from common.structured import StructuredOutputError, StructuredParser
 
 # Load API key from .env file
 load_dotenv()
@@ -14,6 +23,11 @@ genai.configure(api_key=api_key)
 
 # Initialize Flask app
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "carbo")
+# Request and model call metrics, served at /metrics
+metrics = Metrics("carbo")
+metrics.init_app(app)
 
 # Load diseases data from JSON file
 try:
@@ -26,6 +40,41 @@ try:
 except (json.JSONDecodeError, ValueError) as e:
     diseases_data = {"error": str(e)}
 
+# Upload the disease list once as Gemini cached content instead of sending it
+# with every /diagnose prompt
+dataset_context = ContextCache(
+    LegacyGenaiBackend(genai),
+    'gemini-1.5-flash-latest',
+    [f"This is a list of diseases and their details in JSON format: {json.dumps(diseases_data)}\n"],
+)
+metrics.register("context_cache", dataset_context.stats,
+                 {"hits": "cached_requests", "misses": "inline_requests",
+                  "created": "created", "refreshed": "refreshed", "failures": "failures"})
+# Deadlines, retries and circuit breaker for the Gemini calls
+gemini = ModelGuard("carbo", context_cache_timeout)
+metrics.register("circuit_breaker", gemini.breaker.stats, ("trips", "recent_calls"))
+diagnosis_call = metrics.wrap("diagnosis", dataset_context.generate_content)
+
+def generate_diagnosis(contents):
+    return gemini.call(diagnosis_call, contents)
+
+# Shape of each /diagnose item requested in DIAGNOSIS_DETAILS
+class DiagnosisResult(BaseModel):
+    primary_name: str
+    description: str
+    info_link_data: list
+    doctor_response: str
+
+DIAGNOSIS_COUNT = 3
+DIAGNOSIS_DETAILS = (
+    "- primary_name: The name of the disease\n"
+    "- description: A brief overview of the disease\n"
+    "- info_link_data: A list containing a URL and the title for further reading\n"
+    "- doctor_response: Advice from a doctor on what the patient should do next\n"
+    "Return the response in valid JSON format without any additional text or markdown formatting."
+)
+diagnosis_parser = StructuredParser(list[DiagnosisResult])
+
 @app.route('/')
 def home():
     with open('index.html') as f:
@@ -34,41 +83,39 @@ def home():
 
 @app.route('/diseases', methods=['GET'])
 def list_diseases():
-    return jsonify(diseases_data)
+    return export_response(diseases_data, request)
 
 @app.route('/diagnose', methods=['GET'])
 def diagnose():
     symptoms = request.args.get('symptoms', '').lower()
 
     try:
-        # Initialize the generative model
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-
-        # Generate content
-        response = model.generate_content(
-            f"This is a list of diseases and their details in JSON format: {json.dumps(diseases_data)}\n"
+        # Generate content against the cached disease list
+        response = generate_diagnosis([
             f"Considering the following symptoms: {symptoms}\n"
-            "Identify and choose the top 3 most likely diseases and provide the following details for each:\n"
-            "- primary_name: The name of the disease\n"
-            "- description: A brief overview of the disease\n"
-            "- info_link_data: A list containing a URL and the title for further reading\n"
-            "- doctor_response: Advice from a doctor on what the patient should do next\n"
-            "Return the response in valid JSON format without any additional text or markdown formatting."
-        )
+            f"Identify and choose the top {DIAGNOSIS_COUNT} most likely diseases and provide the following details for each:\n"
+            + DIAGNOSIS_DETAILS
+        ])
 
         raw_response = response.text
-        print("AI Raw Response:", raw_response)  # Debugging output
 
-        # Clean the response
-        cleaned_response = re.sub(r"```json\s*([\s\S]*?)\s*```", r"\1", raw_response).strip()
+        def complete(have, missing):
+            # Ask only for the diseases that were cut off or malformed
+            return generate_diagnosis([
+                f"Considering the following symptoms: {symptoms}\n"
+                f"These diseases were already chosen: {json.dumps([item['primary_name'] for item in have])}\n"
+                f"Identify and choose the next {missing} most likely diseases and provide the following details for each:\n"
+                + DIAGNOSIS_DETAILS
+            ]).text
 
         try:
-            diagnosis_results = json.loads(cleaned_response)
-            print("Diagnosis Results:", diagnosis_results)  # Debugging output
+            diagnosis_results = diagnosis_parser.parse(raw_response, complete, expected=DIAGNOSIS_COUNT)
             return jsonify(diagnosis_results)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Invalid response from AI", "raw_response": cleaned_response}), 500
+        except StructuredOutputError as e:
+            return jsonify({"error": "Invalid response from AI", "raw_response": e.raw}), 500
 
+    except ModelUnavailable:
+        return unavailable_response()
     except Exception as e:
         return jsonify({"error": f"Failed to generate response: {str(e)}"}), 500
 
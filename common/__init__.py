@@ -0,0 +1,5 @@
+"""Helpers shared by the student apps for working with diseases.json.
+
+Each app adds the repository root to ``sys.path`` and imports from here, e.g.
+``from common.search_index import SearchIndex``.
+"""
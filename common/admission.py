@@ -0,0 +1,226 @@
+"""Admission control that keeps cheap routes responsive while model calls pile up.
+
+Every request is classed as ``model`` (endpoints that call Gemini) or
+``local`` (search, detail pages, static pages). Each class has a limit on
+concurrent requests and a bounded wait queue:
+
+- A request that finds a free slot runs at once.
+- Otherwise it waits in the queue for up to ADMISSION_WAIT seconds.
+- If the queue is full, or the wait runs out, it is answered at once with
+  503 and a ``Retry-After`` header.
+
+The model class gets ``capacity - reserved`` handlers, so at least
+``reserved`` are always left for local routes. A queued request holds a
+handler while it waits, so the model queue is carved out of that share:
+``capacity - reserved - queue`` model requests run, ``queue`` wait. Local
+routes can use the full ``capacity``.
+
+A slot is held until the response has been sent, including the body of
+a streamed (SSE) response, not just until the view returns.
+
+Slots are ``flock``-ed lock files under ADMISSION_DIR/<app>, so the
+limits apply across all gunicorn workers of one app, and a crashed worker
+frees its slots. Without ``fcntl`` (Windows) they are per process.
+
+Limits can be set per app through keyword arguments or environment
+variables:
+
+- ADMISSION_CAPACITY: concurrent request handlers, i.e. workers x threads.
+  Defaults to WEB_CONCURRENCY, then 4.
+- ADMISSION_RESERVED: handlers kept for local routes.
+- ADMISSION_QUEUE: waiting model requests, taken from the model share.
+  Defaults to 0, i.e. shed at once, which suits sync workers; with
+  threaded or async workers a small queue smooths out bursts.
+- ADMISSION_WAIT: longest wait in the queue, in seconds.
+- ADMISSION_RETRY_AFTER: value of the Retry-After header.
+"""
+import functools
+import os
+import random
+import tempfile
+import threading
+import time
+
+from flask import g, jsonify, request
+
+try:
+    import fcntl
+except ImportError:  # Windows: per-process limits only
+    fcntl = None
+
+LOCK_DIR = os.getenv("ADMISSION_DIR", os.path.join(tempfile.gettempdir(), "admission"))
+DEFAULT_CAPACITY = int(os.getenv("ADMISSION_CAPACITY") or os.getenv("WEB_CONCURRENCY") or "4")
+DEFAULT_RESERVED = os.getenv("ADMISSION_RESERVED")
+DEFAULT_QUEUE = os.getenv("ADMISSION_QUEUE")
+DEFAULT_WAIT = float(os.getenv("ADMISSION_WAIT", "5"))
+DEFAULT_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+POLL_INTERVAL = 0.02
+
+MODEL = "model"
+LOCAL = "local"
+
+
+class _FileSlots:
+    """``size`` slots shared by every process that uses the same directory and name."""
+
+    def __init__(self, directory, name, size):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f"{name}-{i}.lock") for i in range(size)]
+
+    def try_acquire(self):
+        # Random start spreads workers over the slots instead of all probing slot 0
+        start = random.randrange(len(self.paths)) if self.paths else 0
+        for path in self.paths[start:] + self.paths[:start]:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def release(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class _ThreadSlots:
+    """In-process stand-in for ``_FileSlots``."""
+
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.used >= self.size:
+                return None
+            self.used += 1
+            return True
+
+    def release(self, token):
+        with self._lock:
+            self.used -= 1
+
+
+class RouteClass:
+    """Concurrency limit plus bounded wait queue for one class of routes."""
+
+    def __init__(self, name, limit, queue, wait, lock_dir):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        if lock_dir and fcntl:
+            self._running = _FileSlots(lock_dir, f"{name}-run", limit)
+            self._waiting = _FileSlots(lock_dir, f"{name}-wait", queue)
+        else:
+            self._running = _ThreadSlots(limit)
+            self._waiting = _ThreadSlots(queue)
+        self._lock = threading.Lock()
+        self.counts = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "in_flight": 0}
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self.counts[key] += delta
+
+    def acquire(self):
+        """A slot token, or None when the request should be shed."""
+        token = self._running.try_acquire()
+        if token is None:
+            ticket = self._waiting.try_acquire()
+            if ticket is None:
+                self._count("rejected")
+                return None
+            self._count("queued")
+            deadline = time.monotonic() + self.wait
+            try:
+                while token is None and time.monotonic() < deadline:
+                    time.sleep(POLL_INTERVAL)
+                    token = self._running.try_acquire()
+            finally:
+                self._waiting.release(ticket)
+            if token is None:
+                self._count("timed_out")
+                return None
+        self._count("admitted")
+        self._count("in_flight")
+        return token
+
+    def release(self, token):
+        self._count("in_flight", -1)
+        self._running.release(token)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, limit=self.limit, queue=self.queue)
+
+
+class AdmissionControl:
+    """Per-class admission for a Flask app.
+
+    ``model_endpoints`` names the view functions that call the model, either
+    ``"endpoint"`` or ``"METHOD endpoint"`` (e.g. ``"POST home"`` for a form
+    page that only calls the model on submit). Everything else is local.
+    """
+
+    def __init__(self, app, name, model_endpoints, capacity=None, reserved=None, queue=None,
+                 wait=None, retry_after=None, lock_dir=LOCK_DIR):
+        capacity = capacity or DEFAULT_CAPACITY
+        if reserved is None:
+            reserved = int(DEFAULT_RESERVED) if DEFAULT_RESERVED else max(1, capacity // 4)
+        model_share = max(1, capacity - reserved)
+        if queue is None:
+            queue = int(DEFAULT_QUEUE) if DEFAULT_QUEUE else 0
+        # Waiting requests hold handlers too; at least one model request always runs
+        queue = min(max(0, queue), model_share - 1)
+        model_limit = model_share - queue
+        wait = DEFAULT_WAIT if wait is None else wait
+        self.retry_after = retry_after or DEFAULT_RETRY_AFTER
+        self.model_endpoints = set(model_endpoints)
+        directory = os.path.join(lock_dir, name) if lock_dir else None
+        self.classes = {
+            MODEL: RouteClass(MODEL, model_limit, queue, wait, directory),
+            LOCAL: RouteClass(LOCAL, capacity, capacity, wait, directory),
+        }
+        app.before_request(self._admit)
+        app.after_request(self._hand_off)
+        app.teardown_request(self._release)
+
+    def route_class(self, endpoint, method):
+        if endpoint in self.model_endpoints or f"{method} {endpoint}" in self.model_endpoints:
+            return self.classes[MODEL]
+        return self.classes[LOCAL]
+
+    def _admit(self):
+        if request.endpoint is None or request.endpoint == "static":
+            return None
+        route_class = self.route_class(request.endpoint, request.method)
+        token = route_class.acquire()
+        if token is None:
+            response = jsonify({"error": "Server is busy, please retry shortly."})
+            response.status_code = 503
+            response.headers["Retry-After"] = str(self.retry_after)
+            return response
+        g.admission = (route_class, token)
+        return None
+
+    def _hand_off(self, response):
+        # Streamed bodies run after the view and the request teardown, so the
+        # slot is released once the server closes the response
+        admitted = g.pop("admission", None)
+        if admitted is not None:
+            route_class, token = admitted
+            response.call_on_close(functools.partial(route_class.release, token))
+        return response
+
+    def _release(self, exc=None):
+        # Only reached with the slot still held when no response was produced
+        admitted = g.pop("admission", None)
+        if admitted is not None:
+            route_class, token = admitted
+            route_class.release(token)
+
+    def stats(self):
+        return {name: route_class.stats() for name, route_class in self.classes.items()}
@@ -0,0 +1,120 @@
+"""Local prefix autocomplete for symptom and disease terms.
+
+``PrefixIndex`` keeps every term from ``word_synonyms``, ``synonyms`` and
+``primary_name`` (whole values and their words) in one sorted array.
+A prefix query is two binary searches plus picking the most frequent terms
+in that slice, well under a millisecond for this dataset.
+
+``SuggestionEnricher`` lets an app top up sparse prefixes with suggestions
+from a slow source such as Gemini without making the request wait. Each
+query is fetched at most once per TTL, failures included. Queries shorter
+than MIN_QUERY_LENGTH are not fetched, and at most MAX_PENDING fetches
+wait at a time; others are dropped rather than queued.
+"""
+import bisect
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common.llm_cache import ResponseCache
+from common.search_index import tokenize
+
+DEFAULT_LIMIT = 10
+MIN_TERM_LENGTH = 3
+# Shortest query sent to the slow source; shorter prefixes match too much to help
+MIN_QUERY_LENGTH = int(os.getenv("SYMPTOM_SUGGESTIONS_MIN_QUERY", "3"))
+# Most fetches queued or running at once
+MAX_PENDING = int(os.getenv("SYMPTOM_SUGGESTIONS_MAX_PENDING", "16"))
+# How long a failed fetch is remembered before the query is tried again
+FAILURE_TTL = int(os.getenv("SYMPTOM_SUGGESTIONS_FAILURE_TTL", "300"))
+
+
+class PrefixIndex:
+    """Sorted array of lowercase terms ranked by how many records use them."""
+
+    def __init__(self, records):
+        counts = {}
+        for record in records:
+            terms = set()
+            values = [record.get("primary_name") or ""]
+            values += (record.get("word_synonyms") or "").split(";")
+            values += record.get("synonyms") or []
+            for value in values:
+                value = value.lower().strip()
+                terms.add(value)
+                terms.update(tokenize(value))
+            for term in terms:
+                if len(term) >= MIN_TERM_LENGTH and not term.isdigit():
+                    counts[term] = counts.get(term, 0) + 1
+        self.terms = sorted(counts)
+        self.counts = [counts[term] for term in self.terms]
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """Most frequent terms starting with ``prefix``, ties broken alphabetically."""
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\uffff", start)
+        best = heapq.nsmallest(limit, range(start, end), key=lambda i: (-self.counts[i], i))
+        return [self.terms[i] for i in best]
+
+
+class SuggestionEnricher:
+    """Fetches extra suggestions in the background and serves them on later requests.
+
+    ``fetch(query)`` is called on a worker thread and must return a list of
+    strings. ``lookup`` never blocks: it returns what is cached for the query
+    (possibly nothing) and schedules a fetch if none is cached, running or
+    recently failed, and there is room in the queue.
+    """
+
+    def __init__(self, fetch, max_workers=2, cache=None, min_query_length=MIN_QUERY_LENGTH,
+                 max_pending=MAX_PENDING, failure_ttl=FAILURE_TTL):
+        self.fetch = fetch
+        self.cache = cache or ResponseCache(maxsize=1024, ttl=24 * 3600)
+        self.failures = ResponseCache(maxsize=1024, ttl=failure_ttl)
+        self.min_query_length = min_query_length
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="suggestions")
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def lookup(self, query):
+        query = query.strip()
+        if len(query) < self.min_query_length:
+            return []
+        key = self.cache.key(query, "suggestions")
+        found, suggestions = self.cache.get(key)
+        if found:
+            return suggestions
+        if self.failures.get(key)[0]:
+            return []
+        with self._lock:
+            if key in self._pending:
+                return []
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return []
+            self._pending.add(key)
+        self._executor.submit(self._run, key, query)
+        return []
+
+    def _run(self, key, query):
+        try:
+            suggestions = [str(item).lower() for item in self.fetch(query)]
+            self.cache.set(key, suggestions)
+        except Exception as e:
+            print(f"Suggestion enrichment failed for {query!r}: {e}")
+            self.failures.set(key, True)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+def enrichment_enabled():
+    """Gemini enrichment can be switched off with SYMPTOM_SUGGESTIONS_AI=0."""
+    return os.getenv("SYMPTOM_SUGGESTIONS_AI", "1") != "0"
@@ -0,0 +1,119 @@
+"""Diagnose many symptom sets with one request.
+
+``diagnose_batch`` shortlists every symptom set locally in one pass, then
+asks the model about several sets per ``generate_content`` call. Each call
+carries the union of the group's shortlists once and returns a list of
+``{"index": ..., "diagnoses": [...]}`` entries, so answers can be matched
+back to their inputs. A set no record matches is asked about with the
+ranker's default candidates instead of a shortlist. Results come back in
+input order; a set that failed validation, whose group call failed, or
+that the model skipped gets an ``error`` instead of a ``diagnosis``. When
+the model is unavailable (``ModelUnavailable``) the group gets the local
+ranking, flagged ``"degraded": true``.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from common.ranking import DEFAULT_SHORTLIST_SIZE
+from common.resilience import ModelUnavailable, degraded_results
+
+# Symptom sets sent to the model per call
+DEFAULT_GROUP_SIZE = int(os.getenv("DIAGNOSIS_BATCH_GROUP_SIZE", "8"))
+# Largest batch accepted by POST /diagnosis/batch
+MAX_BATCH_SIZE = int(os.getenv("DIAGNOSIS_BATCH_MAX", "100"))
+# Model calls running at the same time for one batch
+MAX_PARALLEL_CALLS = 4
+# Batch answers come from another prompt and shape than single /diagnosis
+# answers, so they are cached under their own prompt versions
+CACHE_NAMESPACE = "batch"
+
+
+def batch_inputs(payload):
+    """Pull the list of symptom strings out of a request body.
+
+    Accepts ``{"symptoms": [...]}`` or a bare JSON list. Raises ``ValueError``
+    with a message for the client when the body is unusable.
+    """
+    items = payload.get("symptoms") if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise ValueError('Expected a non-empty "symptoms" list.')
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} symptom sets per batch.")
+    return items
+
+
+def _merge_candidates(shortlists):
+    seen = set()
+    merged = []
+    for shortlist in shortlists:
+        for record in shortlist:
+            if record["key_id"] not in seen:
+                seen.add(record["key_id"])
+                merged.append(record)
+    return merged
+
+
+def diagnose_batch(ask_group, ranker, symptom_sets, cache=None, model=None, prompt_version="1",
+                   group_size=None, shortlist_size=None):
+    """Return one ``{"symptoms", "diagnosis"}`` or ``{"symptoms", "error"}`` entry per input.
+
+    ``ask_group(candidates, queries)`` sends the merged candidate records and
+    a list of ``{"index": i, "symptoms": s}`` to the model and returns the
+    parsed list of ``{"index": i, "diagnoses": [...]}``. When ``cache`` (a
+    ``ResponseCache``) is given, cached sets skip the model and new answers
+    are stored. Their keys use ``"batch:<prompt_version>"``, so the cache
+    can be shared with the single /diagnosis route without either serving
+    the other's answers.
+    """
+    group_size = group_size or DEFAULT_GROUP_SIZE
+    prompt_version = f"{CACHE_NAMESPACE}:{prompt_version}"
+    results = [None] * len(symptom_sets)
+    pending = []
+    for i, symptoms in enumerate(symptom_sets):
+        if not isinstance(symptoms, str) or not symptoms.strip():
+            results[i] = {"symptoms": symptoms, "error": "Symptoms must be a non-empty string."}
+            continue
+        symptoms = symptoms.lower()
+        if cache is not None:
+            found, diagnosis = cache.get(cache.key(symptoms, model, prompt_version))
+            if found:
+                results[i] = {"symptoms": symptoms, "diagnosis": diagnosis}
+                continue
+        pending.append((i, symptoms))
+
+    shortlist_size = shortlist_size or DEFAULT_SHORTLIST_SIZE
+    shortlists = ranker.shortlist_many([symptoms for _, symptoms in pending], shortlist_size)
+    # Sets nothing in the data matches are asked about with the default candidates
+    shortlists = [shortlist or ranker.default_candidates(shortlist_size) for shortlist in shortlists]
+    asked = list(zip(pending, shortlists))
+    groups = [asked[start:start + group_size] for start in range(0, len(asked), group_size)]
+
+    def run(group):
+        candidates = _merge_candidates(shortlist for _, shortlist in group)
+        queries = [{"index": i, "symptoms": symptoms} for (i, symptoms), _ in group]
+        try:
+            answers = ask_group(candidates, queries)
+        except ModelUnavailable:
+            return [(i, symptoms, degraded_results(ranker, symptoms), None, True)
+                    for (i, symptoms), _ in group]
+        except Exception as e:
+            return [(i, symptoms, None, str(e), False) for (i, symptoms), _ in group]
+        by_index = {answer.get("index"): answer.get("diagnoses")
+                    for answer in answers if isinstance(answer, dict)}
+        return [(i, symptoms, by_index.get(i), None, False) for (i, symptoms), _ in group]
+
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CALLS, len(groups) or 1)) as executor:
+        for outcome in executor.map(run, groups):
+            for i, symptoms, diagnosis, error, degraded in outcome:
+                if error is not None:
+                    results[i] = {"symptoms": symptoms, "error": error}
+                elif diagnosis is None:
+                    results[i] = {"symptoms": symptoms, "error": "No diagnosis returned for this symptom set."}
+                elif degraded:
+                    # Not cached, so the model is asked again once it is back
+                    results[i] = {"symptoms": symptoms, "diagnosis": diagnosis, "degraded": True}
+                else:
+                    results[i] = {"symptoms": symptoms, "diagnosis": diagnosis}
+                    if cache is not None:
+                        cache.set(cache.key(symptoms, model, prompt_version), diagnosis)
+    return results
@@ -0,0 +1,180 @@
+"""Bitmap index over searchable attributes with a small boolean query language.
+
+Every distinct lowercased attribute value (names, symptom keywords,
+synonyms, ICD codes) maps to a Python int used as a bitset over record ids.
+A term matches a record when it is a substring of one of the record's
+attributes. Its bitmap is the OR of the bitmaps of those attribute values,
+which are found through a trigram index and memoized. Queries then
+combine term bitmaps with ``&``, ``|`` and ``~``:
+
+    fever AND rash NOT fungal
+    (stiff neck OR "neck pain") AND fever
+    headache OR NOT nausea
+
+NOT binds tightest, then AND, then OR. A NOT between two terms means
+AND NOT. Words next to each other form one phrase, and double quotes
+allow phrases containing operator words.
+"""
+import re
+
+# Term bitmaps kept before the memo is cleared
+MAX_CACHED_TERMS = 4096
+
+OPERATORS = {"AND", "OR", "NOT"}
+QUERY_TOKEN_RE = re.compile(r'"([^"]*)"|(\()|(\))|([^\s()"]+)')
+
+
+class QueryError(ValueError):
+    """A boolean query that cannot be parsed."""
+
+
+def searchable_attributes(record):
+    """Lowercased values a symptom term is matched against, as in biaca's matcher."""
+    attributes = set()
+    if record.get("primary_name"):
+        attributes.add(record["primary_name"].lower())
+    if record.get("word_synonyms"):
+        attributes.update(record["word_synonyms"].lower().split(";"))
+    attributes.update(synonym.lower() for synonym in record.get("synonyms") or [])
+    attributes.update(code["code"].lower() for code in record.get("icd10cm") or [])
+    if record.get("term_icd9_text"):
+        attributes.add(record["term_icd9_text"].lower())
+    return attributes
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class BitmapIndex:
+    """Term -> record bitset index answering substring terms and boolean queries."""
+
+    def __init__(self, records, attributes=searchable_attributes):
+        self.records = records
+        self.all = (1 << len(records)) - 1
+        ids = {}
+        for record_id, record in enumerate(records):
+            for value in attributes(record):
+                ids.setdefault(value, []).append(record_id)
+        self._values = list(ids)
+        self._bitmaps = [sum(1 << record_id for record_id in ids[value]) for value in self._values]
+        self._grams = {}
+        for position, value in enumerate(self._values):
+            for gram in _trigrams(value):
+                self._grams.setdefault(gram, []).append(position)
+        self._terms = {}
+
+    def term(self, text):
+        """Bitmap of the records with an attribute containing ``text``."""
+        text = text.lower()
+        if text in self._terms:
+            return self._terms[text]
+        grams = _trigrams(text)
+        if grams:
+            # Only values sharing every trigram of the term can contain it
+            candidates = set(self._grams.get(grams.pop(), ()))
+            for gram in grams:
+                if not candidates:
+                    break
+                candidates.intersection_update(self._grams.get(gram, ()))
+        else:
+            candidates = range(len(self._values))
+        bitmap = 0
+        for position in candidates:
+            if text in self._values[position]:
+                bitmap |= self._bitmaps[position]
+        if len(self._terms) >= MAX_CACHED_TERMS:
+            self._terms.clear()
+        self._terms[text] = bitmap
+        return bitmap
+
+    def any_of(self, terms):
+        """Bitmap of records matching at least one of the terms."""
+        bitmap = 0
+        for term in terms:
+            bitmap |= self.term(term)
+        return bitmap
+
+    def query(self, expression):
+        """Evaluate a boolean query to a bitmap. Raises ``QueryError`` if it is malformed."""
+        return _Parser(expression, self).parse()
+
+    @staticmethod
+    def ids(bitmap):
+        """Record ids set in a bitmap, in ascending (file) order."""
+        # Reversed binary digits put bit i at string index i
+        return [record_id for record_id, bit in enumerate(bin(bitmap)[:1:-1]) if bit == "1"]
+
+    def get_records(self, bitmap):
+        return [self.records[record_id] for record_id in self.ids(bitmap)]
+
+
+class _Parser:
+    """Recursive descent parser that evaluates as it goes."""
+
+    def __init__(self, expression, index):
+        self.index = index
+        self.tokens = []
+        for quoted, opening, closing, word in QUERY_TOKEN_RE.findall(expression or ""):
+            if opening or closing:
+                self.tokens.append((opening or closing, None))
+            elif word and word in OPERATORS:
+                self.tokens.append((word, None))
+            else:
+                self.tokens.append(("TERM", quoted if quoted else word))
+        if not self.tokens:
+            raise QueryError("Query is empty.")
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        bitmap = self.parse_or()
+        if self.peek() is not None:
+            raise QueryError(f"Unexpected {self.tokens[self.position][1] or self.peek()!r}.")
+        return bitmap
+
+    def parse_or(self):
+        bitmap = self.parse_and()
+        while self.peek() == "OR":
+            self.take()
+            bitmap |= self.parse_and()
+        return bitmap
+
+    def parse_and(self):
+        bitmap = self.parse_unary()
+        while self.peek() in ("AND", "NOT"):
+            if self.take()[0] == "NOT":
+                bitmap &= ~self.parse_unary() & self.index.all
+            else:
+                bitmap &= self.parse_unary()
+        return bitmap
+
+    def parse_unary(self):
+        kind = self.peek()
+        if kind == "NOT":
+            self.take()
+            return ~self.parse_unary() & self.index.all
+        if kind == "(":
+            self.take()
+            bitmap = self.parse_or()
+            if self.peek() != ")":
+                raise QueryError("Missing closing parenthesis.")
+            self.take()
+            return bitmap
+        if kind == "TERM":
+            words = [self.take()[1]]
+            # Adjacent words form one phrase, e.g. stiff neck
+            while self.peek() == "TERM":
+                words.append(self.take()[1])
+            phrase = " ".join(word for word in words if word)
+            if not phrase.strip():
+                raise QueryError("Empty phrase.")
+            return self.index.term(phrase)
+        raise QueryError("Expected a symptom, NOT or '('." if kind is None else f"Unexpected {kind!r}.")
@@ -0,0 +1,171 @@
+"""Ranked multi-symptom matching with BM25 (or TF-IDF) weights.
+
+The index is a disease-by-term sparse weight matrix over the words of
+``primary_name``, ``synonyms`` and ``word_synonyms``. It is stored
+term-major in CSR arrays: ``indptr``, ``indices`` holding record ids and
+``data`` holding weights, so each term's postings are one slice. A query
+word of four or more letters also matches the indexed words it prefixes,
+but each query word scores once per record: with the best weight among
+the words it matched, so "fever" does not count "fever" and "feverish"
+twice. The per-word scores are summed with a single ``np.bincount``, and
+the top k come from ``np.argpartition``.
+
+This is an alternative to the "any symptom is a substring" matchers. Apps
+choose it per request with ``?rank=bm25`` (or ``tfidf``), or per
+deployment with DIAGNOSIS_RANKING.
+"""
+import bisect
+import os
+
+import numpy as np
+
+from common.ranking import STOPWORDS, MIN_PREFIX_LENGTH, split_symptoms
+from common.search_index import FIELDS, field_elements, tokenize
+
+SCHEMES = ("bm25", "tfidf")
+# Backend used when the request does not pick one; "match" keeps the old matcher
+DEFAULT_RANKING = os.getenv("DIAGNOSIS_RANKING", "match")
+DEFAULT_TOP_K = int(os.getenv("DIAGNOSIS_TOP_K", "20"))
+K1 = 1.2
+B = 0.75
+
+
+def requested_ranking(args):
+    """Ranking backend named by ``args["rank"]`` (request args or form), else the default."""
+    ranking = (args.get("rank") or DEFAULT_RANKING).lower()
+    return ranking if ranking in SCHEMES else "match"
+
+
+def requested_top_k(args):
+    """``args["limit"]`` as a positive int, else DEFAULT_TOP_K."""
+    try:
+        return max(1, int(args.get("limit", DEFAULT_TOP_K)))
+    except (TypeError, ValueError):
+        return DEFAULT_TOP_K
+
+
+class BM25Index:
+    """Sparse BM25/TF-IDF weight matrix over disease names and symptom keywords."""
+
+    def __init__(self, records, fields=FIELDS, scheme="bm25", k1=K1, b=B):
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown scheme {scheme!r}, expected one of {SCHEMES}")
+        self.records = records
+        postings = {}
+        lengths = np.zeros(len(records), dtype=np.float64)
+        for record_id, record in enumerate(records):
+            counts = {}
+            for field in fields:
+                for element in field_elements(record, field):
+                    for token in tokenize(element.lower()):
+                        counts[token] = counts.get(token, 0) + 1
+            lengths[record_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((record_id, tf))
+
+        self.terms = sorted(postings)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        sizes = np.fromiter((len(postings[term]) for term in self.terms), dtype=np.int64,
+                            count=len(self.terms))
+        self.indptr = np.concatenate(([0], np.cumsum(sizes)))
+        self.indices = np.empty(self.indptr[-1], dtype=np.int32)
+        tf = np.empty(self.indptr[-1], dtype=np.float64)
+        for i, term in enumerate(self.terms):
+            start, end = self.indptr[i], self.indptr[i + 1]
+            self.indices[start:end], tf[start:end] = zip(*postings[term])
+
+        total = max(len(records), 1)
+        idf = np.log(1 + (total - sizes + 0.5) / (sizes + 0.5))
+        term_idf = np.repeat(idf, sizes)
+        if scheme == "bm25":
+            average = lengths.mean() if len(records) else 1.0
+            norm = k1 * (1 - b + b * lengths[self.indices] / average)
+            self.data = term_idf * tf * (k1 + 1) / (tf + norm)
+        else:
+            self.data = term_idf * (1 + np.log(tf))
+
+    def __len__(self):
+        return len(self.records)
+
+    def query_terms(self, query):
+        """One list of index terms per query word. Long words also match indexed words they prefix."""
+        groups = []
+        for phrase in split_symptoms(query):
+            for token in tokenize(phrase):
+                if token in STOPWORDS:
+                    continue
+                if len(token) < MIN_PREFIX_LENGTH:
+                    if token in self.term_ids:
+                        groups.append([token])
+                    continue
+                # The exact word sorts first among the words it prefixes
+                start = bisect.bisect_left(self.terms, token)
+                group = []
+                for term in self.terms[start:]:
+                    if not term.startswith(token):
+                        break
+                    group.append(term)
+                if group:
+                    groups.append(group)
+        return groups
+
+    def _group_scores(self, group):
+        """``(record_ids, weights)`` of one query word: its best weight in each record."""
+        slices = [(self.indptr[self.term_ids[term]], self.indptr[self.term_ids[term] + 1]) for term in group]
+        rows = np.concatenate([self.indices[start:end] for start, end in slices])
+        values = np.concatenate([self.data[start:end] for start, end in slices])
+        if len(group) == 1:
+            return rows, values
+        # Heaviest weight first within each record, then keep the first of each
+        order = np.lexsort((-values, rows))
+        rows, values = rows[order], values[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        return rows[first], values[first]
+
+    def scores(self, groups):
+        """Score every record against the query words: one sparse matrix-vector product."""
+        if not groups:
+            return np.zeros(len(self.records))
+        parts = [self._group_scores(group) for group in groups]
+        rows = np.concatenate([rows for rows, _ in parts])
+        values = np.concatenate([values for _, values in parts])
+        return np.bincount(rows, weights=values, minlength=len(self.records))
+
+    def search(self, query, k=DEFAULT_TOP_K):
+        """Return up to ``k`` ``(record, score, matched_terms)`` tuples, best first."""
+        groups = self.query_terms(query)
+        scores = self.scores(groups)
+        terms = [term for group in groups for term in group]
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        # Highest score first, file order among equal scores
+        top = matched[np.lexsort((matched, -scores[matched]))]
+
+        matched_terms = {int(record_id): [] for record_id in top}
+        for term in dict.fromkeys(terms):
+            i = self.term_ids[term]
+            hits = self.indices[self.indptr[i]:self.indptr[i + 1]]
+            for record_id in top[np.isin(top, hits)]:
+                matched_terms[int(record_id)].append(term)
+        return [(self.records[record_id], round(float(scores[record_id]), 4), matched_terms[int(record_id)])
+                for record_id in top]
+
+
+class RankingEngines:
+    """Builds the BM25 and TF-IDF indexes for a dataset on first use."""
+
+    def __init__(self, records):
+        self.records = records
+        self._indexes = {}
+
+    def get(self, scheme):
+        if scheme not in self._indexes:
+            self._indexes[scheme] = BM25Index(self.records, scheme=scheme)
+        return self._indexes[scheme]
+
+    def search(self, scheme, query, k=DEFAULT_TOP_K):
+        return self.get(scheme).search(query, k)
@@ -0,0 +1,299 @@
+"""Compact, mmap-able binary copy of diseases.json shared by gunicorn workers.
+
+Every worker that ``json.load``s diseases.json keeps its own set of Python
+dicts, several times the size of the file. The compact format is built once
+from the JSON file and each worker maps it read-only, so the operating
+system keeps a single copy in the page cache for all of them.
+
+File layout (all integers are little-endian uint32):
+
+    header    magic, version, record count, string count, list pool size,
+              section offsets and the SHA-1 of the source JSON
+    strings   offsets[string count + 1] into the blob, then the UTF-8 blob.
+              Every distinct string is stored once.
+    records   one fixed-width row of ROW_FIELDS per record
+    lists     pool of string ids used by synonyms, info_link_data and icd10cm
+
+Building is an explicit deploy step, run once before the workers start::
+
+    python -m common.compact_store diseases.json [diseases.dzc]
+
+Workers never build the file themselves: the app directory may be
+read-only, and many workers racing to write it is wasted work.
+``open_dataset`` maps the file when it is current and otherwise falls back
+to parsing the JSON, so a missing, stale or unreadable compact file only
+costs memory.
+
+``CompactDataset`` gives the routes a read-only list of ``CompactRecord``
+mappings that decode fields on access and behave like the original dicts.
+
+Only the records are shared. Indexes built over the dataset (``SearchIndex``,
+``RecordLookup``) still hold their keys in each worker, so they should
+keep record positions rather than records or decoded values, e.g.
+``SearchIndex(dataset, cache_values=False)``.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections.abc import Mapping, Sequence
+
+MAGIC = b"DZC1"
+VERSION = 1
+# magic, version, records, strings, list items, string offsets, string blob,
+# records, lists, source sha1
+HEADER = struct.Struct("<4sIIIIIIII20s")
+NONE = 0xFFFFFFFF
+
+# Per-record row: seven string ids, a flags word, then (start, count) pairs
+# into the list pool for the three list fields
+ROW_FIELDS = 14
+ROW = struct.Struct("<%dI" % ROW_FIELDS)
+STRING_FIELDS = ("key_id", "primary_name", "term_icd9_code", "term_icd9_text",
+                 "consumer_name", "word_synonyms", "icd10cm_codes")
+FLAG_PROCEDURE = 1
+FLAG_HAS_ICD10 = 2
+
+# Key order of the records in diseases.json
+KEYS = ("key_id", "primary_name", "term_icd9_code", "term_icd9_text", "consumer_name",
+        "is_procedure", "word_synonyms", "synonyms", "info_link_data",
+        "icd10cm_codes", "icd10cm")
+ICD10_KEYS = ("icd10cm_codes", "icd10cm")
+
+
+def default_path(json_path):
+    return os.path.splitext(json_path)[0] + ".dzc"
+
+
+def _source_digest(json_path):
+    with open(json_path, "rb") as file:
+        return hashlib.sha1(file.read()).digest()
+
+
+def build(json_path, out_path=None):
+    """Write the compact file for ``json_path`` and return its path.
+
+    The file is written under a temporary name and renamed into place, so
+    workers starting at the same time never map a partial file.
+    """
+    out_path = out_path or default_path(json_path)
+    with open(json_path, "rb") as file:
+        raw = file.read()
+    records = json.loads(raw)
+
+    strings = {}
+
+    def intern(value):
+        if value is None:
+            return NONE
+        if not isinstance(value, str):
+            raise ValueError("expected a string, got %r" % (value,))
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    rows = []
+    pool = []
+
+    def add_list(ids):
+        start = len(pool)
+        pool.extend(ids)
+        return start, len(ids)
+
+    for record in records:
+        has_icd10 = "icd10cm" in record
+        if set(record) != set(KEYS if has_icd10 else KEYS[:-2]):
+            raise ValueError("unexpected keys in record %r" % record.get("key_id"))
+        flags = FLAG_PROCEDURE if record["is_procedure"] else 0
+        if has_icd10:
+            flags |= FLAG_HAS_ICD10
+        row = [intern(record.get(field)) for field in STRING_FIELDS]
+        row.append(flags)
+        row.extend(add_list([intern(synonym) for synonym in record["synonyms"]]))
+        row.extend(add_list([intern(part) for link in record["info_link_data"]
+                             for part in _pair(link)]))
+        row.extend(add_list([intern(part) for code in record.get("icd10cm", [])
+                             for part in (code["code"], code["name"])]))
+        rows.append(row)
+
+    blob = bytearray()
+    offsets = [0]
+    for value in strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+
+    offsets_pos = HEADER.size
+    blob_pos = offsets_pos + 4 * len(offsets)
+    records_pos = _align(blob_pos + len(blob))
+    lists_pos = records_pos + ROW.size * len(rows)
+    header = HEADER.pack(MAGIC, VERSION, len(rows), len(strings), len(pool), offsets_pos,
+                         blob_pos, records_pos, lists_pos, hashlib.sha1(raw).digest())
+
+    directory = os.path.dirname(os.path.abspath(out_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        # mkstemp creates the file 0600; workers may run as another user
+        os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, "wb") as out:
+            out.write(header)
+            out.write(struct.pack("<%dI" % len(offsets), *offsets))
+            out.write(blob)
+            out.write(b"\0" * (records_pos - blob_pos - len(blob)))
+            for row in rows:
+                out.write(ROW.pack(*row))
+            out.write(struct.pack("<%dI" % len(pool), *pool))
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return out_path
+
+
+def _pair(link):
+    if len(link) != 2:
+        raise ValueError("info_link_data entries must be [url, title] pairs")
+    return link
+
+
+def _align(offset):
+    return (offset + 3) & ~3
+
+
+def is_current(json_path, compact_path):
+    """True when ``compact_path`` exists and was built from the current JSON file."""
+    try:
+        with open(compact_path, "rb") as file:
+            header = file.read(HEADER.size)
+    except OSError:
+        return False
+    if len(header) < HEADER.size:
+        return False
+    magic, version, *_, digest = HEADER.unpack(header)
+    return magic == MAGIC and version == VERSION and digest == _source_digest(json_path)
+
+
+def open_dataset(json_path, compact_path=None):
+    """Map the compact copy of ``json_path``, or parse the JSON if there is no usable one."""
+    compact_path = compact_path or default_path(json_path)
+    if is_current(json_path, compact_path):
+        try:
+            return CompactDataset(compact_path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Could not map {compact_path}, loading the JSON instead: {e}")
+    else:
+        print(f"{compact_path} is missing or stale, loading the JSON instead. "
+              f"Build it with: python -m common.compact_store {json_path}")
+    with open(json_path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+class CompactDataset(Sequence):
+    """Read-only list of records backed by a memory-mapped compact file."""
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("the compact dataset format is little-endian only")
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self._count, strings, pool_size, offsets_pos, blob_pos,
+         records_pos, lists_pos, self.source_digest) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a compact dataset file" % path)
+        view = memoryview(self._mmap)
+        self._offsets = view[offsets_pos:offsets_pos + 4 * (strings + 1)].cast("I")
+        self._blob = view[blob_pos:]
+        self._rows = view[records_pos:lists_pos].cast("I")
+        self._pool = view[lists_pos:lists_pos + 4 * pool_size].cast("I")
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CompactRecord(self, i) for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("record index out of range")
+        return CompactRecord(self, index)
+
+    def string(self, string_id):
+        if string_id == NONE:
+            return None
+        start = self._offsets[string_id]
+        return str(self._blob[start:self._offsets[string_id + 1]], "utf-8")
+
+    def row(self, index):
+        start = index * ROW_FIELDS
+        return self._rows[start:start + ROW_FIELDS]
+
+    def strings(self, start, count):
+        return [self.string(string_id) for string_id in self._pool[start:start + count]]
+
+
+class CompactRecord(Mapping):
+    """Dict-like view of one record; fields are decoded when they are read."""
+
+    __slots__ = ("_dataset", "_index", "_row")
+
+    def __init__(self, dataset, index):
+        self._dataset = dataset
+        self._index = index
+        self._row = dataset.row(index)
+
+    def _keys(self):
+        return KEYS if self._row[7] & FLAG_HAS_ICD10 else KEYS[:-2]
+
+    def __getitem__(self, key):
+        row = self._row
+        if key in ICD10_KEYS and not row[7] & FLAG_HAS_ICD10:
+            raise KeyError(key)
+        if key in STRING_FIELDS:
+            return self._dataset.string(row[STRING_FIELDS.index(key)])
+        if key == "is_procedure":
+            return bool(row[7] & FLAG_PROCEDURE)
+        if key == "synonyms":
+            return self._dataset.strings(row[8], row[9])
+        if key == "info_link_data":
+            parts = self._dataset.strings(row[10], row[11])
+            return [parts[i:i + 2] for i in range(0, len(parts), 2)]
+        if key == "icd10cm":
+            parts = self._dataset.strings(row[12], row[13])
+            return [{"code": parts[i], "name": parts[i + 1]} for i in range(0, len(parts), 2)]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __repr__(self):
+        return "CompactRecord(%r)" % self.to_dict()
+
+    def to_dict(self):
+        return {key: self[key] for key in self._keys()}
+
+
+def install_json_provider(app):
+    """Let ``jsonify`` serialize ``CompactRecord`` values like plain dicts."""
+    from flask.json.provider import DefaultJSONProvider
+
+    class CompactJSONProvider(DefaultJSONProvider):
+        @staticmethod
+        def default(o):
+            if isinstance(o, CompactRecord):
+                return o.to_dict()
+            return DefaultJSONProvider.default(o)
+
+    app.json = CompactJSONProvider(app)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python -m common.compact_store diseases.json [output.dzc]")
+    print(build(*sys.argv[1:]))
@@ -0,0 +1,296 @@
+"""Reuse one uploaded copy of the dataset across Gemini prompts.
+
+Several routes start every prompt with the same multi-megabyte
+"This is the existing data in JSON format: ..." block. ``ContextCache``
+uploads that prefix once per dataset version as Gemini cached content,
+sends only the per-request part with a reference to the cached handle, and
+extends the cache's TTL shortly before it expires.
+
+The SDK sits behind a small backend interface:
+
+    create_cache(model, contents, ttl) -> handle
+    extend_cache(handle, ttl)
+    delete_cache(handle)
+    generate_content(model, contents, cache=None, config=None, stream=False, timeout=None)
+
+``GenaiBackend`` wraps ``google-genai``, ``LegacyGenaiBackend`` wraps
+``google-generativeai`` and ``LocalBackend`` is an in-process stand-in for
+tests. If the cache cannot be created (an SDK without caching, a model or
+prompt the API will not cache) requests fall back to sending the prefix
+inline, as before, and creation is retried later. A generation error that
+says the cached content is gone (404 or 403) drops the handle and answers
+inline; any other error, e.g. a 429 or a timeout, is raised as is so the
+retry layer can back off, and the cache is kept. Extending the TTL follows
+the same rule: only a gone cache is replaced, other failures keep the
+handle until it expires and the extend is retried a little later.
+"""
+import datetime
+import hashlib
+import itertools
+import os
+import threading
+import time
+
+DEFAULT_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+# Extend the cache this many seconds before it would expire
+REFRESH_MARGIN = 300
+# Wait this long before trying to create a cache again after a failure
+RETRY_AFTER = 600
+# Wait this long before trying to extend the cache again after a failure
+EXTEND_RETRY_AFTER = 30
+# Errors that mean the cached content no longer exists or is not ours to use
+CACHE_GONE_CODES = {403, 404}
+CACHE_GONE_NAMES = {"Forbidden", "NotFound", "PermissionDenied"}
+
+
+def is_cache_gone(error):
+    """True if a generation error means the cache handle itself is unusable."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code in CACHE_GONE_CODES:
+        return True
+    return type(error).__name__ in CACHE_GONE_NAMES
+
+
+def file_version(path):
+    """Version string for a data file that changes whenever the file does."""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class GenaiBackend:
+    """Backend for the ``google-genai`` client (``from google import genai``)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def create_cache(self, model, contents, ttl):
+        from google.genai import types
+        cache = self.client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(contents=contents, ttl=f"{int(ttl)}s"),
+        )
+        return cache.name
+
+    def extend_cache(self, handle, ttl):
+        from google.genai import types
+        self.client.caches.update(name=handle, config=types.UpdateCachedContentConfig(ttl=f"{int(ttl)}s"))
+
+    def delete_cache(self, handle):
+        self.client.caches.delete(name=handle)
+
+    def generate_content(self, model, contents, cache=None, config=None, stream=False, timeout=None):
+        config = dict(config or {})
+        if cache is not None:
+            config["cached_content"] = cache
+        if timeout is not None:
+            config["http_options"] = {"timeout": max(1, int(timeout * 1000))}
+        generate = self.client.models.generate_content_stream if stream else self.client.models.generate_content
+        return generate(model=model, contents=contents, config=config or None)
+
+
+class LegacyGenaiBackend:
+    """Backend for the ``google-generativeai`` package (``import google.generativeai``)."""
+
+    def __init__(self, genai):
+        self.genai = genai
+
+    def create_cache(self, model, contents, ttl):
+        return self.genai.caching.CachedContent.create(
+            model=model, contents=contents, ttl=datetime.timedelta(seconds=ttl)
+        )
+
+    def extend_cache(self, handle, ttl):
+        handle.update(ttl=datetime.timedelta(seconds=ttl))
+
+    def delete_cache(self, handle):
+        handle.delete()
+
+    def generate_content(self, model, contents, cache=None, config=None, stream=False, timeout=None):
+        if cache is not None:
+            generative_model = self.genai.GenerativeModel.from_cached_content(cached_content=cache)
+        else:
+            generative_model = self.genai.GenerativeModel(model)
+        request_options = {"timeout": timeout} if timeout is not None else None
+        return generative_model.generate_content(contents, generation_config=config, stream=stream,
+                                                 request_options=request_options)
+
+
+class NotFound(KeyError):
+    """Unknown cache handle in ``LocalBackend``, the API's 404."""
+    code = 404
+
+
+class LocalResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class LocalBackend:
+    """In-process stand-in for the Gemini API, for tests and offline work.
+
+    ``respond(contents)`` receives the full prompt (cached prefix included)
+    and returns the reply text. Every call is recorded in ``calls``.
+    """
+
+    def __init__(self, respond=lambda contents: ""):
+        self.respond = respond
+        self.caches = {}
+        self.calls = []
+        self._handles = itertools.count(1)
+
+    def create_cache(self, model, contents, ttl):
+        # Never reuse a handle, like the API
+        handle = f"cachedContents/local-{next(self._handles)}"
+        self.caches[handle] = list(contents)
+        return handle
+
+    def extend_cache(self, handle, ttl):
+        if handle not in self.caches:
+            raise NotFound(handle)
+
+    def delete_cache(self, handle):
+        self.caches.pop(handle, None)
+
+    def generate_content(self, model, contents, cache=None, config=None, stream=False, timeout=None):
+        contents = list(contents)
+        if cache is not None and cache not in self.caches:
+            raise NotFound(cache)
+        prompt = self.caches[cache] + contents if cache is not None else contents
+        self.calls.append({
+            "model": model,
+            "cache": cache,
+            "input_chars": sum(len(str(part)) for part in contents),
+        })
+        response = LocalResponse(self.respond(prompt))
+        return iter([response]) if stream else response
+
+
+class ContextCache:
+    """Keeps a cached copy of a static prompt prefix and generates against it.
+
+    ``prefix`` is either the list of prefix contents, when the data never
+    changes while the app runs, or a callable returning it. A callable needs
+    ``version()`` returning a value that changes whenever the prefix does
+    (e.g. ``lambda: file_version(json_path)``).
+    """
+
+    def __init__(self, backend, model, prefix, version=None, ttl=DEFAULT_TTL,
+                 refresh_margin=REFRESH_MARGIN, retry_after=RETRY_AFTER):
+        if not callable(prefix):
+            contents = list(prefix)
+            digest = hashlib.sha1("\n".join(map(str, contents)).encode("utf-8")).hexdigest()
+            prefix = lambda: contents
+            version = version or (lambda: digest)
+        elif version is None:
+            raise ValueError("version is required when prefix is a callable")
+        self.backend = backend
+        self.model = model
+        self.prefix = prefix
+        self.version = version
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self._handle = None
+        self._handle_version = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._extend_retry_at = 0.0
+        self._lock = threading.Lock()
+        self.created = 0
+        self.refreshed = 0
+        self.failures = 0
+        self.cached_requests = 0
+        self.inline_requests = 0
+
+    def handle(self):
+        """Return a live cache handle, or None if the prefix must be sent inline."""
+        now = time.time()
+        version = self.version()
+        handle = self._handle
+        if handle is not None and self._handle_version == version and now < self._expires_at - self.refresh_margin:
+            return handle
+        # One thread creates or extends; the others keep using the current
+        # handle while it is still valid, or send the prefix inline
+        if not self._lock.acquire(blocking=False):
+            return handle if handle is not None and self._handle_version == version and now < self._expires_at else None
+        try:
+            return self._renew(now, version)
+        finally:
+            self._lock.release()
+
+    def _renew(self, now, version):
+        if self._handle is not None and self._handle_version == version:
+            if now < self._expires_at - self.refresh_margin:
+                return self._handle
+            if now < min(self._extend_retry_at, self._expires_at):
+                return self._handle
+            try:
+                self.backend.extend_cache(self._handle, self.ttl)
+                self._expires_at = now + self.ttl
+                self.refreshed += 1
+                return self._handle
+            except Exception as e:
+                if not is_cache_gone(e) and now < self._expires_at:
+                    # Throttled or slow: re-uploading the prefix would only add load
+                    print(f"Context cache refresh failed, keeping the current one: {e}")
+                    self._extend_retry_at = now + EXTEND_RETRY_AFTER
+                    return self._handle
+                print(f"Context cache refresh failed, creating a new one: {e}")
+        self.invalidate()
+        if now < self._retry_at:
+            return None
+        try:
+            self._handle = self.backend.create_cache(self.model, self.prefix(), self.ttl)
+        except Exception as e:
+            print(f"Context cache unavailable, sending the dataset inline: {e}")
+            self.failures += 1
+            self._retry_at = now + self.retry_after
+            return None
+        self._handle_version = version
+        self._expires_at = now + self.ttl
+        self.created += 1
+        return self._handle
+
+    def invalidate(self):
+        """Forget the current handle and delete it upstream, best effort."""
+        handle, self._handle = self._handle, None
+        self._handle_version = None
+        if handle is not None:
+            try:
+                self.backend.delete_cache(handle)
+            except Exception:
+                pass
+
+    def generate_content(self, contents, config=None, stream=False, timeout=None):
+        """Generate with the cached prefix, or with the prefix inline if there is no cache.
+
+        ``timeout`` (seconds) is handed to the SDK as its per-request deadline.
+        """
+        handle = self.handle()
+        if handle is not None:
+            try:
+                response = self.backend.generate_content(self.model, list(contents), handle, config, stream, timeout)
+                self.cached_requests += 1
+                return response
+            except Exception as e:
+                if stream or not is_cache_gone(e):
+                    raise
+                # The cache was dropped upstream; answer inline this time
+                print(f"Cached generation failed, retrying inline: {e}")
+                with self._lock:
+                    if self._handle is handle:
+                        self.invalidate()
+        self.inline_requests += 1
+        return self.backend.generate_content(self.model, list(self.prefix()) + list(contents), None, config, stream,
+                                             timeout)
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "active": self._handle is not None,
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+            "cached_requests": self.cached_requests,
+            "inline_requests": self.inline_requests,
+        }
@@ -0,0 +1,93 @@
+"""Process-wide store for diseases.json that parses the file once.
+
+``DatasetStore`` keeps the parsed records in an immutable ``Snapshot``.
+Requests grab the current snapshot and keep using it even if a reload
+happens meanwhile. A reload builds a complete new snapshot first and only
+then swaps the reference, so no request ever sees a half-loaded list.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import NamedTuple
+
+# The data file is stat'ed at most this often
+DEFAULT_CHECK_INTERVAL = 1.0
+
+
+class Snapshot(NamedTuple):
+    records: tuple
+    mtime: int
+    digest: str
+    loaded_at: float
+
+
+class DatasetStore:
+    """Loads a JSON list once and reloads it when the file's mtime and content change."""
+
+    def __init__(self, path, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        self._next_check = 0.0
+        self._snapshot = self._load()
+
+    def _read(self):
+        with open(self.path, "rb") as file:
+            raw = file.read()
+        return raw, hashlib.sha1(raw).hexdigest()
+
+    def _load(self, mtime=None):
+        if mtime is None:
+            mtime = os.stat(self.path).st_mtime_ns
+        raw, digest = self._read()
+        records = tuple(json.loads(raw))
+        return Snapshot(records, mtime, digest, time.time())
+
+    def on_reload(self, callback):
+        """Register ``callback(snapshot)`` to run after a new snapshot is swapped in."""
+        self._listeners.append(callback)
+        return callback
+
+    def snapshot(self):
+        """Return the current snapshot, reloading first if the file changed."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._refresh()
+        return self._snapshot
+
+    @property
+    def records(self):
+        return self.snapshot().records
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            # Keep serving the last good snapshot while the file is missing
+            return
+        if mtime == self._snapshot.mtime:
+            return
+        # Only one thread reloads; the others keep serving the old snapshot
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            current = self._snapshot
+            raw, digest = self._read()
+            if digest == current.digest:
+                # Touched but unchanged, skip the parse
+                self._snapshot = current._replace(mtime=mtime)
+                return
+            try:
+                records = tuple(json.loads(raw))
+            except ValueError:
+                # A half-written file; try again on the next check
+                return
+            self._snapshot = Snapshot(records, mtime, digest, time.time())
+        finally:
+            self._reload_lock.release()
+        for callback in self._listeners:
+            callback(self._snapshot)
@@ -0,0 +1,113 @@
+"""Streamed export of the disease list for the full-dataset routes.
+
+``export_response`` replaces ``jsonify(diseases)``. It writes the records
+out a batch at a time from a generator, so a request never holds the whole
+serialized dataset in memory. It supports two formats:
+
+- ``?format=json`` (default): one JSON array, sent in chunks.
+- ``?format=ndjson``, or ``Accept: application/x-ndjson``: one record per
+  line.
+
+Optional query parameters:
+
+- ``fields=key_id,primary_name``: keep only these keys.
+- ``is_procedure=true|false``: filter on the procedure flag.
+- ``icd=G0``: keep records with an ICD-10-CM code starting with the prefix.
+"""
+import json
+
+from flask import Response, jsonify, stream_with_context
+
+# Records serialized per chunk written to the socket
+BATCH_SIZE = 200
+
+FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _flag(value):
+    value = value.lower()
+    if value in ("1", "true", "yes"):
+        return True
+    if value in ("0", "false", "no"):
+        return False
+    raise ValueError("is_procedure must be true or false.")
+
+
+def icd10_codes(record):
+    """ICD-10-CM codes of a record, from ``icd10cm`` or the comma separated ``icd10cm_codes``."""
+    codes = [code["code"] for code in record.get("icd10cm") or []]
+    if not codes and record.get("icd10cm_codes"):
+        codes = [code.strip() for code in record["icd10cm_codes"].split(",")]
+    return codes
+
+
+def export_options(args, accept=""):
+    """Parse the export query parameters. Raises ``ValueError`` on bad values."""
+    fmt = args.get("format") or ("ndjson" if "application/x-ndjson" in accept else "json")
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}.")
+    fields = [field.strip() for field in args.get("fields", "").split(",") if field.strip()]
+    is_procedure = args.get("is_procedure")
+    return {
+        "format": fmt,
+        "fields": fields or None,
+        "is_procedure": _flag(is_procedure) if is_procedure else None,
+        "icd": (args.get("icd") or "").strip().upper() or None,
+    }
+
+
+def iter_records(records, fields=None, is_procedure=None, icd=None):
+    """Yield the filtered, projected records one at a time."""
+    for record in records:
+        if is_procedure is not None and bool(record.get("is_procedure")) != is_procedure:
+            continue
+        if icd and not any(code.upper().startswith(icd) for code in icd10_codes(record)):
+            continue
+        yield {field: record.get(field) for field in fields} if fields else record
+
+
+def _ndjson(records):
+    batch = []
+    for record in records:
+        batch.append(json.dumps(record))
+        if len(batch) == BATCH_SIZE:
+            yield "\n".join(batch) + "\n"
+            batch = []
+    if batch:
+        yield "\n".join(batch) + "\n"
+
+
+def _json_array(records):
+    yield "["
+    batch = []
+    first = True
+    for record in records:
+        batch.append(json.dumps(record))
+        if len(batch) == BATCH_SIZE:
+            yield ("" if first else ",") + ",".join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ("" if first else ",") + ",".join(batch)
+    yield "]\n"
+
+
+def export_response(records, request):
+    """Streamed response for ``records`` shaped by the request's export parameters.
+
+    Anything that is not a list, e.g. an error dict from a failed load, is
+    returned with ``jsonify`` as before.
+    """
+    if not isinstance(records, (list, tuple)):
+        return jsonify(records)
+    try:
+        options = export_options(request.args, request.headers.get("Accept", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    fmt = options.pop("format")
+    selected = iter_records(records, **options)
+    body = _ndjson(selected) if fmt == "ndjson" else _json_array(selected)
+    return Response(stream_with_context(body), mimetype=FORMATS[fmt])
@@ -0,0 +1,75 @@
+"""Full-text substring index over every field of every record.
+
+Catch-all searches used to test ``query in str(value).lower()`` for every
+value of every record on each request, stringifying nested lists like
+``icd10cm`` and ``info_link_data`` each time. ``FullTextIndex`` keeps those
+lowercased strings from load time, together with 1- to 3-gram posting
+lists. A query only verifies the records that contain all of its
+trigrams. The matching is the same as the old scan, including matches
+inside nested ICD-10 names and link titles, and the index also reports
+which field matched.
+"""
+from common.search_index import MAX_GRAM
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class FullTextIndex:
+    """Gram postings over ``str(value).lower()`` of every field."""
+
+    def __init__(self, records):
+        self.records = records
+        self._texts = []
+        self._postings = {}
+        for record_id, record in enumerate(records):
+            texts = [(field, str(value).lower()) for field, value in record.items()]
+            self._texts.append(texts)
+            grams = set()
+            for _, text in texts:
+                for size in range(1, MAX_GRAM + 1):
+                    grams.update(_grams(text, size))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(record_id)
+        self._all_ids = range(len(records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def candidates(self, query):
+        """Ascending ids of records that could contain ``query``, a superset of the hits."""
+        if not query:
+            return self._all_ids
+        if len(query) <= MAX_GRAM:
+            return self._postings.get(query, [])
+        lists = []
+        for gram in _grams(query, MAX_GRAM):
+            ids = self._postings.get(gram)
+            if not ids:
+                return []
+            lists.append(ids)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for ids in lists[1:]:
+            candidates.intersection_update(ids)
+            if not candidates:
+                break
+        return sorted(candidates)
+
+    def matched_field(self, query, record_id):
+        """First field of the record (in record order) containing ``query``, or None."""
+        for field, text in self._texts[record_id]:
+            if query in text:
+                return field
+        return None
+
+    def search(self, query):
+        """``(record_id, field)`` for every record with ``query`` in any field, in file order."""
+        query = query.lower()
+        hits = []
+        for record_id in self.candidates(query):
+            field = self.matched_field(query, record_id)
+            if field is not None:
+                hits.append((record_id, field))
+        return hits
@@ -0,0 +1,136 @@
+"""Typo-tolerant name search backed by a trigram index.
+
+Every distinct lowercased primary name, synonym and word of those is an
+entry in the index. A query is split into trigrams, the entries sharing
+the most trigrams with it become candidates, and each candidate is scored
+by normalized edit distance. So "menengitis" still finds the meningitis
+records.
+"""
+import os
+
+from common.search_index import tokenize
+
+# Edit distance allowed when the caller does not pass one, scaled by length
+DEFAULT_MAX_DISTANCE = os.getenv("FUZZY_MAX_DISTANCE")
+# Entries scored per query after trigram filtering
+MAX_CANDIDATES = 200
+DEFAULT_LIMIT = 20
+# Largest edit distance a request may ask for
+MAX_REQUESTED_DISTANCE = 5
+
+
+def trigrams(text):
+    """Trigrams of ``text`` padded with spaces so short words still get some."""
+    padded = "  %s " % text
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def allowed_distance(query):
+    """Edit distance tolerated for a query: 1 for short words, up to 3 for long ones."""
+    if DEFAULT_MAX_DISTANCE is not None:
+        return int(DEFAULT_MAX_DISTANCE)
+    if len(query) <= 4:
+        return 1
+    if len(query) <= 8:
+        return 2
+    return 3
+
+
+def requested_max_distance(value):
+    """A ``max_distance`` request value as an int clamped to ``0..MAX_REQUESTED_DISTANCE``.
+
+    None or "" means the length based default (None). Raises ``ValueError``
+    for values that are not integers.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError("max_distance must be an integer.")
+    try:
+        distance = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("max_distance must be an integer.")
+    return min(max(distance, 0), MAX_REQUESTED_DISTANCE)
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    """Trigram index over names and synonyms that returns ranked fuzzy matches."""
+
+    def __init__(self, records, fields=("primary_name", "synonyms")):
+        self.records = records
+        self._name_field = fields[0]
+        self._entries = []
+        self._entry_records = []
+        self._trigrams = {}
+        positions = {}
+        for record_id, record in enumerate(records):
+            for field in fields:
+                values = record.get(field) or []
+                if isinstance(values, str):
+                    values = [values]
+                for value in values:
+                    value = value.lower().strip()
+                    for term in [value] + tokenize(value):
+                        if len(term) < 3:
+                            continue
+                        if term not in positions:
+                            positions[term] = len(self._entries)
+                            self._entries.append(term)
+                            self._entry_records.append([])
+                            for gram in trigrams(term):
+                                self._trigrams.setdefault(gram, []).append(positions[term])
+                        ids = self._entry_records[positions[term]]
+                        if not ids or ids[-1] != record_id:
+                            ids.append(record_id)
+
+    def search(self, query, limit=DEFAULT_LIMIT, max_distance=None):
+        """Return ``(record, similarity, matched_term)`` tuples, best first.
+
+        ``similarity`` is ``1 - distance / length`` of the longer string.
+        Entries more than ``max_distance`` edits away are dropped.
+        """
+        query = query.lower().strip()
+        if not query:
+            return []
+        if max_distance is None:
+            max_distance = allowed_distance(query)
+
+        shared = {}
+        for gram in trigrams(query):
+            for entry in self._trigrams.get(gram, ()):
+                shared[entry] = shared.get(entry, 0) + 1
+        candidates = sorted(shared, key=lambda entry: -shared[entry])[:MAX_CANDIDATES]
+
+        best = {}
+        for entry in candidates:
+            term = self._entries[entry]
+            distance = edit_distance(query, term, max_distance)
+            if distance > max_distance:
+                continue
+            similarity = 1 - distance / max(len(query), len(term))
+            for record_id in self._entry_records[entry]:
+                if record_id not in best or similarity > best[record_id][0]:
+                    best[record_id] = (similarity, term)
+
+        # Ties go to the shorter name, which is usually the closer match
+        ranked = sorted(best.items(), key=lambda item: (
+            -item[1][0], len(self.records[item[0]].get(self._name_field) or ""), item[0]
+        ))[:limit]
+        return [(self.records[record_id], round(similarity, 3), term)
+                for record_id, (similarity, term) in ranked]
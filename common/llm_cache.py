@@ -0,0 +1,127 @@
+"""Bounded LRU + TTL cache for Gemini diagnosis responses.
+
+Entries are keyed on the canonical symptom set (lowercased, deduplicated
+and sorted, so "fever, headache" and "Headache,fever" share an entry) plus
+the model name and a prompt version string. Bump the prompt version when a
+route's prompt changes so stale answers are not served.
+
+The cache is tied to the data the answers were based on through
+``version``: the data the app actually has in memory, not the file on
+disk. Apps that load diseases.json once pass ``data_version(records)``;
+apps that reload through ``DatasetStore`` pass a callable such as
+``lambda: store.snapshot().digest``. The cache is dropped whenever the
+version changes.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from common.ranking import split_symptoms
+
+DEFAULT_MAXSIZE = int(os.getenv("DIAGNOSIS_CACHE_SIZE", "512"))
+DEFAULT_TTL = float(os.getenv("DIAGNOSIS_CACHE_TTL", "3600"))
+
+
+def canonical_symptoms(symptoms):
+    """Return the symptom string as a sorted tuple of unique, trimmed, lowercase items."""
+    return tuple(sorted(set(split_symptoms(symptoms))))
+
+
+def data_version(records):
+    """SHA-1 of the loaded records, for data that is loaded once at startup."""
+    return hashlib.sha1(json.dumps(records, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL, version=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._version = version if callable(version) else (lambda: version)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._data_version = self._version()
+
+    def key(self, symptoms, model, prompt_version="1"):
+        return (canonical_symptoms(symptoms), model, prompt_version)
+
+    def get(self, key):
+        """Return ``(True, value)`` for a fresh entry, otherwise ``(False, None)``."""
+        self.check_version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_call(self, symptoms, model, prompt_version, call):
+        """Return the cached response for the symptoms, calling ``call()`` on a miss."""
+        key = self.key(symptoms, model, prompt_version)
+        found, value = self.get(key)
+        if found:
+            return value
+        value = call()
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def on_invalidate(self, callback):
+        """Register ``callback()`` to run whenever the cache is invalidated."""
+        self._listeners.append(callback)
+        return callback
+
+    def invalidate(self):
+        """Drop every entry and notify the registered listeners."""
+        self.clear()
+        self.invalidations += 1
+        for callback in self._listeners:
+            callback()
+
+    def check_version(self):
+        """Invalidate the cache if the data version changed since the last check."""
+        version = self._version()
+        if version != self._data_version:
+            self._data_version = version
+            self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "data_version": self._data_version,
+        }
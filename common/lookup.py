@@ -0,0 +1,58 @@
+"""Hash indexes for exact lookups by key_id, ICD codes and names.
+
+Built once at load time so detail routes answer with a dict lookup instead
+of ``next(d for d in data if d["key_id"] == ...)`` over every record.
+
+The indexes hold record positions rather than the records themselves, so
+over a ``CompactDataset`` a worker keeps only the keys and small ints; the
+record is read from the shared mapping when a lookup returns it.
+"""
+
+
+class RecordLookup:
+    """Exact-match indexes over a list of disease records.
+
+    ``get`` returns the first record with a key_id, like the ``next()`` scans
+    it replaces. The other lookups return every matching record in file order.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.by_key_id = {}
+        self.by_icd10 = {}
+        self.by_icd9 = {}
+        self.by_name = {}
+        for record_id, record in enumerate(records):
+            self.by_key_id.setdefault(record["key_id"], record_id)
+            for code in record.get("icd10cm") or []:
+                self._add(self.by_icd10, code["code"].upper(), record_id)
+            if record.get("term_icd9_code"):
+                self._add(self.by_icd9, record["term_icd9_code"], record_id)
+            names = {(record.get("primary_name") or "").lower()}
+            names.update(synonym.lower() for synonym in record.get("synonyms") or [])
+            for name in names:
+                self._add(self.by_name, name, record_id)
+
+    @staticmethod
+    def _add(index, key, record_id):
+        index.setdefault(key, []).append(record_id)
+
+    def _records(self, ids):
+        return [self.records[record_id] for record_id in ids]
+
+    def get(self, key_id):
+        """Return the record with this key_id, or None."""
+        record_id = self.by_key_id.get(key_id)
+        return None if record_id is None else self.records[record_id]
+
+    def icd10(self, code):
+        """Records listing this ICD-10-CM code, e.g. "G02" or "g02"."""
+        return self._records(self.by_icd10.get(code.strip().upper(), ()))
+
+    def icd9(self, code):
+        """Records whose term_icd9_code is exactly ``code``."""
+        return self._records(self.by_icd9.get(code.strip(), ()))
+
+    def name(self, name):
+        """Records whose primary_name or one of its synonyms equals ``name``, ignoring case."""
+        return self._records(self.by_name.get(name.lower(), ()))
@@ -0,0 +1,321 @@
+"""Prometheus text-format metrics, aggregated across gunicorn workers.
+
+``Metrics.init_app(app)`` records, per endpoint:
+
+- request counts by method and status;
+- a latency histogram;
+- the number of requests in flight.
+
+It also adds a ``/metrics`` route. ``Metrics.wrap(site, fn)`` wraps a
+model call and records per call site:
+
+- latency;
+- outcome;
+- prompt and response size in bytes;
+- prompt, response and cached token counts from ``usage_metadata``.
+
+``Metrics.register`` exports numbers from the existing ``stats()``
+methods (response caches, context caches, singleflight, admission). A
+``hits``/``misses`` pair also gets a ``hit_ratio`` computed over all
+workers.
+
+Each worker keeps its own registry and writes it, at most every
+METRICS_FLUSH_SECONDS, to ``METRICS_DIR/<app>/<pid>.json``. ``/metrics``
+merges the files of the live workers: counters, histograms and gauges
+are summed. Files of workers that have exited are removed, which
+Prometheus sees as a counter reset.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import Response, g, request
+
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "metrics"))
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_SECONDS", "1"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name -> (type, help) for the built-in families
+FAMILIES = {
+    "http_requests_total": ("counter", "HTTP requests by endpoint, method and status."),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by endpoint."),
+    "http_requests_in_flight": ("gauge", "HTTP requests being handled by endpoint."),
+    "model_calls_total": ("counter", "Model calls by call site and outcome."),
+    "model_call_duration_seconds": ("histogram", "Model call latency by call site."),
+    "model_prompt_bytes": ("histogram", "Size of the prompt sent per model call."),
+    "model_response_bytes": ("histogram", "Size of the response text per model call."),
+    "model_prompt_tokens_total": ("counter", "Prompt tokens reported by the model."),
+    "model_response_tokens_total": ("counter", "Response tokens reported by the model."),
+    "model_cached_tokens_total": ("counter", "Prompt tokens served from cached content."),
+}
+
+
+def payload_size(contents):
+    """Bytes of a prompt: strings, lists of parts, dicts, or anything str() can render."""
+    if contents is None:
+        return 0
+    if isinstance(contents, str):
+        return len(contents.encode("utf-8"))
+    if isinstance(contents, (list, tuple)):
+        return sum(payload_size(part) for part in contents)
+    if isinstance(contents, dict):
+        return len(json.dumps(contents, default=str).encode("utf-8"))
+    return len(str(contents).encode("utf-8"))
+
+
+def _response_text(response):
+    try:
+        return response.text or ""
+    except (AttributeError, ValueError):
+        # google-generativeai raises ValueError for blocked or empty candidates
+        return ""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Per-worker registry that writes snapshots for ``/metrics`` to merge."""
+
+    def __init__(self, app_name, directory=METRICS_DIR, flush_interval=FLUSH_INTERVAL):
+        self.directory = os.path.join(directory, app_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.flush_interval = flush_interval
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._collectors = []
+        self._types = dict(FAMILIES)
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    # Recording
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge_add(self, name, labels=None, delta=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = {"buckets": list(buckets),
+                                                 "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(entry["buckets"]):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def register(self, prefix, stats, keys, labels=None, group=None):
+        """Export ``stats()[key]`` as gauge ``<prefix>_<name>`` at every flush.
+
+        ``keys`` is a tuple of stat names or a dict of exported name -> stat
+        name. With ``group``, ``stats()`` returns ``{group value: stats}``
+        and each entry is exported with a ``group`` label.
+        """
+        keys = keys if isinstance(keys, dict) else {key: key for key in keys}
+        for name in keys:
+            self._types.setdefault(f"{prefix}_{name}", ("gauge", f"{name} from {prefix} stats."))
+        self._collectors.append((prefix, stats, keys, labels or {}, group))
+
+    def wrap(self, site, fn):
+        """``fn`` with its latency, outcome, payload sizes and token usage recorded under ``site``."""
+        def call(*args, **kwargs):
+            labels = {"site": site}
+            contents = kwargs.get("contents", args[0] if args else None)
+            self.observe("model_prompt_bytes", labels, payload_size(contents), SIZE_BUCKETS)
+            started = time.perf_counter()
+            try:
+                response = fn(*args, **kwargs)
+            except Exception:
+                self.observe("model_call_duration_seconds", labels, time.perf_counter() - started)
+                self.inc("model_calls_total", {"site": site, "outcome": "error"})
+                raise
+            self.observe("model_call_duration_seconds", labels, time.perf_counter() - started)
+            self.inc("model_calls_total", {"site": site, "outcome": "ok"})
+            self.observe("model_response_bytes", labels, payload_size(_response_text(response)), SIZE_BUCKETS)
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                self.inc("model_prompt_tokens_total", labels, getattr(usage, "prompt_token_count", 0) or 0)
+                self.inc("model_response_tokens_total", labels, getattr(usage, "candidates_token_count", 0) or 0)
+                self.inc("model_cached_tokens_total", labels, getattr(usage, "cached_content_token_count", 0) or 0)
+            return response
+        return call
+
+    # Flask integration
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        app.add_url_rule("/metrics", "metrics", self.view)
+
+    def _before(self):
+        endpoint = request.endpoint or "unmatched"
+        g.metrics_request = (endpoint, time.perf_counter())
+        self.gauge_add("http_requests_in_flight", {"endpoint": endpoint})
+
+    def _after(self, response):
+        endpoint, started = g.get("metrics_request", (request.endpoint or "unmatched", None))
+        if started is not None:
+            self.observe("http_request_duration_seconds", {"endpoint": endpoint},
+                         time.perf_counter() - started)
+        self.inc("http_requests_total", {"endpoint": endpoint, "method": request.method,
+                                         "status": response.status_code})
+        return response
+
+    def _teardown(self, exc=None):
+        tracked = g.pop("metrics_request", None)
+        if tracked is not None:
+            self.gauge_add("http_requests_in_flight", {"endpoint": tracked[0]}, -1)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+    # Snapshots and aggregation
+
+    def _collected(self):
+        values = []
+        for prefix, stats, keys, labels, group in self._collectors:
+            try:
+                result = stats()
+            except Exception as e:
+                print(f"Metrics collector {prefix} failed: {e}")
+                continue
+            entries = result.items() if group else [(None, result)]
+            for group_value, entry in entries:
+                entry_labels = dict(labels, **({group: group_value} if group else {}))
+                for name, key in keys.items():
+                    value = entry.get(key)
+                    if isinstance(value, (bool, int, float)):
+                        values.append([f"{prefix}_{name}", sorted(entry_labels.items()), float(value)])
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "types": self._types,
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, labels, value] for (name, labels), value in self._gauges.items()]
+                          + self._collected(),
+                "histograms": [[name, labels, entry] for (name, labels), entry in self._histograms.items()],
+            }
+
+    def flush(self):
+        """Write this worker's snapshot where ``/metrics`` can merge it."""
+        self._last_flush = time.monotonic()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not write metrics snapshot: {e}")
+
+    def _snapshots(self):
+        self.flush()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                pid = int(filename[:-5])
+            except ValueError:
+                continue
+            if not _pid_alive(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def render(self):
+        """Prometheus text exposition of all live workers' metrics."""
+        types = dict(self._types)
+        samples = {}
+        histograms = {}
+        for snapshot in self._snapshots():
+            types.update(snapshot.get("types", {}))
+            for name, labels, value in snapshot["counters"] + snapshot["gauges"]:
+                key = (name, tuple(map(tuple, labels)))
+                samples[key] = samples.get(key, 0) + value
+            for name, labels, entry in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, {"buckets": entry["buckets"],
+                                                     "counts": [0] * len(entry["buckets"]),
+                                                     "sum": 0.0, "count": 0})
+                merged["counts"] = [a + b for a, b in zip(merged["counts"], entry["counts"])]
+                merged["sum"] += entry["sum"]
+                merged["count"] += entry["count"]
+
+        # Hit ratio over all workers for every hits/misses pair
+        for (name, labels), hits in list(samples.items()):
+            if name.endswith("_hits"):
+                prefix = name[:-len("_hits")]
+                misses = samples.get((f"{prefix}_misses", labels), 0)
+                samples[(f"{prefix}_hit_ratio", labels)] = hits / (hits + misses) if hits + misses else 0.0
+                types.setdefault(f"{prefix}_hit_ratio", ("gauge", f"Hit ratio of {prefix} across workers."))
+
+        families = {}
+        for (name, labels), value in samples.items():
+            families.setdefault(name, []).append(f"{name}{_labels_text(labels)} {_number(value)}")
+        for (name, labels), entry in histograms.items():
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(entry["buckets"], entry["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels_text(labels + (('le', '+Inf'),))} {entry['count']}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {_number(entry['sum'])}")
+            lines.append(f"{name}_count{_labels_text(labels)} {entry['count']}")
+
+        out = []
+        for name in sorted(families):
+            kind, help_text = types.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(families[name])
+        return "\n".join(out) + "\n"
@@ -0,0 +1,114 @@
+"""Bounded, relevance ranked result pages for the search routes.
+
+Search routes used to return every match. ``page_params`` reads
+``limit``/``offset`` with a default and a hard cap, and ``top_k`` picks one
+page from scored matches with a fixed size heap. Callers pass the hits that
+are known to score highest (e.g. exact name matches from a hash lookup)
+as ``seeds`` and the best score any remaining hit can reach as ``bound``.
+The scan then stops as soon as the heap is full of hits no later record
+could outrank. When it stops early the total is extrapolated from the
+share of candidates scanned instead of being counted.
+"""
+import heapq
+import os
+
+DEFAULT_LIMIT = int(os.getenv("SEARCH_LIMIT_DEFAULT", "50"))
+MAX_LIMIT = int(os.getenv("SEARCH_LIMIT_MAX", "200"))
+
+# Relevance of a hit, best first
+EXACT = 3
+PREFIX = 2
+CONTAINS = 1
+
+
+def page_params(args, default_limit=DEFAULT_LIMIT, max_limit=MAX_LIMIT):
+    """Return ``(limit, offset)`` from request args or a JSON body.
+
+    ``limit`` is clamped to ``1..max_limit``. Raises ``ValueError`` for values
+    that are not integers.
+    """
+    try:
+        limit = int(args.get("limit", default_limit))
+        offset = int(args.get("offset", 0))
+    except (TypeError, ValueError):
+        raise ValueError("limit and offset must be integers.")
+    return min(max(limit, 1), max_limit), max(offset, 0)
+
+
+def relevance(query, values):
+    """EXACT, PREFIX or CONTAINS for the best of ``values`` the query occurs in, else 0."""
+    best = 0
+    for value in values:
+        if query in value:
+            if value == query:
+                return EXACT
+            best = max(best, PREFIX if value.startswith(query) else CONTAINS)
+    return best
+
+
+class Page:
+    """One page of ranked ids plus the total number of matches.
+
+    ``total_exact`` is False when the scan stopped early and ``total`` is an
+    extrapolated estimate.
+    """
+
+    def __init__(self, ids, total, total_exact, limit, offset):
+        self.ids = ids
+        self.total = total
+        self.total_exact = total_exact
+        self.limit = limit
+        self.offset = offset
+
+    def headers(self):
+        """Response headers describing the page, so list-shaped JSON bodies stay unchanged."""
+        return {
+            "X-Total-Count": str(self.total),
+            "X-Total-Exact": "true" if self.total_exact else "false",
+            "X-Limit": str(self.limit),
+            "X-Offset": str(self.offset),
+        }
+
+
+def top_k(scored, limit, offset=0, seeds=(), bound=EXACT, candidates=None):
+    """Pick the ``offset:offset + limit`` slice of the best hits.
+
+    ``scored`` yields ``(score, record_id)`` in ascending record id order,
+    with score 0 for non-matches. ``seeds`` are ``(score, record_id)`` hits
+    found up front and skipped by ``scored``. ``bound`` is the highest score
+    ``scored`` can still produce. ``candidates`` is how many items
+    ``scored`` would yield in total, used to extrapolate the total.
+    Ties go to the lower record id, i.e. file order.
+    """
+    want = offset + limit
+    # Min-heap of the best ``want`` hits; -record_id makes earlier records win ties
+    heap = []
+    matched = 0
+    for score, record_id in seeds:
+        matched += 1
+        _push(heap, want, (score, -record_id))
+    seen = 0
+    complete = True
+    for score, record_id in scored:
+        if len(heap) >= want and heap[0][0] >= bound:
+            complete = False
+            break
+        seen += 1
+        if score:
+            matched += 1
+            _push(heap, want, (score, -record_id))
+
+    ranked = [-negative_id for _, negative_id in sorted(heap, reverse=True)]
+    if complete or not candidates:
+        total = matched
+    else:
+        seeded = len(seeds)
+        total = seeded + round((matched - seeded) * candidates / max(seen, 1))
+    return Page(ranked[offset:], total, complete, limit, offset)
+
+
+def _push(heap, size, item):
+    if len(heap) < size:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
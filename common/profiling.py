@@ -0,0 +1,264 @@
+"""Opt-in per-request profiling for the Flask apps.
+
+``install_profiler(app, name)`` wraps ``app.wsgi_app``, so no view has to
+change. A request is profiled when:
+
+- it carries ``X-Profile: <PROFILE_TOKEN>`` (off while PROFILE_TOKEN is
+  unset), or
+- it is picked by 1-in-PROFILE_SAMPLE_N sampling (0 turns sampling off).
+
+The profile covers the view and the iteration of a streamed body. Two
+files are written under ``PROFILE_DIR/<app>/``:
+
+- ``<id>.pstats``: cProfile output, for ``python -m pstats`` or snakeviz.
+- ``<id>.collapsed``: stacks sampled every PROFILE_INTERVAL_MS, one
+  ``frame;frame;frame count`` line per stack, ready for flamegraph.pl or
+  speedscope.
+
+Each worker profiles one request at a time; requests that would be
+profiled meanwhile run unprofiled. Only the newest PROFILE_KEEP profiles
+are kept. The profile id is returned in the ``X-Profile-Id`` header.
+``/_profiles`` lists the saved files and ``/_profiles/<file>`` downloads
+one. Both require the token. It is only accepted in the header: a query
+parameter would end up in access logs and proxy logs.
+"""
+import cProfile
+import hmac
+import itertools
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from flask import abort, jsonify, request, send_from_directory
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "profiles"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+SAMPLE_N = int(os.getenv("PROFILE_SAMPLE_N", "0"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+HEADER = "HTTP_X_PROFILE"
+UNSAFE_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer and counts collapsed stacks."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        # Only count samples while the request's own code runs
+        self.running = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.running:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+class _Session:
+    """One profiled request: cProfile plus the stack sampler, saved on finish."""
+
+    def __init__(self, middleware, environ):
+        self.middleware = middleware
+        path = UNSAFE_RE.sub("_", environ.get("PATH_INFO", "/")).strip("_") or "root"
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(middleware.sequence)}-{path[:60]}"
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), middleware.interval)
+        self.started = time.perf_counter()
+        self.finished = False
+
+    def resume(self):
+        self.sampler.running = True
+        self.profile.enable()
+
+    def pause(self):
+        self.profile.disable()
+        self.sampler.running = False
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.pause()
+        self.sampler.stop()
+        elapsed = time.perf_counter() - self.started
+        try:
+            self.middleware.save(self, elapsed)
+        finally:
+            self.middleware.active.release()
+
+
+class _ProfiledBody:
+    """Response iterable that keeps profiling while a streamed body is produced."""
+
+    def __init__(self, body, session):
+        self.body = body
+        self.session = session
+        self.iterator = iter(body)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.session.resume()
+        try:
+            return next(self.iterator)
+        finally:
+            self.session.pause()
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self.session.finish()
+
+
+class ProfilerMiddleware:
+    """WSGI middleware that profiles authorized or sampled requests."""
+
+    def __init__(self, wsgi_app, directory, token=PROFILE_TOKEN, sample_n=SAMPLE_N,
+                 interval=SAMPLE_INTERVAL, keep=KEEP):
+        self.wsgi_app = wsgi_app
+        self.directory = directory
+        self.token = token
+        self.sample_n = sample_n
+        self.interval = interval
+        self.keep = keep
+        self.sequence = itertools.count(1)
+        # cProfile cannot run two profiles at once in one interpreter
+        self.active = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def authorized(self, environ):
+        if not self.token:
+            return False
+        supplied = environ.get(HEADER)
+        if supplied is None:
+            return False
+        return hmac.compare_digest(supplied.encode("utf-8"), self.token.encode("utf-8"))
+
+    def wanted(self, environ):
+        if environ.get("PATH_INFO", "").startswith("/_profiles"):
+            return False
+        if self.authorized(environ):
+            return True
+        return self.sample_n > 0 and random.randrange(self.sample_n) == 0
+
+    def __call__(self, environ, start_response):
+        if not self.wanted(environ) or not self.active.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+
+        session = _Session(self, environ)
+
+        def start_profiled(status, headers, exc_info=None):
+            return start_response(status, headers + [("X-Profile-Id", session.id)], exc_info)
+
+        session.sampler.start()
+        session.resume()
+        try:
+            body = self.wsgi_app(environ, start_profiled)
+        except BaseException:
+            session.finish()
+            raise
+        finally:
+            session.pause()
+        return _ProfiledBody(body, session)
+
+    def save(self, session, elapsed):
+        base = os.path.join(self.directory, session.id)
+        try:
+            session.profile.dump_stats(base + ".pstats")
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                f.write(session.sampler.collapsed())
+        except OSError as e:
+            print(f"Could not save profile {session.id}: {e}")
+            return
+        print(f"Profiled request {session.id} in {elapsed * 1000:.1f} ms")
+        self._prune()
+
+    def _prune(self):
+        saved = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pstats"):
+                try:
+                    saved.append((os.path.getmtime(os.path.join(self.directory, name)), name[:-len(".pstats")]))
+                except OSError:
+                    continue
+        saved.sort()
+        for _, profile_id in saved[:max(0, len(saved) - self.keep)]:
+            for ext in (".pstats", ".collapsed"):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + ext))
+                except OSError:
+                    pass
+
+    def listing(self):
+        """Saved profiles, newest first, with their download links."""
+        profiles = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pstats"):
+                continue
+            profile_id = name[:-len(".pstats")]
+            path = os.path.join(self.directory, name)
+            profiles.append({
+                "id": profile_id,
+                "created": os.path.getmtime(path),
+                "pstats": f"/_profiles/{profile_id}.pstats",
+                "collapsed": f"/_profiles/{profile_id}.collapsed",
+                "size": os.path.getsize(path),
+            })
+        # Newest first
+        profiles.sort(key=lambda profile: profile["created"], reverse=True)
+        return profiles
+
+
+def install_profiler(app, name, directory=PROFILE_DIR, **options):
+    """Wrap ``app.wsgi_app`` with ``ProfilerMiddleware`` and add the /_profiles routes."""
+    middleware = ProfilerMiddleware(app.wsgi_app, os.path.join(directory, name), **options)
+    app.wsgi_app = middleware
+
+    def require_token():
+        if not middleware.authorized(request.environ):
+            abort(404)
+
+    def list_profiles():
+        require_token()
+        return jsonify(middleware.listing())
+
+    def download_profile(filename):
+        require_token()
+        if not filename.endswith((".pstats", ".collapsed")):
+            abort(404)
+        return send_from_directory(middleware.directory, filename, as_attachment=True)
+
+    app.add_url_rule("/_profiles", "list_profiles", list_profiles)
+    app.add_url_rule("/_profiles/<path:filename>", "download_profile", download_profile)
+    return middleware
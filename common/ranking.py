@@ -0,0 +1,156 @@
+"""Local candidate ranking for the Gemini diagnosis routes.
+
+Instead of putting the whole of diseases.json into every prompt, the
+diagnosis routes first ask a ``SymptomRanker`` for the top N records for
+the symptom string and only send that shortlist to the model.
+
+Symptoms that share no word with the data ("zzz", a phrase in another
+language) still get an answer: the model is shown a default candidate set
+of the records with the broadest symptom lists instead of the shortlist.
+"""
+import bisect
+import math
+import os
+import time
+
+from common.search_index import SearchIndex, tokenize
+
+# Number of candidate records sent to the model, overridable per deployment
+DEFAULT_SHORTLIST_SIZE = int(os.getenv("DIAGNOSIS_SHORTLIST_SIZE", "30"))
+# Upper bound for the shortlist once it has been widened
+MAX_SHORTLIST_SIZE = int(os.getenv("DIAGNOSIS_SHORTLIST_MAX", "240"))
+# How much the shortlist grows on each low confidence retry
+WIDEN_FACTOR = 4
+# Seconds one diagnosis may spend on the model across its widening retries
+WIDEN_BUDGET = float(os.getenv("DIAGNOSIS_WIDEN_BUDGET", "30"))
+
+STOPWORDS = {"a", "an", "and", "are", "for", "has", "have", "i", "in", "is", "my",
+             "of", "on", "or", "the", "to", "with"}
+
+# Query tokens at least this long also match indexed words they prefix,
+# so "vomit" finds "vomiting"
+MIN_PREFIX_LENGTH = 4
+
+
+def split_symptoms(symptoms):
+    """Split a free text symptom string on commas and semicolons."""
+    parts = symptoms.replace(";", ",").split(",")
+    return [part.strip().lower() for part in parts if part.strip()]
+
+
+class SymptomRanker:
+    """Scores records against a symptom string using IDF weighted word matches."""
+
+    def __init__(self, records, index=None):
+        self.records = records
+        self.index = index or SearchIndex(records)
+        self._total = max(len(records), 1)
+        self._broadest = None
+
+    def _idf(self, ids):
+        return math.log(1 + self._total / (1 + len(ids)))
+
+    def _token_matches(self, token):
+        ids = set(self.index.token_ids(token))
+        if len(token) >= MIN_PREFIX_LENGTH:
+            vocabulary = self.index.vocabulary()
+            start = bisect.bisect_left(vocabulary, token)
+            for word in vocabulary[start:]:
+                if not word.startswith(token):
+                    break
+                ids.update(self.index.token_ids(word))
+        return ids
+
+    def _matches(self, symptoms, memo):
+        """Yield ``(record_ids, weight)`` for each phrase and word of the symptom string.
+
+        ``memo`` maps phrases and tokens to their matches, so a batch of
+        symptom sets looks each distinct term up only once.
+        """
+        for phrase in split_symptoms(symptoms):
+            # Whole phrase hits ("stiff neck") outweigh scattered word hits
+            if ("phrase", phrase) not in memo:
+                ids = self.index.search_ids(phrase)
+                memo[("phrase", phrase)] = (ids, 2 * self._idf(ids))
+            yield memo[("phrase", phrase)]
+            for token in tokenize(phrase):
+                if token in STOPWORDS:
+                    continue
+                if ("token", token) not in memo:
+                    ids = self._token_matches(token)
+                    memo[("token", token)] = (ids, self._idf(ids))
+                yield memo[("token", token)]
+
+    def rank(self, symptoms, limit=DEFAULT_SHORTLIST_SIZE, memo=None):
+        """Return ``(score, record_id)`` pairs for the best ``limit`` records."""
+        scores = {}
+        for ids, weight in self._matches(symptoms, {} if memo is None else memo):
+            for record_id in ids:
+                scores[record_id] = scores.get(record_id, 0.0) + weight
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, record_id) for record_id, score in ranked[:limit]]
+
+    def shortlist(self, symptoms, limit=DEFAULT_SHORTLIST_SIZE):
+        """Return the top ``limit`` records for the symptom string."""
+        return [self.records[record_id] for _, record_id in self.rank(symptoms, limit)]
+
+    def default_candidates(self, limit=DEFAULT_SHORTLIST_SIZE):
+        """Records with the most listed symptoms, for symptom strings nothing matches."""
+        if self._broadest is None:
+            def breadth(record_id):
+                symptoms = (self.records[record_id].get("word_synonyms") or "").split(";")
+                return -sum(1 for symptom in symptoms if symptom.strip()), record_id
+            self._broadest = sorted(range(len(self.records)), key=breadth)
+        return [self.records[record_id] for record_id in self._broadest[:limit]]
+
+    def shortlist_or_default(self, symptoms, limit=DEFAULT_SHORTLIST_SIZE):
+        """``(candidates, matched)``: the shortlist, or the default candidates when it is empty."""
+        candidates = self.shortlist(symptoms, limit)
+        if candidates:
+            return candidates, True
+        return self.default_candidates(limit), False
+
+    def shortlist_many(self, symptom_sets, limit=DEFAULT_SHORTLIST_SIZE):
+        """Shortlists for several symptom strings in one pass, sharing term lookups."""
+        memo = {}
+        return [[self.records[record_id] for _, record_id in self.rank(symptoms, limit, memo)]
+                for symptoms in symptom_sets]
+
+
+def is_low_confidence(results, candidates):
+    """True when the model found nothing, or nothing it returned came from the shortlist."""
+    if not results:
+        return True
+    candidate_ids = {candidate.get("key_id") for candidate in candidates}
+    return not any(isinstance(item, dict) and item.get("key_id") in candidate_ids
+                   for item in results)
+
+
+def diagnose_with_shortlist(ask, ranker, symptoms, size=None, max_size=None, budget=None):
+    """Run ``ask(candidates)`` on a local shortlist, widening it while the answer is weak.
+
+    ``ask`` sends the candidate records to the model and returns the parsed
+    list of diagnoses. The shortlist grows by ``WIDEN_FACTOR`` until the
+    model answers with records from it or ``max_size`` is reached. A wider
+    retry only starts if another call as long as the last one still fits in
+    ``budget`` seconds. When no record matches the symptoms at all, the
+    model is asked once with ``ranker.default_candidates``.
+    """
+    size = size or DEFAULT_SHORTLIST_SIZE
+    max_size = max(max_size or MAX_SHORTLIST_SIZE, size)
+    budget = WIDEN_BUDGET if budget is None else budget
+    started = time.monotonic()
+    while True:
+        call_started = time.monotonic()
+        candidates, matched = ranker.shortlist_or_default(symptoms, size)
+        results = ask(candidates)
+        if not matched or not is_low_confidence(results, candidates) or size >= max_size:
+            return results
+        if len(candidates) < size:
+            # The ranker has no more matching records to offer
+            return results
+        now = time.monotonic()
+        if now - started + (now - call_started) > budget:
+            return results
+        size = min(size * WIDEN_FACTOR, max_size)
@@ -0,0 +1,292 @@
+"""Deadlines, retries and a circuit breaker around Gemini calls.
+
+``ModelGuard.call(fn, *args, **kwargs)`` runs one SDK call with:
+
+- A per-attempt deadline (GEMINI_TIMEOUT seconds). It is passed to the SDK
+  by the guard's ``sdk_timeout`` adapter (``genai_timeout``,
+  ``generativeai_timeout`` or ``context_cache_timeout``), so a hung HTTP
+  request is cancelled rather than left running. The call also runs on a
+  small thread pool, and the worker stops waiting shortly after the
+  deadline even if the SDK does not honour it.
+- Retries of transient failures (timeouts, 429 and 5xx) with full-jitter
+  exponential backoff. No retry starts once the total latency budget
+  (GEMINI_BUDGET seconds) would be exceeded.
+- ``ModelGuard.stream`` does the same for streaming calls, which send
+  their request on first iteration: the first chunk is fetched under the
+  guard and the stream's outcome is recorded when it ends.
+- A circuit breaker over a rolling window of recent calls. It opens when
+  the error rate or the slow-call rate passes its threshold, fails fast
+  while open, and lets a single trial call through after
+  CIRCUIT_OPEN_SECONDS. Only the trial's result closes or reopens it;
+  calls admitted before it opened are ignored when they finish. Errors
+  that say nothing about the model's health (4xx, safety blocks) do not
+  count as failures.
+
+Failures the caller can degrade on raise ``ModelUnavailable``. The
+diagnosis routes catch it and answer from the local ranker with
+``degraded_results``. Routes with nothing to fall back on answer with
+``unavailable_response()``: a 503 with ``Retry-After``.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import jsonify
+
+DEFAULT_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "20"))
+DEFAULT_BUDGET = float(os.getenv("GEMINI_BUDGET", "45"))
+DEFAULT_RETRIES = int(os.getenv("GEMINI_RETRIES", "2"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# Extra wait for an SDK that was given the deadline to raise its own timeout
+SDK_GRACE = 2.0
+
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_SLOW_RATE = float(os.getenv("CIRCUIT_SLOW_RATE", "0.5"))
+CIRCUIT_SLOW_SECONDS = float(os.getenv("CIRCUIT_SLOW_SECONDS", "10"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+# Records returned by degraded_results when the model is unavailable
+DEGRADED_RESULTS = 5
+DEGRADED_HEADERS = {"X-Degraded": "true"}
+UNAVAILABLE_RETRY_AFTER = int(os.getenv("GEMINI_RETRY_AFTER", "30"))
+# First chunk of a stream that had none
+_END = object()
+
+TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+TRANSIENT_NAMES = {"DeadlineExceeded", "InternalServerError", "ResourceExhausted",
+                   "ServiceUnavailable", "ServerError", "TooManyRequests",
+                   # Raised by httpx (google-genai) and requests when the SDK deadline passes
+                   "ConnectError", "ConnectTimeout", "ConnectionError", "PoolTimeout", "ReadTimeout",
+                   "RemoteProtocolError", "Timeout", "TimeoutException", "WriteTimeout"}
+
+
+class ModelUnavailable(Exception):
+    """The model could not answer in time; callers should fall back."""
+
+
+class CircuitOpenError(ModelUnavailable):
+    """The circuit breaker is open and the call was not attempted."""
+
+
+def is_transient(error):
+    """True for timeouts, connection errors, HTTP 408/429/5xx and the SDKs' equivalents."""
+    if isinstance(error, (TimeoutError, FutureTimeout, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    if callable(code):
+        # google.api_core exceptions expose the gRPC code as a method
+        code = getattr(error, "grpc_status_code", None)
+    if isinstance(code, int) and code in TRANSIENT_CODES:
+        return True
+    return type(error).__name__ in TRANSIENT_NAMES
+
+
+def genai_timeout(kwargs, seconds):
+    """``google-genai``: the deadline as ``config.http_options.timeout``, in milliseconds."""
+    http_options = {"timeout": max(1, int(seconds * 1000))}
+    config = kwargs.get("config")
+    if config is None:
+        kwargs["config"] = {"http_options": http_options}
+    elif isinstance(config, dict):
+        kwargs["config"] = dict(config, http_options=http_options)
+    else:
+        from google.genai import types
+        kwargs["config"] = config.model_copy(update={"http_options": types.HttpOptions(**http_options)})
+    return kwargs
+
+
+def generativeai_timeout(kwargs, seconds):
+    """``google-generativeai``: the deadline as ``request_options={"timeout": ...}``."""
+    kwargs["request_options"] = dict(kwargs.get("request_options") or {}, timeout=seconds)
+    return kwargs
+
+
+def context_cache_timeout(kwargs, seconds):
+    """``ContextCache.generate_content``: the deadline as its ``timeout`` argument."""
+    kwargs["timeout"] = seconds
+    return kwargs
+
+
+class CircuitBreaker:
+    """Closed -> open on a high error or slow-call rate -> half-open after a cooldown."""
+
+    def __init__(self, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS,
+                 error_rate=CIRCUIT_ERROR_RATE, slow_rate=CIRCUIT_SLOW_RATE,
+                 slow_seconds=CIRCUIT_SLOW_SECONDS, open_seconds=CIRCUIT_OPEN_SECONDS):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self._calls = deque(maxlen=window)
+        self._opened_at = None
+        # Token of the half-open trial call and when it was admitted
+        self._trial = None
+        self._trial_at = None
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.open_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Admission token for a call that may go ahead now, or None.
+
+        The token is handed back to ``record`` or ``release`` when the call ends.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            now = time.monotonic()
+            # A trial that never reported back does not block the breaker forever
+            if state == "half-open" and (self._trial is None or now - self._trial_at >= self.open_seconds):
+                self._trial = object()
+                self._trial_at = now
+                return self._trial
+            return None
+
+    def record(self, ok, seconds, token=True):
+        """Count a finished call. While open, only the trial's result changes the state."""
+        with self._lock:
+            if self._opened_at is not None:
+                if token is None or token is not self._trial:
+                    # Admitted before the breaker opened, or a superseded trial
+                    return
+                self._trial = None
+                if ok and seconds < self.slow_seconds:
+                    self._opened_at = None
+                    self._calls.clear()
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._calls.append((ok, seconds >= self.slow_seconds))
+            if len(self._calls) < self.min_calls:
+                return
+            errors = sum(1 for ok, _ in self._calls if not ok) / len(self._calls)
+            slow = sum(1 for _, is_slow in self._calls if is_slow) / len(self._calls)
+            if errors >= self.error_rate or slow >= self.slow_rate:
+                self._opened_at = time.monotonic()
+                self.trips += 1
+                print(f"Circuit breaker opened: {errors:.0%} errors, {slow:.0%} slow calls")
+
+    def release(self, token):
+        """End a call without counting it, e.g. one rejected with a client error."""
+        with self._lock:
+            if token is not None and token is self._trial:
+                self._trial = None
+
+    def stats(self):
+        return {"state": self.state, "recent_calls": len(self._calls), "trips": self.trips}
+
+
+class ModelGuard:
+    """Runs model calls with a deadline, retries within a budget and a circuit breaker."""
+
+    def __init__(self, name, sdk_timeout=None, timeout=DEFAULT_TIMEOUT, budget=DEFAULT_BUDGET,
+                 retries=DEFAULT_RETRIES, breaker=None, max_workers=8):
+        self.name = name
+        # Adds the per-attempt deadline to the call's keyword arguments
+        self.sdk_timeout = sdk_timeout
+        self.timeout = timeout
+        self.budget = budget
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=f"{name}-model")
+
+    def call(self, fn, *args, **kwargs):
+        """Return ``fn(*args, **kwargs)`` or raise ``ModelUnavailable`` / the non-transient error."""
+        result, seconds, token = self._attempts(fn, args, kwargs)
+        self.breaker.record(True, seconds, token)
+        return result
+
+    def stream(self, fn, *args, **kwargs):
+        """Guarded ``fn(*args, **kwargs)`` for SDK calls that return a lazy stream of chunks.
+
+        Creating the stream sends nothing, so the first chunk is pulled
+        inside the guarded call: the request, its deadline and retries all
+        apply to it. The rest is relayed as it is iterated, and how the
+        stream ended is reported to the breaker.
+        """
+        def start(*args, **kwargs):
+            chunks = iter(fn(*args, **kwargs))
+            return chunks, next(chunks, _END)
+
+        (chunks, first), seconds, token = self._attempts(start, args, kwargs)
+        return self._relay(chunks, first, seconds, token)
+
+    def _relay(self, chunks, first, seconds, token):
+        # A long answer is not a slow call; time to first chunk is what counts
+        ok = True
+        try:
+            if first is not _END:
+                yield first
+            yield from chunks
+        except Exception as e:
+            ok = False
+            if not is_transient(e):
+                self.breaker.release(token)
+                token = None
+            raise
+        finally:
+            if token is not None:
+                self.breaker.record(ok, seconds, token)
+
+    def _attempts(self, fn, args, kwargs):
+        """``(result, seconds, token)`` of the first attempt that succeeds; failures are recorded."""
+        deadline = time.monotonic() + self.budget
+        attempt = 0
+        while True:
+            token = self.breaker.allow()
+            if token is None:
+                raise CircuitOpenError(f"{self.name}: model calls are paused by the circuit breaker")
+            timeout = min(self.timeout, deadline - time.monotonic())
+            call_kwargs = kwargs
+            wait = timeout
+            if self.sdk_timeout is not None:
+                call_kwargs = self.sdk_timeout(dict(kwargs), timeout)
+                wait = timeout + SDK_GRACE
+            started = time.monotonic()
+            try:
+                result = self._executor.submit(fn, *args, **call_kwargs).result(timeout=wait)
+            except Exception as e:
+                if not is_transient(e):
+                    # The model answered; the request itself was refused
+                    self.breaker.release(token)
+                    raise
+                self.breaker.record(False, time.monotonic() - started, token)
+                # Full jitter keeps retrying workers from hitting the API in step
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+                if attempt > self.retries or time.monotonic() + delay >= deadline:
+                    print(f"{self.name}: model call failed after {attempt} attempt(s): {e!r}")
+                    raise ModelUnavailable(f"{self.name}: model did not answer in time") from e
+                time.sleep(delay)
+                continue
+            return result, time.monotonic() - started, token
+
+
+def unavailable_response(error=None):
+    """503 answer for a route that cannot do without the model; also usable as an error handler."""
+    response = jsonify({"error": "The AI model is unavailable right now, please try again shortly."})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(UNAVAILABLE_RETRY_AFTER)
+    return response
+
+
+def degraded_results(ranker, symptoms, limit=DEGRADED_RESULTS):
+    """Locally ranked records flagged as degraded, for when the model is unavailable."""
+    return [dict(ranker.records[record_id], score=round(score, 3), degraded=True)
+            for score, record_id in ranker.rank(symptoms, limit)]
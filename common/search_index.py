@@ -0,0 +1,178 @@
+"""Inverted index over diseases.json for symptom and name searches.
+
+The index is built once when the data is loaded. It maps lowercased
+n-grams, word tokens and whole values of ``primary_name``, ``synonyms``
+and ``word_synonyms`` to posting lists of record ids (positions in the
+original list). Substring searches look up the n-grams of the query to get
+a small candidate set and then confirm each candidate with a plain ``in``
+check, so results are exactly what the old linear scans returned, in file
+order.
+
+The posting keys (grams, tokens, whole entries) are built in each process.
+The lowercased field values used for those checks are kept too unless
+``cache_values=False``; then they are read back from the records, which
+over a ``CompactDataset`` decodes them from the shared mapping instead of
+holding a second copy of every string per worker.
+"""
+import re
+
+from common.paging import CONTAINS, EXACT, PREFIX, relevance, top_k
+
+FIELDS = ("primary_name", "synonyms", "word_synonyms")
+
+# Queries of up to this many characters are answered straight from the
+# gram postings; longer queries intersect the postings of their trigrams.
+MAX_GRAM = 3
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def field_values(record, field):
+    """Return the lowercased strings stored under a field as a list."""
+    value = record.get(field)
+    if not value:
+        return [""] if field != "synonyms" else []
+    if isinstance(value, str):
+        # Some copies of the data keep synonyms as one comma separated string
+        return value.lower().split(",") if field == "synonyms" else [value.lower()]
+    return [str(item).lower() for item in value]
+
+
+def field_elements(record, field):
+    """Return the discrete entries of a field, e.g. ``word_synonyms`` split on ';'."""
+    if field == "word_synonyms":
+        return (record.get(field) or "").lower().split(";")
+    return field_values(record, field)
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric word tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class SearchIndex:
+    """Posting lists of record ids keyed by gram, token and whole value."""
+
+    def __init__(self, records, fields=FIELDS, cache_values=True):
+        self.records = records
+        self.fields = tuple(fields)
+        self._values = {field: [] for field in self.fields} if cache_values else None
+        self._grams = {field: {} for field in self.fields}
+        self._elements = {field: {} for field in self.fields}
+        self._tokens = {}
+
+        for record_id, record in enumerate(records):
+            for field in self.fields:
+                values = tuple(field_values(record, field))
+                if cache_values:
+                    self._values[field].append(values)
+
+                grams = set()
+                for value in values:
+                    for size in range(1, MAX_GRAM + 1):
+                        grams.update(_grams(value, size))
+                    for token in TOKEN_RE.findall(value):
+                        self._tokens.setdefault(token, set()).add(record_id)
+                for gram in grams:
+                    self._grams[field].setdefault(gram, []).append(record_id)
+
+                for element in set(field_elements(record, field)):
+                    self._elements[field].setdefault(element, []).append(record_id)
+
+        self._all_ids = range(len(records))
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def _field_values(self, record_id, field):
+        if self._values is None:
+            return field_values(self.records[record_id], field)
+        return self._values[field][record_id]
+
+    def _candidates(self, query, field):
+        """Ids whose field could contain the query, a superset of the real hits."""
+        if not query:
+            return self._all_ids
+        postings = self._grams[field]
+        if len(query) <= MAX_GRAM:
+            return postings.get(query, ())
+        lists = []
+        for gram in _grams(query, MAX_GRAM):
+            ids = postings.get(gram)
+            if not ids:
+                return ()
+            lists.append(ids)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for ids in lists[1:]:
+            candidates.intersection_update(ids)
+            if not candidates:
+                break
+        return candidates
+
+    def search_ids(self, query, fields=None):
+        """Ids of records where ``query`` is a substring of any value of ``fields``."""
+        query = query.lower()
+        matched = set()
+        for field in fields or self.fields:
+            for record_id in self._candidates(query, field):
+                if record_id not in matched and any(query in value for value in self._field_values(record_id, field)):
+                    matched.add(record_id)
+        return sorted(matched)
+
+    def search(self, query, fields=None):
+        """Records where ``query`` is a substring of any value of ``fields``, in file order."""
+        return self.get_records(self.search_ids(query, fields))
+
+    def search_page(self, query, limit, offset=0, fields=None):
+        """A ``Page`` of the same matches as ``search_ids``, best first.
+
+        Whole entry matches rank first, then entries starting with the query,
+        then other substring matches, each in file order. Whole entry matches
+        come straight from the element postings, so for common prefixes the
+        scan stops once the page is full of prefix hits.
+        """
+        query = query.lower()
+        fields = fields or self.fields
+        exact = set()
+        candidates = set()
+        for field in fields:
+            exact.update(self._elements[field].get(query, ()))
+            candidates.update(self._candidates(query, field))
+        candidates -= exact
+
+        def scored():
+            for record_id in sorted(candidates):
+                yield self._relevance(query, record_id, fields), record_id
+
+        return top_k(scored(), limit, offset, seeds=[(EXACT, record_id) for record_id in sorted(exact)],
+                     bound=PREFIX, candidates=len(candidates))
+
+    def _relevance(self, query, record_id, fields):
+        best = 0
+        for field in fields:
+            if any(query in value for value in self._field_values(record_id, field)):
+                best = max(best, relevance(query, field_elements(self.records[record_id], field)) or CONTAINS)
+        return best
+
+    def lookup_ids(self, term, field):
+        """Ids of records that have ``term`` as a whole entry of ``field``."""
+        return self._elements[field].get(term.lower(), [])
+
+    def token_ids(self, token):
+        """Ids of records whose indexed fields contain ``token`` as a whole word."""
+        return self._tokens.get(token.lower(), set())
+
+    def vocabulary(self):
+        """Sorted list of every indexed word token."""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._tokens)
+        return self._vocabulary
+
+    def get_records(self, ids):
+        return [self.records[record_id] for record_id in ids]
@@ -0,0 +1,201 @@
+"""Collapse identical concurrent model calls into one.
+
+A dashboard refresh fires the same /gemini-response or /ai_solution
+request from many clients at once, and each used to start its own
+multi-second model call. ``SingleFlight.do(key, fn)`` lets the first
+caller for a key run ``fn`` while the others wait for it and share its
+result:
+
+- Inside a process, waiters block on the leader's event. An exception
+  raised by the leader is raised in every waiter too.
+- Across gunicorn workers, the leader also takes an exclusive ``flock`` on
+  ``SINGLEFLIGHT_DIR/<name>/<key hash>.lock``. When it finishes, it writes
+  the JSON result next to the lock. A worker that had to wait for the lock
+  reads that result instead of calling the model again, as long as the
+  result was written after it started waiting. Failed calls are not
+  shared; the next worker runs its own.
+
+The leader deletes the lock file before releasing it. A waiter that then
+gets the lock on the deleted file takes the shared result if there is one,
+and otherwise opens the lock file again. Result files are only useful to
+workers that were already waiting, so the leader sweeps results older
+than the lock wait, at most every ``SWEEP_INTERVAL`` seconds.
+
+Nothing is cached: once a call completes, the next request for the key
+starts a new one. ``stats()`` reports how many calls were collapsed.
+Callers should normalize keys and keep them to a bounded set (e.g. known
+record ids), since every distinct key gets its own result file until the
+sweep removes it.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coalescing only
+    fcntl = None
+
+LOCK_DIR = os.getenv("SINGLEFLIGHT_DIR", os.path.join(tempfile.gettempdir(), "singleflight"))
+# Longest wait for another worker's call before running our own
+LOCK_WAIT = float(os.getenv("SINGLEFLIGHT_WAIT", "60"))
+LOCK_POLL = 0.05
+# Seconds between sweeps of stale result files
+SWEEP_INTERVAL = 60
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Per-key call deduplication, in-process and (with ``fcntl``) across workers."""
+
+    def __init__(self, name, lock_dir=LOCK_DIR, lock_wait=LOCK_WAIT):
+        self.lock_dir = os.path.join(lock_dir, name) if lock_dir and fcntl else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self.lock_wait = lock_wait
+        self._swept_at = 0.0
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0, "executed": 0, "coalesced": 0, "coalesced_cross_worker": 0, "errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def do(self, key, fn):
+        """Return ``fn()``, sharing one execution among concurrent callers with the same key."""
+        with self._lock:
+            self._counts["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            self._count("coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn)
+        except Exception as e:
+            call.error = e
+            self._count("errors")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _run(self, key, fn):
+        if self.lock_dir is None:
+            self._count("executed")
+            return fn()
+        path = os.path.join(self.lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+        started = time.time()
+        deadline = started + self.lock_wait
+        while True:
+            with open(path + ".lock", "a") as lock_file:
+                locked = self._acquire(lock_file, deadline)
+                try:
+                    if locked:
+                        shared = self._shared_result(path, started)
+                        if shared is not None:
+                            self._count("coalesced_cross_worker")
+                            return shared[0]
+                        if not self._is_current(lock_file, path + ".lock"):
+                            # The leader deleted this lock file without sharing a result
+                            continue
+                    self._count("executed")
+                    try:
+                        result = fn()
+                        if locked:
+                            self._publish(path, result)
+                    finally:
+                        if locked:
+                            self._remove(path + ".lock")
+                    return result
+                finally:
+                    if locked:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file, deadline):
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    print("Singleflight lock wait timed out; calling the model directly")
+                    return False
+                time.sleep(LOCK_POLL)
+
+    @staticmethod
+    def _is_current(lock_file, lock_path):
+        """Whether the locked file is still the one at ``lock_path``."""
+        try:
+            return os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+        except OSError:
+            return False
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _shared_result(self, path, started):
+        """``(result,)`` written by another worker after ``started``, else None."""
+        try:
+            if os.path.getmtime(path + ".json") < started:
+                return None
+            with open(path + ".json", encoding="utf-8") as f:
+                return (json.load(f),)
+        except (OSError, ValueError):
+            return None
+
+    def _publish(self, path, result):
+        try:
+            payload = json.dumps(result)
+        except TypeError:
+            return
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp, path + ".json")
+        self._sweep()
+
+    def _sweep(self):
+        """Delete result files too old for any waiter to still want them."""
+        now = time.time()
+        if now - self._swept_at < SWEEP_INTERVAL:
+            return
+        self._swept_at = now
+        try:
+            entries = list(os.scandir(self.lock_dir))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.name.endswith((".json", ".tmp")):
+                continue
+            try:
+                if entry.stat().st_mtime < now - self.lock_wait:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, in_flight=len(self._calls))
@@ -0,0 +1,153 @@
+"""Name slugs and bounded pattern lookups for dalisay's /disease/<name> routes.
+
+Those routes match the URL segment against a slug of each primary name,
+e.g. "Meningitis-fungal". The user input is used as a regular expression.
+``SlugIndex`` builds the slugs once and answers exact slug hits from a dict.
+Everything else goes through a fallback:
+
+- Input without regex metacharacters is a plain case-insensitive
+  substring test.
+- Patterns are compiled once through an LRU cache.
+- Patterns that can backtrack catastrophically are matched literally
+  instead, as are patterns that are too long or invalid. That covers
+  repeated groups holding a quantifier or an alternation ((a+)+, (.|.)*),
+  backreferences, and more than MAX_VARIABLE_QUANTIFIERS open-ended
+  quantifiers (.*.*.*.* is polynomial in the slug length).
+- Slugs are searched up to MAX_SLUG_LENGTH characters.
+- The scan gives up once SLUG_SEARCH_BUDGET_MS has passed. ``re`` cannot
+  be interrupted mid-match, so the checks above are what bound one match.
+"""
+import functools
+import os
+import re
+import time
+
+# Longest pattern compiled as a regular expression
+MAX_PATTERN_LENGTH = 100
+# Most quantifiers allowed in one pattern
+MAX_QUANTIFIERS = 10
+# Most open-ended quantifiers (* + {m,} {m,n}) allowed in one pattern
+MAX_VARIABLE_QUANTIFIERS = 3
+# Longest slug text a pattern is searched in; the dataset's longest is 88
+MAX_SLUG_LENGTH = 120
+# Wall-clock budget for one fallback scan
+SEARCH_BUDGET = float(os.getenv("SLUG_SEARCH_BUDGET_MS", "50")) / 1000
+
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+QUANTIFIER_RE = re.compile(r"[*+?]|\{\d*,?\d*\}")
+# * + {m,} {m,n}, i.e. a quantifier that can match a varying number of times
+VARIABLE_QUANTIFIER_RE = re.compile(r"[*+]|\{(\d*),(\d*)\}")
+BACKREFERENCE_RE = re.compile(r"\\[1-9]|\(\?P=")
+COUNTED_RE = re.compile(r"\{\d*,?\d*\}")
+
+
+def slugify(name):
+    """The slug dalisay matches against: drops _ ) - then turns ( / and spaces into dashes."""
+    return re.sub(r"[\(\/ ] ?", "-", re.sub(r"[\_\)\-]", "", name))
+
+
+def has_ambiguous_repeat(pattern):
+    """True if a group repeated by * + or {..} contains a quantifier or an alternation.
+
+    Such a group can split the same text in exponentially many ways, e.g.
+    (a+)+ or (.|.)*, and ``re`` tries every one of them before failing.
+    """
+    # One [has quantifier, has alternation] per open group, plus the top level
+    stack = [[False, False]]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "[":
+            # Skip the character class; "]" right after "[" or "[^" is literal
+            i += 1
+            if pattern[i:i + 1] == "^":
+                i += 1
+            if pattern[i:i + 1] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+            continue
+        if char == "(":
+            stack.append([False, False])
+            # (?:  (?=  (?P<name>: the ? is not a quantifier
+            if pattern[i + 1:i + 2] == "?":
+                i += 1
+        elif char == ")" and len(stack) > 1:
+            quantified, alternation = stack.pop()
+            following = pattern[i + 1:i + 2]
+            if (quantified or alternation) and (following in ("*", "+") or COUNTED_RE.match(pattern, i + 1)):
+                return True
+            stack[-1][0] = stack[-1][0] or quantified or following in ("*", "+", "?", "{")
+            stack[-1][1] = stack[-1][1] or alternation
+        elif char == "|":
+            stack[-1][1] = True
+        elif char in "*+?" or COUNTED_RE.match(pattern, i):
+            stack[-1][0] = True
+        i += 1
+    return False
+
+
+def variable_quantifiers(pattern):
+    """Number of quantifiers in ``pattern`` that can match a varying number of times."""
+    count = 0
+    for match in VARIABLE_QUANTIFIER_RE.finditer(pattern):
+        if match.group(0) in ("*", "+") or match.group(1) != match.group(2):
+            count += 1
+    return count
+
+
+def is_safe_pattern(pattern):
+    """True if the pattern is short and free of backtracking-prone constructs."""
+    return (len(pattern) <= MAX_PATTERN_LENGTH
+            and not BACKREFERENCE_RE.search(pattern)
+            and len(QUANTIFIER_RE.findall(pattern)) <= MAX_QUANTIFIERS
+            and variable_quantifiers(pattern) <= MAX_VARIABLE_QUANTIFIERS
+            and not has_ambiguous_repeat(pattern))
+
+
+@functools.lru_cache(maxsize=256)
+def compile_pattern(pattern):
+    """Compiled case-insensitive matcher for user input, literal when not safe as a regex."""
+    if REGEX_CHARS.isdisjoint(pattern) or not is_safe_pattern(pattern):
+        return re.compile(re.escape(pattern), re.IGNORECASE)
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(pattern), re.IGNORECASE)
+
+
+class SlugIndex:
+    """Slug -> record map with a bounded regex fallback, first match in file order."""
+
+    def __init__(self, records):
+        self.records = records
+        self.slugs = [slugify(record["primary_name"]) for record in records]
+        self.lowered = [slug.lower() for slug in self.slugs]
+        self.by_slug = {}
+        for record, slug in zip(records, self.lowered):
+            self.by_slug.setdefault(slug, record)
+
+    def find(self, name, budget=SEARCH_BUDGET):
+        """Record whose slug equals ``name``, else the first whose slug it matches, else None."""
+        record = self.by_slug.get(name.lower())
+        if record is not None:
+            return record
+        if REGEX_CHARS.isdisjoint(name):
+            needle = name.lower()
+            for record, slug in zip(self.records, self.lowered):
+                if needle in slug:
+                    return record
+            return None
+        pattern = compile_pattern(name)
+        deadline = time.perf_counter() + budget
+        for record, slug in zip(self.records, self.slugs):
+            if pattern.search(slug, 0, MAX_SLUG_LENGTH):
+                return record
+            if time.perf_counter() > deadline:
+                print(f"Slug search for {name!r} stopped after {budget * 1000:.0f} ms")
+                return None
+        return None
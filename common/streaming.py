@@ -0,0 +1,119 @@
+"""Server-Sent Events helpers for streaming Gemini replies from Flask routes.
+
+A streamed reply is a ``text/event-stream`` of ``data:`` events, each
+holding one JSON-encoded text chunk, followed by a final ``done`` event
+(or an ``error`` event if the model call fails part way). JSON-encoding the
+chunks keeps newlines in the model output from breaking the event framing.
+
+Time to first token and total time are logged for every stream.
+"""
+import json
+import queue
+import threading
+import time
+
+from flask import Response, request, stream_with_context
+
+
+def sse_event(data, event=None):
+    """Format one SSE event with a JSON-encoded payload."""
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def chunk_texts(chunks):
+    """Yield the text of each streamed SDK chunk, skipping empty ones.
+
+    Works for both ``google-genai`` (``generate_content_stream``) and
+    ``google-generativeai`` (``generate_content(..., stream=True)``) chunks.
+    """
+    for chunk in chunks:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. safety metadata) raise here
+            continue
+        if text:
+            yield text
+
+
+def prefetch(produce):
+    """Start consuming ``produce()`` on a background thread straight away.
+
+    Returns a generator over the produced items, so a route can start a slow
+    model stream, do local work meanwhile, and then relay the stream.
+    Exceptions raised by the producer are re-raised by the generator.
+    """
+    items = queue.Queue()
+
+    def run():
+        try:
+            for item in produce():
+                items.put((True, item))
+            items.put((False, None))
+        except Exception as e:
+            items.put((False, e))
+
+    threading.Thread(target=run, daemon=True).start()
+
+    def drain():
+        while True:
+            more, item = items.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+
+    return drain()
+
+
+def wants_stream():
+    """True if the client asked for SSE via ``?stream=1``, a form/JSON field or the Accept header."""
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return True
+    flag = request.args.get("stream") or request.form.get("stream")
+    if flag is None and request.is_json:
+        flag = (request.get_json(silent=True) or {}).get("stream")
+    return str(flag).lower() in ("1", "true", "yes")
+
+
+def stream_text(texts, label, on_complete=None):
+    """Yield SSE events for an iterable of text chunks and log the timings.
+
+    ``on_complete(full_text)`` runs once the stream finished without error,
+    e.g. to cache the whole reply.
+    """
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    try:
+        for text in texts:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+                print(f"[stream] {label}: first token after {first_token * 1000:.0f} ms")
+            parts.append(text)
+            yield sse_event(text)
+    except Exception as e:
+        print(f"[stream] {label}: failed after {(time.perf_counter() - started) * 1000:.0f} ms: {e}")
+        yield sse_event(str(e), event="error")
+        return
+    total = time.perf_counter() - started
+    print(f"[stream] {label}: done in {total * 1000:.0f} ms, {sum(map(len, parts))} chars")
+    if on_complete is not None:
+        on_complete("".join(parts))
+    yield sse_event({"ttft_ms": round((first_token or total) * 1000), "total_ms": round(total * 1000)},
+                    event="done")
+
+
+def sse_response(events):
+    """Wrap an SSE event generator in a streaming Flask response."""
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        # Stop proxies such as nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
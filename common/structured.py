@@ -0,0 +1,227 @@
+"""Parse, validate and repair JSON returned by Gemini.
+
+Routes used to strip ```json fences with a regex, ``json.loads`` the rest
+and answer 500 on any defect, so the user had to resubmit and wait for the
+whole model call again. ``StructuredParser`` validates against a
+``TypeAdapter`` built once per schema and fixes common defects locally:
+
+- Markdown fences and prose around the JSON are removed.
+- Trailing commas are dropped.
+- Output cut off mid-way (token limit) is closed after its last complete
+  element or member. The unfinished one is dropped, since a value cut
+  mid-number or mid-word can still parse.
+
+If the reply was cut off, or items or fields failed validation, the
+route's ``complete`` callback asks the model only for what is missing and
+the answers are merged, without duplicates. A short but valid list is
+returned as is. If the completion request fails, what was already parsed
+is returned.
+"""
+import json
+import re
+from typing import get_args, get_origin
+
+from pydantic import TypeAdapter, ValidationError
+
+FENCE_RE = re.compile(r"```(?:json|JSON)?\s*([\s\S]*?)\s*(?:```|$)")
+# Fields that identify a list item when merging completed items
+IDENTITY_FIELDS = ("key_id", "primary_name")
+
+
+class StructuredOutputError(ValueError):
+    """Model output that could not be repaired into the expected shape."""
+
+    def __init__(self, message, raw):
+        super().__init__(message)
+        self.raw = raw
+
+
+def strip_fences(text):
+    """The JSON part of a reply: fence contents, starting at the first bracket."""
+    match = FENCE_RE.search(text)
+    if match:
+        text = match.group(1)
+    starts = [i for i in (text.find("["), text.find("{")) if i >= 0]
+    if starts:
+        text = text[min(starts):]
+    return text.strip()
+
+
+def _drop_trailing_comma(out):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json(text):
+    """Return ``(value, truncated)`` for a reply, fixing fences, trailing commas and truncation.
+
+    Raises ``StructuredOutputError`` if nothing usable is left.
+    """
+    cleaned = strip_fences(text)
+    try:
+        return json.loads(cleaned), False
+    except json.JSONDecodeError:
+        pass
+
+    out = []
+    closers = []
+    in_string = escape = False
+    # Length of ``out`` after the last complete element/member of the top-level container
+    boundary = None
+    for char in cleaned:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "[{":
+            closers.append("]" if char == "[" else "}")
+        elif char in "]}":
+            _drop_trailing_comma(out)
+            if closers:
+                closers.pop()
+            out.append(char)
+            if len(closers) == 1:
+                boundary = len(out)
+            if not closers:
+                # Anything after the top-level value is chatter
+                break
+            continue
+        elif char == "," and len(closers) == 1:
+            boundary = len(out)
+        out.append(char)
+
+    if not closers and not in_string:
+        try:
+            return json.loads("".join(out)), False
+        except json.JSONDecodeError:
+            raise StructuredOutputError("Model output is not valid JSON", text)
+
+    # Truncated: keep everything up to the last complete element or member
+    # of the top-level container. The unfinished one may still parse (a
+    # number cut from 0.25 to 0.2) but cannot be trusted.
+    attempts = []
+    if boundary is not None:
+        attempts.append("".join(out[:boundary]).rstrip().rstrip(",") + closers[0])
+    attempts.append(cleaned[0] + closers[0] if cleaned[:1] in ("[", "{") else "")
+    for attempt in attempts:
+        try:
+            return json.loads(attempt), True
+        except json.JSONDecodeError:
+            continue
+    raise StructuredOutputError("Model output is truncated beyond repair", text)
+
+
+class StructuredParser:
+    """Validates model replies against ``schema``: a pydantic model or ``list[Model]``."""
+
+    def __init__(self, schema):
+        self.many = get_origin(schema) is list
+        self.model = get_args(schema)[0] if self.many else schema
+        self.adapter = TypeAdapter(schema)
+        self.item_adapter = TypeAdapter(self.model)
+        self.required = [name for name, field in self.model.model_fields.items() if field.is_required()]
+
+    def parse(self, text, complete=None, expected=None):
+        """Parsed and validated reply as plain dicts.
+
+        ``complete(have, missing)`` is called at most once when something is
+        missing and must return the model's reply text for only that part:
+
+        - list schemas: ``have`` are the valid items so far, ``missing`` how
+          many more are wanted (``expected - len(have)``), or None when
+          ``expected`` is not known.
+        - model schemas: ``have`` is the partial object, ``missing`` the list
+          of absent or invalid required fields.
+        """
+        value, truncated = repair_json(text)
+        if self.many:
+            return self._parse_list(value, truncated, complete, expected, text)
+        return self._parse_object(value, complete, text)
+
+    def _valid_items(self, value):
+        if isinstance(value, dict):
+            value = [value]
+        if not isinstance(value, list):
+            return [], 0
+        try:
+            return [item.model_dump() for item in self.adapter.validate_python(value)], 0
+        except ValidationError:
+            pass
+        items = []
+        for item in value:
+            try:
+                items.append(self.item_adapter.validate_python(item).model_dump())
+            except ValidationError:
+                continue
+        return items, len(value) - len(items)
+
+    def _parse_list(self, value, truncated, complete, expected, raw):
+        items, dropped = self._valid_items(value)
+        wanted = expected - len(items) if expected is not None else None
+        # Only a damaged reply is completed; a short valid one is the model's answer
+        if complete is not None and (truncated or dropped) and (wanted is None or wanted > 0):
+            try:
+                extra, _ = self._valid_items(repair_json(complete(items, wanted))[0])
+            except Exception as e:
+                # Keep what was already parsed
+                print(f"Completion request failed: {e!r}")
+                extra = []
+            extra = self._new_items(items, extra)
+            items += extra[:wanted] if wanted is not None else extra
+        if not items and (truncated or dropped or not isinstance(value, list)):
+            raise StructuredOutputError("Model output does not match the expected schema", raw)
+        return items
+
+    def _new_items(self, items, extra):
+        """The items of ``extra`` not already in ``items``, by key_id or primary_name."""
+        def identity(item):
+            for field in IDENTITY_FIELDS:
+                if item.get(field) not in (None, ""):
+                    return field, str(item[field]).strip().lower()
+            return None, json.dumps(item, sort_keys=True, default=str)
+
+        seen = {identity(item) for item in items}
+        new = []
+        for item in extra:
+            key = identity(item)
+            if key not in seen:
+                seen.add(key)
+                new.append(item)
+        return new
+
+    def _missing_fields(self, value):
+        try:
+            self.item_adapter.validate_python(value)
+            return []
+        except ValidationError as e:
+            fields = {str(error["loc"][0]) for error in e.errors() if error["loc"]}
+            return [name for name in self.model.model_fields if name in fields] or self.required
+
+    def _parse_object(self, value, complete, raw):
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            value = value[0]
+        if not isinstance(value, dict):
+            raise StructuredOutputError("Model output is not a JSON object", raw)
+        missing = self._missing_fields(value)
+        if missing and complete is not None:
+            valid = {key: item for key, item in value.items() if key not in missing}
+            try:
+                extra, _ = repair_json(complete(valid, missing))
+                if isinstance(extra, dict):
+                    value = dict(valid, **{key: extra[key] for key in missing if key in extra})
+            except Exception as e:
+                # Validate what was already parsed
+                print(f"Completion request failed: {e!r}")
+        try:
+            return self.item_adapter.validate_python(value).model_dump()
+        except ValidationError:
+            raise StructuredOutputError("Model output does not match the expected schema", raw)
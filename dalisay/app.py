@@ -1,10 +1,18 @@
-import os, json, re
+import os, json, sys
 
 from flask import Flask, request
 from dotenv import dotenv_values
 from pydantic import BaseModel
 from google import genai
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.admission import AdmissionControl
+from common.profiling import install_profiler
+from common.ranking import SymptomRanker, diagnose_with_shortlist
+from common.resilience import DEGRADED_HEADERS, ModelGuard, ModelUnavailable, degraded_results, genai_timeout, unavailable_response
+from common.slugs import SlugIndex
+from common.streaming import chunk_texts, sse_response, stream_text, wants_stream
+
 class Diagnosis(BaseModel):
   key_id: str
   primary_name: str
@@ -16,12 +24,20 @@ class Diagnosis(BaseModel):
 
 def create_app():
   app = Flask(__name__)
+  # Opt-in request profiling, see common/profiling.py
+  install_profiler(app, "dalisay")
+  # Keep handlers free for local routes while model calls pile up
+  admission = AdmissionControl(app, "dalisay", {"chat", "diagnosis"})
+  # 503 + Retry-After for model calls without a local fallback
+  app.register_error_handler(ModelUnavailable, unavailable_response)
 
   if (os.path.exists(os.path.join(os.getcwd(), ".env"))):
     env = dotenv_values(os.path.join(os.getcwd(), ".env"))
     client = genai.Client(api_key=env["GENAI_API_KEY"])
   else:
     client = genai.Client(api_key=os.environ.get("GENAI_API_KEY"))
+  # Deadlines, retries and circuit breaker for every Gemini call
+  gemini = ModelGuard("dalisay", genai_timeout)
 
   icd_9_file = os.path.join(os.getcwd(), '..', 'diseases.json') # This is meant to be run from the root directory
   icd_9_json = open(icd_9_file).read()
@@ -36,6 +52,12 @@ def create_app():
     else:
       icd_9_procedures.append(row)
 
+  # Local ranker that picks the candidate diseases sent to Gemini
+  disease_ranker = SymptomRanker(icd_9_diseases)
+  # Name slugs built once for /disease/<name> and /procedure/<name>
+  disease_slugs = SlugIndex(icd_9_diseases)
+  procedure_slugs = SlugIndex(icd_9_procedures)
+
   @app.route('/')
   def index():
     return 'Welcome to the ICD-9 Database! Change address to /disease/[name] or /procedure/[name] to search for a disease or procedure.'
@@ -47,12 +69,9 @@ def create_app():
 
   @app.route('/disease/<string:name>')
   def disease(name):
-    # Returns the disease that matches the name
-    for row in icd_9_diseases:
-      disease = re.sub(r"[\(\/ ] ?", "-", re.sub(r"[\_\)\-]", "",row["primary_name"]))
-      if re.search(name, disease, re.IGNORECASE):
-        return row
-    return 'Disease not found.'
+    # Returns the disease whose slug is the name, else the first one it matches
+    row = disease_slugs.find(name)
+    return row if row is not None else 'Disease not found.'
 
   @app.route('/procedures')
   def procedures():
@@ -61,12 +80,9 @@ def create_app():
 
   @app.route('/procedure/<string:name>')
   def procedure(name):
-    # Returns the procedure that matches the name
-    for row in icd_9_procedures:
-      procedure = re.sub(r"[\(\/ ] ?", "-", re.sub(r"[\_\)\-]", "",row["primary_name"]))
-      if re.search(name, procedure, re.IGNORECASE):
-        return row
-    return 'Procedure not found.'
+    # Returns the procedure whose slug is the name, else the first one it matches
+    row = procedure_slugs.find(name)
+    return row if row is not None else 'Procedure not found.'
 
   @app.route('/chat', methods=['POST'])
   def chat():
@@ -74,30 +90,44 @@ def create_app():
     request.content_length = int(request.headers['Content-Length'])
     data = request.get_json()
     message = data["message"]
-    response = client.models.generate_content(model="gemini-2.0-flash", contents=[message])
+    if wants_stream():
+      # Stream the reply as Server-Sent Events while it is generated
+      def generate():
+        yield from chunk_texts(gemini.stream(client.models.generate_content_stream, model="gemini-2.0-flash", contents=[message]))
+      return sse_response(stream_text(generate(), "dalisay /chat"))
+    response = gemini.call(client.models.generate_content, model="gemini-2.0-flash", contents=[message])
     return response.text
   
   @app.route('/diagnosis', methods=['POST'])
   def diagnosis():
     # Returns the top three matching diseases based on the symptoms
     symptoms = request.get_json()["symptoms"]
-    response = client.models.generate_content(
-      model="gemini-2.0-flash", 
-      contents=[
-        "This is the existing data in JSON format: " + json.dumps(icd_9_diseases),
-        "Match the symptoms to the closest disease based on the data.",
-        "The symptoms are: " + symptoms,
-        "Include the information link data in the response.",
-        "Read the url from the data and get the treatments for the disease.",
-        "Summarize the treatments in just a single paragraph.",
-        "Append the summarized treatments to the response and store it in the 'treatments' property.",
-        "Return the top three matching items."],
-      config = {
-        "response_mime_type": "application/json",
-        "response_schema": list[Diagnosis]},
-      )
-    
-    return json.loads(response.text)
+
+    def ask(candidates):
+      response = gemini.call(
+        client.models.generate_content,
+        model="gemini-2.0-flash", 
+        contents=[
+          "This is the existing data in JSON format: " + json.dumps(candidates),
+          "Match the symptoms to the closest disease based on the data.",
+          "The symptoms are: " + symptoms,
+          "Include the information link data in the response.",
+          "Read the url from the data and get the treatments for the disease.",
+          "Summarize the treatments in just a single paragraph.",
+          "Append the summarized treatments to the response and store it in the 'treatments' property.",
+          "Return the top three matching items."],
+        config = {
+          "response_mime_type": "application/json",
+          "response_schema": list[Diagnosis]},
+        )
+      return json.loads(response.text)
+
+    # Only the locally ranked shortlist goes into the prompt
+    try:
+      return diagnose_with_shortlist(ask, disease_ranker, symptoms)
+    except ModelUnavailable:
+      # Model is down or too slow: answer from the local ranker instead
+      return degraded_results(disease_ranker, symptoms), 200, DEGRADED_HEADERS
   
   return app
 
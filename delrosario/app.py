@@ -1,24 +1,86 @@
 import json
+import os
+import sys
 from flask import Flask, request, render_template
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.fulltext import FullTextIndex
+from common.paging import CONTAINS, EXACT, PREFIX, page_params, top_k
+from common.profiling import install_profiler
+
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "delrosario")
 
 # Load diseases data from JSON file
 with open('diseases.json', 'r') as file:
     diseases = json.load(file)
 
+# Substring index over every field, nested ICD-10 names and link titles included
+fulltext_index = FullTextIndex(diseases)
+
+# How matched fields are named on the results page
+FIELD_LABELS = {
+    'key_id': 'ID',
+    'primary_name': 'Primary name',
+    'consumer_name': 'Consumer name',
+    'word_synonyms': 'Keywords',
+    'synonyms': 'Synonyms',
+    'term_icd9_code': 'ICD-9 code',
+    'term_icd9_text': 'ICD-9 description',
+    'icd10cm_codes': 'ICD-10-CM codes',
+    'icd10cm': 'ICD-10-CM',
+    'info_link_data': 'Info links',
+    'is_procedure': 'Procedure flag',
+}
+
+# Exact primary name lookups, so those hits rank first without a scan
+name_ids = {}
+for record_id, disease in enumerate(diseases):
+    name_ids.setdefault(disease['primary_name'].lower(), []).append(record_id)
+
+def search_page(query, limit, offset):
+    """One page of diseases with the query in any field: exact names, then name prefixes, then the rest."""
+    exact = name_ids.get(query, [])
+    candidates = [record_id for record_id in fulltext_index.candidates(query) if record_id not in exact]
+
+    def scored():
+        for record_id in candidates:
+            if diseases[record_id]['primary_name'].lower().startswith(query):
+                yield PREFIX, record_id
+            elif fulltext_index.matched_field(query, record_id):
+                yield CONTAINS, record_id
+            else:
+                yield 0, record_id
+
+    return top_k(scored(), limit, offset, seeds=[(EXACT, record_id) for record_id in exact],
+                 bound=PREFIX, candidates=len(candidates))
+
+def matched_field(query, record_id):
+    """Label of the field the query was found in, preferring the primary name."""
+    if query in diseases[record_id]['primary_name'].lower():
+        return FIELD_LABELS['primary_name']
+    field = fulltext_index.matched_field(query, record_id)
+    return FIELD_LABELS.get(field, field)
+
 @app.route('/')
 def index():
     query = request.args.get('query', '')
     results = []
+    matched_fields = []
+    page = None
 
     if query:
-        query_lower = query.lower()
-        for disease in diseases:
-            if any(query_lower in str(value).lower() for value in disease.values()):
-                results.append(disease)
+        try:
+            limit, offset = page_params(request.args)
+        except ValueError:
+            limit, offset = page_params({})
+        page = search_page(query.lower(), limit, offset)
+        results = [diseases[record_id] for record_id in page.ids]
+        matched_fields = [matched_field(query.lower(), record_id) for record_id in page.ids]
 
-    return render_template('index.html', query=query, results=results)
+    return render_template('index.html', query=query, results=results, page=page,
+                           matched_fields=matched_fields)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,11 +1,22 @@
 from flask import Flask, request, jsonify, render_template
 import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.bm25 import RankingEngines, requested_ranking, requested_top_k
+from common.profiling import install_profiler
 
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "duhina")
 
 with open("diseases.json", "r") as f:
     diseases = json.load(f)
 
+# BM25/TF-IDF ranked matching, used for /diagnosis?rank=bm25
+ranking_engines = RankingEngines(diseases)
+
 
 # Routes
 @app.route("/")
@@ -14,6 +25,21 @@ def index():
 
 @app.route("/diagnosis", methods=["GET"])
 def find_disease():
+    ranking = requested_ranking(request.args)
+    if ranking != "match":
+        # Top k diseases by score instead of every match in file order
+        results = [{
+            "name": disease["primary_name"],
+            "icd10_codes": disease.get("icd10cm_codes", "N/A"),
+            "info_link": disease["info_link_data"][0][0] if disease.get("info_link_data") else "N/A",
+            "score": score,
+            "matched_terms": terms
+        } for disease, score, terms in ranking_engines.search(
+            ranking, request.args.get("symptoms", ""), requested_top_k(request.args))]
+        if not results:
+            return jsonify({"message": "No matching diseases found"}), 404
+        return jsonify(results)
+
     symptoms = request.args.get("symptoms", "").lower().split(",")
     results = []
 
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 from flask import Flask, jsonify, render_template, request
 from flask_cors import CORS
@@ -6,7 +7,18 @@ from dotenv import load_dotenv
 import google.generativeai as genai
 from pydantic import BaseModel
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.dataset_store import DatasetStore
+from common.lookup import RecordLookup
+from common.profiling import install_profiler
+from common.resilience import ModelGuard, ModelUnavailable, generativeai_timeout, unavailable_response
+from common.streaming import chunk_texts, sse_response, stream_text, wants_stream
+
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "feliciano")
+# 503 + Retry-After when Gemini is down or too slow
+app.register_error_handler(ModelUnavailable, unavailable_response)
 
 # Load environment variables
 load_dotenv()
@@ -15,13 +27,24 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # Configure Google Gemini API
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel("gemini-2.0-flash")
+# Deadlines, retries and circuit breaker for the Gemini calls
+gemini = ModelGuard("feliciano", generativeai_timeout)
+
+# Disease data is parsed once and reloaded only when diseases.json changes
+base_dir = os.path.dirname(os.path.abspath(__file__))
+disease_store = DatasetStore(os.path.join(base_dir, 'diseases.json'))
 
 # Load disease data
 def load_diseases():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(base_dir, 'diseases.json')
-    with open(file_path, 'r') as file:
-        return json.load(file)
+    return disease_store.snapshot().records
+
+# key_id lookups for the detail page, rebuilt whenever the data reloads
+disease_lookup = RecordLookup(load_diseases())
+
+@disease_store.on_reload
+def rebuild_lookup(snapshot):
+    global disease_lookup
+    disease_lookup = RecordLookup(snapshot.records)
 
 # Home endpoint that shows the index.html page with pagination
 @app.route('/')
@@ -85,8 +108,8 @@ def search_diseases():
 # Endpoint to get details about a specific disease by key_id
 @app.route('/disease/<string:key_id>', methods=['GET'])
 def get_disease_info(key_id):
-    diseases = load_diseases()
-    disease = next((d for d in diseases if d["key_id"] == key_id), None)
+    load_diseases()  # picks up a changed diseases.json before the lookup
+    disease = disease_lookup.get(key_id)
     
     if disease is None:
         return jsonify({"message": "Disease not found"}), 404
@@ -101,7 +124,7 @@ def chat_advanced():
         symptoms = request.form.get('symptoms', '').lower()
 
         # Generate diagnosis with confidence levels using the advanced method
-        response = model.generate_content([
+        response = gemini.call(model.generate_content, [
             f"This is the existing data in JSON format: {json.dumps(load_diseases())}",
             f"Match the closest disease with the following symptoms: {symptoms}",
             "Provide the most likely disease with a confidence percentage.",
@@ -150,13 +173,20 @@ def chat():
     if request.method == 'POST':
         symptoms = request.form.get('symptoms', '').lower()
 
-        # Generate basic diagnosis using the original method
-        response = model.generate_content([ 
+        contents = [
             "You are a disease diagnosing staff.",
             f"Create a basic diagnosis for a patient with the following symptoms: {symptoms}.",
             "The patient has been experiencing the symptoms for a week already.",
             "Provide an accurate diagnosis."
-        ])
+        ]
+        if wants_stream():
+            # Stream the diagnosis as Server-Sent Events while it is generated
+            def generate():
+                yield from chunk_texts(gemini.stream(model.generate_content, contents, stream=True))
+            return sse_response(stream_text(generate(), "feliciano /chat"))
+
+        # Generate basic diagnosis using the original method
+        response = gemini.call(model.generate_content, contents)
 
         # Process response
         if hasattr(response, 'text'):
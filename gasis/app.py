@@ -1,6 +1,7 @@
 from flask import Flask, render_template, request, jsonify
 import json
 import os
+import sys
 
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -12,22 +13,31 @@ json_path = os.path.join(BASE_DIR, "gasis/diseases.json")
 with open(json_path, encoding="utf-8") as f:
     diseases_data = json.load(f)
 
+sys.path.append(BASE_DIR)
+from common.lookup import RecordLookup
+from common.profiling import install_profiler
+from common.search_index import SearchIndex
+
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "gasis")
+
+# Symptom search index, built once at startup
+disease_index = SearchIndex(diseases_data)
+# key_id lookups for the detail page
+disease_lookup = RecordLookup(diseases_data)
+
 @app.route("/", methods=["GET", "POST"])
 def home():
     if request.method == "POST":
         symptom = request.form.get("symptom").lower()
-        matches = [
-            disease for disease in diseases_data
-            if symptom in disease.get("word_synonyms", "").lower() or
-               any(symptom in syn.lower() for syn in disease.get("synonyms", []))
-        ]
+        matches = disease_index.search(symptom, fields=("word_synonyms", "synonyms"))
         return render_template("results.html", matches=matches, symptom=symptom)
     return render_template("index.html")
 
 @app.route("/disease/<disease_id>")
 def disease_details(disease_id):
-    disease = next((d for d in diseases_data if d["key_id"] == disease_id), None)
-    return render_template("disease.html", disease=disease) if disease else "Not Found"
+    disease = disease_lookup.get(disease_id)
+    return render_template("disease.html", disease=disease) if disease else ("Not Found", 404)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -1,31 +1,48 @@
 from flask import Flask, render_template, request, jsonify
 import json
 import os
+import sys
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 json_path = os.path.join(BASE_DIR, "hallares", "diseases.json")
 
 app = Flask(__name__, template_folder=os.path.join(BASE_DIR, "hallares", "frontend"))
 
-with open(json_path, encoding="utf-8") as f:
-    app.diseases_data = json.load(f)
+sys.path.append(BASE_DIR)
+from common.compact_store import install_json_provider, open_dataset
+from common.lookup import RecordLookup
+from common.profiling import install_profiler
+from common.search_index import SearchIndex
+
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "hallares")
+
+# Workers share one memory-mapped compact copy of diseases.json instead of
+# each parsing the JSON into dicts. Build it once per deploy with
+# `python -m common.compact_store hallares/diseases.json`; without it the
+# JSON is loaded as before
+app.diseases_data = open_dataset(json_path)
+install_json_provider(app)
+
+# Symptom search index, built once at startup. Only the posting keys and
+# record ids live in each worker; the values it confirms matches against are
+# decoded from the shared mapping rather than copied
+app.disease_index = SearchIndex(app.diseases_data, fields=("word_synonyms", "synonyms"), cache_values=False)
+# key_id lookups for the detail page, mapping each key_id to a record position
+app.disease_lookup = RecordLookup(app.diseases_data)
 
 @app.route("/", methods=["GET", "POST"])
 def home():
     if request.method == "POST":
         symptom = request.form.get("symptom").lower()
-        matches = [
-            disease for disease in app.diseases_data
-            if symptom in disease.get("word_synonyms", "").lower() or
-               any(symptom in syn.lower() for syn in disease.get("synonyms", []))
-        ]
+        matches = app.disease_index.search(symptom, fields=("word_synonyms", "synonyms"))
         return render_template("results.html", matches=matches, symptom=symptom)
     return render_template("index.html")
 
 @app.route("/disease/<disease_id>")
 def disease_details(disease_id):
-    disease = next((d for d in app.diseases_data if d["key_id"] == disease_id), None)
-    return render_template("disease.html", disease=disease) if disease else "Not Found"
+    disease = app.disease_lookup.get(disease_id)
+    return render_template("disease.html", disease=disease) if disease else ("Not Found", 404)
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -2,10 +2,23 @@ from flask import Flask, request, jsonify, render_template
 import json
 from google import genai
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.bm25 import RankingEngines, requested_ranking, requested_top_k
+from common.context_cache import ContextCache, GenaiBackend
+from common.llm_cache import ResponseCache, data_version
+from common.profiling import install_profiler
+from common.resilience import ModelGuard, ModelUnavailable, context_cache_timeout, unavailable_response
+from common.streaming import chunk_texts, prefetch, sse_event, sse_response, stream_text, wants_stream
+
 # Initialization
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "malatuba")
+# 503 + Retry-After when Gemini is down or too slow
+app.register_error_handler(ModelUnavailable, unavailable_response)
 # print(os.access("/malatuba/.env", os.R_OK))
 load_dotenv(dotenv_path=".env")
 
@@ -19,20 +32,41 @@ with open("diseases.json", "r") as file:
 
 client = genai.Client(api_key= api_ey)
 
+GEMINI_MODEL = "gemini-2.0-flash"
+# Bump when the /gemini prompt changes so cached answers are not reused
+GEMINI_PROMPT_VERSION = "2"
+# Cached /gemini replies per symptom set, tied to the records loaded above
+gemini_cache = ResponseCache(version=data_version(diseases))
+# BM25/TF-IDF ranked matching, used when a request asks for rank=bm25 or tfidf
+ranking_engines = RankingEngines(diseases)
+# The reference data is uploaded once as Gemini cached content; prompts only
+# carry the user's symptoms
+dataset_context = ContextCache(GenaiBackend(client), GEMINI_MODEL, [
+    "You are a medical assistant that provides disease diagnosis. "
+    f"Use the following JSON data as reference:\n{json.dumps(diseases)}\n"
+])
+# Deadlines, retries and circuit breaker for the Gemini calls
+gemini = ModelGuard("malatuba", context_cache_timeout)
+
 # Render the HTML
 @app.route("/")
 def index():
     return render_template("index.html")
 
 
-# Query for possible disease based on input
-@app.route("/diagnosis", methods=["GET"])
-def get_disease():
-    symptoms = request.args.get("symptoms", "").lower()
-    if not symptoms:
-        return jsonify({"error": "Please provide symptoms parameter"}), 400
+# Local matcher shared by /diagnosis and /combined
+def find_diseases(symptoms, ranking="match", k=None):
+    if ranking != "match":
+        # Top k diseases by score instead of every match in file order
+        return [{
+            "name": disease["primary_name"],
+            "icd10_codes": disease.get("icd10cm_codes", "N/A"),
+            "info_link": disease["info_link_data"][0][0] if disease.get("info_link_data") else "N/A",
+            "score": score,
+            "matched_terms": terms
+        } for disease, score, terms in ranking_engines.search(ranking, symptoms, k)]
 
-    symptom_list = symptoms.split(",")  # Allow multiple symptoms
+    symptom_list = symptoms.lower().split(",")  # Allow multiple symptoms
     results = []
 
     for disease in diseases:
@@ -44,13 +78,30 @@ def get_disease():
                 "icd10_codes": disease.get("icd10cm_codes", "N/A"),
                 "info_link": disease["info_link_data"][0][0] if disease.get("info_link_data") else "N/A"
             })
+    return results
+
 
+# Query for possible disease based on input
+@app.route("/diagnosis", methods=["GET"])
+def get_disease():
+    symptoms = request.args.get("symptoms", "").lower()
+    if not symptoms:
+        return jsonify({"error": "Please provide symptoms parameter"}), 400
+
+    results = find_diseases(symptoms, requested_ranking(request.args), requested_top_k(request.args))
     if not results:
         return jsonify({"message": "No matching diseases found"}), 404
 
     return jsonify(results)
 
 
+def gemini_contents(user_message):
+    return [
+        f"User symptoms: {user_message}\n"
+        f"Provide a possible diagnosis with reasoning."
+    ]
+
+
 # Gemini AI Response
 @app.route("/gemini", methods=["POST"])
 def get_gemini_response():
@@ -58,17 +109,64 @@ def get_gemini_response():
     user_message = data.get("message", "")
     if not user_message:
         return jsonify({"response": "No input provided"})
-    diseases_info = json.dumps(diseases)
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[
-            f"You are a medical assistant that provides disease diagnosis. "
-            f"Use the following JSON data as reference:\n{diseases_info}\n"
-            f"User symptoms: {user_message}\n"
-            f"Provide a possible diagnosis with reasoning."
-        ]
-    )
-    return jsonify({"response": response.text})
+
+    if wants_stream():
+        # Send the reply as Server-Sent Events while Gemini generates it
+        key = gemini_cache.key(user_message, GEMINI_MODEL, GEMINI_PROMPT_VERSION)
+        found, reply = gemini_cache.get(key)
+        if found:
+            return sse_response(stream_text([reply], "malatuba /gemini (cached)"))
+
+        def generate():
+            yield from chunk_texts(gemini.stream(
+                dataset_context.generate_content, gemini_contents(user_message), stream=True
+            ))
+
+        return sse_response(stream_text(
+            generate(), "malatuba /gemini", on_complete=lambda text: gemini_cache.set(key, text)
+        ))
+
+    def ask():
+        response = gemini.call(dataset_context.generate_content, gemini_contents(user_message))
+        return response.text
+
+    reply = gemini_cache.get_or_call(user_message, GEMINI_MODEL, GEMINI_PROMPT_VERSION, ask)
+    return jsonify({"response": reply})
+
+
+# Local matches and Gemini reply in one streamed response
+@app.route("/combined", methods=["POST"])
+def get_combined_response():
+    data = request.get_json()
+    user_message = data.get("message", "")
+    if not user_message:
+        return jsonify({"error": "No input provided"}), 400
+
+    key = gemini_cache.key(user_message, GEMINI_MODEL, GEMINI_PROMPT_VERSION)
+    found, reply = gemini_cache.get(key)
+    if found:
+        gemini_texts = [reply]
+    else:
+        # Start the model call first so the local match runs while it is in flight
+        gemini_texts = prefetch(lambda: chunk_texts(gemini.stream(
+            dataset_context.generate_content, gemini_contents(user_message), stream=True
+        )))
+    results = find_diseases(user_message, requested_ranking(data), requested_top_k(data))
+
+    def events():
+        # The local answer goes out first and never waits for the model
+        yield sse_event({"results": results}, event="local")
+        yield from stream_text(
+            gemini_texts, "malatuba /combined",
+            on_complete=None if found else lambda text: gemini_cache.set(key, text)
+        )
+
+    return sse_response(events())
+
+
+@app.route("/gemini/cache", methods=["GET"])
+def gemini_cache_stats():
+    return jsonify(gemini_cache.stats())
 
 
 if __name__ == "__main__":
@@ -1,3 +1,27 @@
+// Reads a text/event-stream response and calls onEvent(name, data) for each event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let name = "message";
+            let data = "";
+            block.split("\n").forEach(line => {
+                if (line.startsWith("event: ")) name = line.slice(7);
+                else if (line.startsWith("data: ")) data += line.slice(6);
+            });
+            onEvent(name, JSON.parse(data));
+        }
+    }
+}
+
 function sendMessage(event) {
     if (event && event.key !== "Enter") return;
 
@@ -19,39 +43,39 @@ function sendMessage(event) {
     userDiv2.style.fontWeight = "bold";
     geminiChatbox.appendChild(userDiv2);
 
-    // Fetch diagnosis from API
-    fetch(`/diagnosis?symptoms=${userMessage}`)
-        .then(response => response.json())
-        .then(data => {
+    let geminiDiv = document.createElement("div");
+    geminiDiv.textContent = "Gemini: ";
+    geminiDiv.style.whiteSpace = "pre-wrap";
+    geminiChatbox.appendChild(geminiDiv);
+
+    // One request serves both panes: local matches arrive first, then
+    // the Gemini reply is streamed in as it is generated
+    fetch('/combined', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: userMessage })
+    })
+    .then(response => readEventStream(response, (name, data) => {
+        if (name === "local") {
             let botDiv = document.createElement("div");
-            if (data.error) {
-                botDiv.textContent = "Bot: " + data.error;
-            } else if (data.message) {
-                botDiv.textContent = "Bot: " + data.message;
+            if (data.results.length === 0) {
+                botDiv.textContent = "Bot: No matching diseases found";
             } else {
                 botDiv.innerHTML = "Bot: Possible diseases found:<br>";
-                data.forEach(disease => {
+                data.results.forEach(disease => {
                     botDiv.innerHTML += `<strong>${disease.name}</strong> (ICD-10: ${disease.icd10_codes}) <br>
                     <a href="${disease.info_link}" target="_blank">More info</a><br><br>`;
                 });
             }
             apiChatbox.appendChild(botDiv);
             apiChatbox.scrollTop = apiChatbox.scrollHeight;
-        });
-
-    // Fetch response from Gemini AI
-    fetch('/gemini', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: userMessage })
-    })
-    .then(response => response.json())
-    .then(data => {
-        let geminiDiv = document.createElement("div");
-        geminiDiv.textContent = "Gemini: " + (data.response || "No response");
-        geminiChatbox.appendChild(geminiDiv);
+        } else if (name === "message") {
+            geminiDiv.textContent += data;
+        } else if (name === "error") {
+            geminiDiv.textContent += "\n[Error: " + data + "]";
+        }
         geminiChatbox.scrollTop = geminiChatbox.scrollHeight;
-    });
+    }));
 
     inputField.value = "";
 }
@@ -3,8 +3,20 @@ from dotenv import load_dotenv, dotenv_values
 from pydantic import BaseModel
 import json
 import os
+import sys
 import google.generativeai as genai
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.admission import AdmissionControl
+from common.export import export_response
+from common.fuzzy import FuzzyIndex, requested_max_distance
+from common.lookup import RecordLookup
+from common.paging import page_params
+from common.profiling import install_profiler
+from common.ranking import SymptomRanker, diagnose_with_shortlist
+from common.resilience import DEGRADED_HEADERS, ModelGuard, ModelUnavailable, degraded_results, generativeai_timeout, unavailable_response
+from common.search_index import SearchIndex
+
 class Diagnosis(BaseModel):
     key_id: str
     primary_name: str
@@ -31,37 +43,68 @@ except Exception as e:
     print(f"Configuration error: {e}")
     raise ValueError("Failed to configure client with the API key")
 
+# Deadlines, retries and circuit breaker for every Gemini call
+gemini = ModelGuard("navarra", generativeai_timeout)
+
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "navarra")
+# Keep handlers free for local routes while model calls pile up
+admission = AdmissionControl(app, "navarra", {"get_diagnosis", "diagnosis"})
+# 503 + Retry-After for model calls without a local fallback
+app.register_error_handler(ModelUnavailable, unavailable_response)
 
 # Load the JSON file
 with open('diseases.json', encoding="utf-8") as file:  # Works cross-platform
     data = json.load(file)
 
+# Local ranker that picks the candidate records sent to Gemini
+disease_ranker = SymptomRanker(data)
+# key_id lookups for the detail page
+disease_lookup = RecordLookup(data)
+# Name index for /search_disease
+name_index = SearchIndex(data, fields=("primary_name",))
+# Typo-tolerant matching for /search_disease with mode "fuzzy"
+fuzzy_index = FuzzyIndex(data)
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
 @app.route('/diseases')
 def diseases():
-    return jsonify(data)
+    return export_response(data, request)
 @app.route('/search_disease', methods=['POST'])
 def search_disease():
     query = request.json.get('query', '').strip().lower()
     
     if not query:
         return jsonify({'error': 'Search keyword is required'}), 400
-
-    # Find all diseases that match the search term
-    matches = [disease for disease in data if query in disease["primary_name"].lower()]
+    try:
+        limit, offset = page_params(request.json)
+        max_distance = requested_max_distance(request.json.get('max_distance'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    headers = {}
+    if request.json.get('mode') == 'fuzzy':
+        # Closest names and synonyms first, tolerating typos
+        fuzzy_matches = fuzzy_index.search(query, limit=offset + limit, max_distance=max_distance)
+        matches = [dict(disease, similarity=score, matched_term=term) for disease, score, term in fuzzy_matches[offset:]]
+    else:
+        # One page of the diseases whose name contains the search term, best first
+        page = name_index.search_page(query, limit, offset)
+        matches = name_index.get_records(page.ids)
+        headers = page.headers()
 
     if matches:
-        return jsonify(matches)
+        return jsonify(matches), 200, headers
     else:
         return jsonify({'error': 'No diseases found'}), 404
 
 @app.route('/disease/<key_id>')
 def get_disease(key_id):
-    disease_info = next((d for d in data if d["key_id"] == key_id), None)
+    disease_info = disease_lookup.get(key_id)
 
     if disease_info:
         # Ensure word_synonyms is a list
@@ -87,7 +130,8 @@ def get_diagnosis():
 
     model = genai.GenerativeModel("gemini-1.5-flash-002")
     
-    response = model.generate_content(
+    response = gemini.call(
+        model.generate_content,
         contents=[
             f"Diagnose a patient with {disease_name}. Provide symptoms, possible causes, and treatment options."
         ]
@@ -99,20 +143,29 @@ def get_diagnosis():
 def diagnosis():
     symptoms = request.args.get('symptoms', '').strip().lower()
     model = genai.GenerativeModel("gemini-1.5-flash-002")
-    response = model.generate_content(
-        contents=[
-            "This is the existing data in JSON format: " + json.dumps(data),
-            "Match the closest disease with following symptoms: " + symptoms,
-            "Include the info_link_data in the response.",
-            "Return the top three matching items."
-        ],
-        generation_config={
-            "response_mime_type": "application/json",
-            "response_schema": list[Diagnosis]
-        }
-    )
 
-    return json.loads(response.text)
+    def ask(candidates):
+        response = gemini.call(
+            model.generate_content,
+            contents=[
+                "This is the existing data in JSON format: " + json.dumps(candidates),
+                "Match the closest disease with following symptoms: " + symptoms,
+                "Include the info_link_data in the response.",
+                "Return the top three matching items."
+            ],
+            generation_config={
+                "response_mime_type": "application/json",
+                "response_schema": list[Diagnosis]
+            }
+        )
+        return json.loads(response.text)
+
+    # Only the locally ranked shortlist goes into the prompt
+    try:
+        return jsonify(diagnose_with_shortlist(ask, disease_ranker, symptoms))
+    except ModelUnavailable:
+        # Model is down or too slow: answer from the local ranker instead
+        return jsonify(degraded_results(disease_ranker, symptoms)), 200, DEGRADED_HEADERS
 
 if __name__ == '__main__':
     app.run(debug=True, host="0.0.0.0", port=10000)
\ No newline at end of file
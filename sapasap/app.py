@@ -1,6 +1,7 @@
 from flask import Flask, render_template, request, jsonify
 import json
 import os
+import sys
 from dotenv import load_dotenv, dotenv_values
 from google import genai
 from pydantic import BaseModel
@@ -19,6 +20,11 @@ class Diagnosis(BaseModel):
     info_link_data: list[list[str]]
 
 
+class BatchDiagnosis(BaseModel):
+    index: int
+    diagnoses: list[Diagnosis]
+
+
 load_dotenv()
 config = dotenv_values(".env")
 
@@ -32,46 +38,142 @@ json_path = os.path.join(BASE_DIR, "sapasap/diseases.json")
 with open(json_path, encoding="utf-8") as f:
     diseases_data = json.load(f)
 
+sys.path.append(BASE_DIR)
+from common.admission import AdmissionControl
+from common.batch import batch_inputs, diagnose_batch
+from common.llm_cache import ResponseCache, data_version
+from common.lookup import RecordLookup
+from common.metrics import Metrics
+from common.profiling import install_profiler
+from common.ranking import SymptomRanker, diagnose_with_shortlist
+from common.resilience import DEGRADED_HEADERS, ModelGuard, ModelUnavailable, degraded_results, genai_timeout, unavailable_response
+from common.singleflight import SingleFlight
+
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "sapasap")
+
+# Local ranker that picks the candidate records sent to Gemini
+disease_ranker = SymptomRanker(diseases_data)
+# key_id lookups for the detail page
+disease_lookup = RecordLookup(diseases_data)
+
+DIAGNOSIS_MODEL = "gemini-2.0-flash"
+# Bump when the diagnosis prompt changes so cached answers are not reused
+DIAGNOSIS_PROMPT_VERSION = "1"
+# Cached diagnoses per symptom set, tied to the records loaded above
+diagnosis_cache = ResponseCache(version=data_version(diseases_data))
+# Deadlines, retries and circuit breaker for every Gemini call
+gemini = ModelGuard("sapasap", genai_timeout)
+# Concurrent /ai_solution requests for the same disease share one model call
+solution_flight = SingleFlight("sapasap-solution")
+# Request and model call metrics, served at /metrics
+metrics = Metrics("sapasap")
+metrics.init_app(app)
+# Keep handlers free for local routes while model calls pile up
+admission = AdmissionControl(app, "sapasap", {"POST home", "get_diagnosis", "get_batch_diagnosis", "ai_solution"})
+# 503 + Retry-After for model calls without a local fallback
+app.register_error_handler(ModelUnavailable, unavailable_response)
+metrics.register("diagnosis_cache", diagnosis_cache.stats,
+                 ("hits", "misses", "size", "evictions", "invalidations"))
+metrics.register("solution_flight", solution_flight.stats,
+                 ("calls", "executed", "coalesced", "coalesced_cross_worker", "errors", "in_flight"))
+metrics.register("circuit_breaker", gemini.breaker.stats, ("trips", "recent_calls"))
+metrics.register("admission", admission.stats,
+                 ("in_flight", "admitted", "queued", "rejected", "timed_out"), group="class")
+
 
 def generate_diagnosis(symptoms):
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[
-            "This is the existing data in JSON format: " + json.dumps(diseases_data),
-            "Match the closest disease with following symptoms: " + symptoms,
-            "Include the info_link_data in the response.",
-            "Return the top three matching items."
-        ],
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": list[Diagnosis]
-        }
+    def ask(candidates):
+        response = gemini.call(
+            metrics.wrap("diagnosis", client.models.generate_content),
+            model=DIAGNOSIS_MODEL,
+            contents=[
+                "This is the existing data in JSON format: " + json.dumps(candidates),
+                "Match the closest disease with following symptoms: " + symptoms,
+                "Include the info_link_data in the response.",
+                "Return the top three matching items."
+            ],
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": list[Diagnosis]
+            }
+        )
+        return json.loads(response.text)
+
+    # Only the locally ranked shortlist goes into the prompt
+    return diagnosis_cache.get_or_call(
+        symptoms, DIAGNOSIS_MODEL, DIAGNOSIS_PROMPT_VERSION,
+        lambda: diagnose_with_shortlist(ask, disease_ranker, symptoms)
     )
-    return json.loads(response.text)
 
 
 @app.route("/", methods=["GET", "POST"])
 def home():
     if request.method == "POST":
         symptom = request.form.get("symptom").lower()
-        matches = generate_diagnosis(symptom)
-        return render_template("results.html", matches=matches, symptom=symptom)
+        try:
+            matches = generate_diagnosis(symptom)
+            degraded = False
+        except ModelUnavailable:
+            matches = degraded_results(disease_ranker, symptom)
+            degraded = True
+        return render_template("results.html", matches=matches, symptom=symptom, degraded=degraded)
     return render_template("index.html")
 
 
 @app.route("/disease/<disease_id>")
 def disease_details(disease_id):
-    disease = next((d for d in diseases_data if d["key_id"] == disease_id), None)
-    return render_template("disease.html", disease=disease) if disease else "Not Found"
+    disease = disease_lookup.get(disease_id)
+    return render_template("disease.html", disease=disease) if disease else ("Not Found", 404)
 
 
 @app.route('/diagnosis', methods=['GET'])
 def get_diagnosis():
     symptoms = request.args.get('symptoms', '').lower()
-    matches = generate_diagnosis(symptoms)
+    try:
+        matches = generate_diagnosis(symptoms)
+    except ModelUnavailable:
+        # Model is down or too slow: answer from the local ranker instead
+        return jsonify(degraded_results(disease_ranker, symptoms)), 200, DEGRADED_HEADERS
     return jsonify(matches)
 
 
+@app.route('/diagnosis/batch', methods=['POST'])
+def get_batch_diagnosis():
+    try:
+        symptom_sets = batch_inputs(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def ask_group(candidates, queries):
+        response = gemini.call(
+            metrics.wrap("diagnosis_batch", client.models.generate_content),
+            model=DIAGNOSIS_MODEL,
+            contents=[
+                "This is the existing data in JSON format: " + json.dumps(candidates),
+                "These are numbered symptom sets: " + json.dumps(queries),
+                "For each symptom set, match the closest diseases from the data.",
+                "Include the info_link_data in the response.",
+                "Return the index of each symptom set with its top three matching items."
+            ],
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": list[BatchDiagnosis]
+            }
+        )
+        return json.loads(response.text)
+
+    return jsonify({"results": diagnose_batch(
+        ask_group, disease_ranker, symptom_sets,
+        cache=diagnosis_cache, model=DIAGNOSIS_MODEL, prompt_version=DIAGNOSIS_PROMPT_VERSION
+    )})
+
+
+@app.route('/diagnosis/cache', methods=['GET'])
+def diagnosis_cache_stats():
+    return jsonify(diagnosis_cache.stats())
+
+
 @app.route("/ai_solution", methods=["GET"])
 def ai_solution():
     disease_name = request.args.get("disease_name", "")
@@ -79,15 +181,31 @@ def ai_solution():
     if not disease_name:
         return jsonify({"solution": "No disease name provided."})
 
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[
-            f"Provide a simple treatment or solution for {disease_name}.",
-            "Keep it clear and concise for a general audience."
-        ]
-    )
-
-    return jsonify({"solution": response.text})
+    # Spelling variants of a known disease share one call; other names are not coalesced
+    disease_name = " ".join(disease_name.split())
+    matches = disease_lookup.name(disease_name)
+    if matches:
+        disease_name = matches[0]["primary_name"]
+
+    def generate():
+        response = gemini.call(
+            metrics.wrap("ai_solution", client.models.generate_content),
+            model="gemini-2.0-flash",
+            contents=[
+                f"Provide a simple treatment or solution for {disease_name}.",
+                "Keep it clear and concise for a general audience."
+            ]
+        )
+        return response.text
+
+    if not matches:
+        return jsonify({"solution": generate()})
+    return jsonify({"solution": solution_flight.do(matches[0]["key_id"], generate)})
+
+
+@app.route("/ai_solution/stats", methods=["GET"])
+def ai_solution_stats():
+    return jsonify(solution_flight.stats())
 
 
 if __name__ == "__main__":
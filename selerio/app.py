@@ -1,9 +1,10 @@
 import os
+import sys
 import json
-import re
 from flask import Flask, jsonify, render_template, request
 from dotenv import load_dotenv, dotenv_values
 import google.generativeai as genai
+from pydantic import BaseModel
 
 # Load environment variables
 load_dotenv()
@@ -24,6 +25,82 @@ if not os.path.exists(JSON_PATH):
 with open(JSON_PATH, "r", encoding="utf-8") as file:
     diseases = json.load(file)
 
+sys.path.append(os.path.dirname(BASE_DIR))
+from common.admission import AdmissionControl
+from common.lookup import RecordLookup
+from common.metrics import Metrics
+from common.profiling import install_profiler
+from common.resilience import ModelGuard, ModelUnavailable, generativeai_timeout, unavailable_response
+from common.singleflight import SingleFlight
+from common.structured import StructuredOutputError, StructuredParser
+
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "selerio")
+
+# key_id lookups for /gemini-response
+disease_lookup = RecordLookup(diseases)
+
+
+# Fields requested from Gemini by /gemini-response
+class DiseaseDetails(BaseModel):
+    primary_name: str
+    description: str
+    symptoms: str | list[str]
+    treatment: str | list[str]
+
+
+DETAIL_FIELDS = {
+    "primary_name": "The name of the disease",
+    "description": "A brief overview of the disease in 3 sentences",
+    "symptoms": "Common symptoms associated with the disease in 2 sentences",
+    "treatment": "Effective treatments or remedies in 5 sentences",
+}
+details_parser = StructuredParser(DiseaseDetails)
+# Concurrent /gemini-response requests for the same key_id share one model call
+details_flight = SingleFlight("selerio-details")
+# Deadlines, retries and circuit breaker for the Gemini calls
+gemini = ModelGuard("selerio", generativeai_timeout)
+# Request and model call metrics, served at /metrics
+metrics = Metrics("selerio")
+metrics.init_app(app)
+# Keep handlers free for local routes while model calls pile up
+admission = AdmissionControl(app, "selerio", {"gemini_response"})
+metrics.register("details_flight", details_flight.stats,
+                 ("calls", "executed", "coalesced", "coalesced_cross_worker", "errors", "in_flight"))
+metrics.register("circuit_breaker", gemini.breaker.stats, ("trips", "recent_calls"))
+metrics.register("admission", admission.stats,
+                 ("in_flight", "admitted", "queued", "rejected", "timed_out"), group="class")
+
+
+def details_prompt(disease_name, fields):
+    return (
+        f"Provide detailed information about the following disease: {disease_name}\n"
+        "Return the response in valid JSON format with these fields:\n"
+        + "".join(f"- {field}: {DETAIL_FIELDS[field]}\n" for field in fields)
+    )
+
+
+def generate_details(disease_name):
+    """Ask Gemini for the disease details and parse them into a DiseaseDetails dict."""
+    # Initialize the generative model
+    model = genai.GenerativeModel('gemini-1.5-flash-latest')
+
+    call = metrics.wrap("disease_details", model.generate_content)
+
+    def generate(prompt):
+        return gemini.call(call, prompt)
+
+    # Generate content
+    response = generate(details_prompt(disease_name, DETAIL_FIELDS))
+
+    raw_response = response.text
+
+    def complete(have, missing):
+        # Ask again for the missing or malformed fields only
+        return generate(details_prompt(disease_name, missing)).text
+
+    return details_parser.parse(raw_response, complete)
+
 
 @app.route("/")
 def home():
@@ -64,39 +141,25 @@ def gemini_response():
         return jsonify({"error": "No key_id provided"}), 400
 
     # Find the disease by key_id
-    disease = next((d for d in diseases if d["key_id"] == key_id), None)
+    disease = disease_lookup.get(key_id)
     
     if not disease:
         return jsonify({"error": "Disease not found"}), 404
 
     try:
-        # Initialize the generative model
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')  
-
-        # Generate content
-        response = model.generate_content(
-            f"Provide detailed information about the following disease: {disease['primary_name']}\n"
-            "Return the response in valid JSON format with these fields:\n"
-            "- primary_name: The name of the disease\n"
-            "- description: A brief overview of the disease in 3 sentences\n"
-            "- symptoms: Common symptoms associated with the disease in 2 sentences\n"
-            "- treatment: Effective treatments or remedies in 5 sentences\n"
-        )
-
-        raw_response = response.text
-        print("AI Raw Response:", raw_response)  # Debugging output
-
-        # Remove markdown formatting if present
-        cleaned_response = re.sub(r"```json\s*([\s\S]*?)\s*```", r"\1", raw_response).strip()
-
-        try:
-            disease_data = json.loads(cleaned_response)
-            return jsonify(disease_data)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Invalid response from AI", "raw_response": cleaned_response}), 500
-
+        disease_data = details_flight.do(key_id, lambda: generate_details(disease['primary_name']))
+        return jsonify(disease_data)
+    except StructuredOutputError as e:
+        return jsonify({"error": "Invalid response from AI", "raw_response": e.raw}), 500
+    except ModelUnavailable:
+        return unavailable_response()
     except Exception as e:
         return jsonify({"error": f"Failed to generate response: {str(e)}"}), 500
 
+@app.route("/gemini-response/stats", methods=["GET"])
+def gemini_response_stats():
+    """Counters for collapsed /gemini-response calls"""
+    return jsonify(details_flight.stats())
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -4,9 +4,17 @@ from google import genai
 from pydantic import BaseModel
 import json
 import os
+import sys
 import requests
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.fuzzy import FuzzyIndex, requested_max_distance
+from common.profiling import install_profiler
+from common.search_index import SearchIndex
+
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "taganahan")
 
 def load_diseases():
     with open("diseases.json", "r") as file:
@@ -22,6 +30,12 @@ def load_diseases():
         }
 
 diseases = load_diseases()
+# Index ids, names and ICD-10 codes once for /search
+disease_keys = list(diseases)
+search_records = [dict(value, key_id=key) for key, value in diseases.items()]
+search_index = SearchIndex(search_records, fields=("key_id", "name", "icd10cm_codes"))
+# Typo-tolerant name matching for /search?mode=fuzzy
+fuzzy_index = FuzzyIndex(search_records, fields=("name",))
 load_dotenv()
 config = dotenv_values(".env")
 client = genai.Client(api_key=config['GEMINI_API_KEY'])
@@ -33,11 +47,17 @@ def index():
 @app.route("/search")
 def search():
     query = request.args.get("q", "").lower()
+    if request.args.get("mode") == "fuzzy":
+        try:
+            max_distance = requested_max_distance(request.args.get("max_distance"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # Ranked list, closest names first
+        matches = fuzzy_index.search(query, max_distance=max_distance)
+        return jsonify([dict(item, similarity=score, matched_term=term) for item, score, term in matches])
+    # Search by ID, Name or ICD-10 Codes
     filtered_diseases = {
-        key: value for key, value in diseases.items()
-        if query in key.lower()  # Search by ID
-        or query in value["name"].lower()  # Search by Name
-        or query in value["icd10cm_codes"].lower()  # Search by ICD-10 Codes
+        disease_keys[i]: diseases[disease_keys[i]] for i in search_index.search_ids(query)
     }
     return jsonify(filtered_diseases)
 
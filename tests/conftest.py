@@ -0,0 +1,16 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+DATASET = os.path.join(ROOT, "valencia", "diseases.json")
+
+
+@pytest.fixture(scope="session")
+def diseases():
+    with open(DATASET, encoding="utf-8") as f:
+        return json.load(f)
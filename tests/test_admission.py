@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+from flask import Flask, Response
+
+from common.admission import LOCAL, MODEL, AdmissionControl
+
+
+def make_app(tmp_path, **limits):
+    app = Flask(__name__)
+    gate = threading.Event()
+    entered = threading.Event()
+
+    @app.route("/ask")
+    def ask():
+        entered.set()
+        gate.wait(5)
+        return "answer"
+
+    @app.route("/stream")
+    def stream():
+        def body():
+            yield "data: one\n\n"
+            yield "data: %d\n\n" % admission.classes[MODEL].counts["in_flight"]
+        return Response(body(), mimetype="text/event-stream")
+
+    @app.route("/search")
+    def search():
+        return "results"
+
+    admission = AdmissionControl(app, "test", {"ask", "stream"}, lock_dir=str(tmp_path), **limits)
+    return app, admission, gate, entered
+
+
+@pytest.mark.parametrize("capacity, reserved, queue, limit, queued", [
+    (4, 1, None, 3, 0),
+    (4, 1, 2, 1, 2),
+    (4, 1, 10, 1, 2),
+    (2, 4, 3, 1, 0),
+])
+def test_queue_is_taken_from_the_model_share(tmp_path, capacity, reserved, queue, limit, queued):
+    _, admission, _, _ = make_app(tmp_path, capacity=capacity, reserved=reserved, queue=queue)
+    assert admission.classes[MODEL].limit == limit
+    assert admission.classes[MODEL].queue == queued
+    assert admission.classes[LOCAL].limit == capacity
+
+
+def test_busy_model_route_sheds_but_local_routes_run(tmp_path):
+    app, admission, gate, entered = make_app(tmp_path, capacity=2, reserved=1, queue=0, wait=0.1)
+    client = app.test_client()
+    holder = threading.Thread(target=lambda: client.get("/ask").close())
+    holder.start()
+    try:
+        assert entered.wait(5)
+        busy = client.get("/ask")
+        assert busy.status_code == 503
+        assert busy.headers["Retry-After"]
+        assert client.get("/search").status_code == 200
+    finally:
+        gate.set()
+        holder.join()
+    assert admission.classes[MODEL].counts["rejected"] == 1
+    assert admission.classes[MODEL].counts["in_flight"] == 0
+
+
+def test_slot_is_held_while_a_stream_is_sent(tmp_path):
+    app, admission, _, _ = make_app(tmp_path, capacity=4, reserved=1)
+    response = app.test_client().get("/stream")
+    assert response.get_data(as_text=True) == "data: one\n\ndata: 1\n\n"
+    response.close()
+    assert admission.classes[MODEL].counts["in_flight"] == 0
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from common.autocomplete import PrefixIndex, SuggestionEnricher
+
+RECORDS = [
+    {"primary_name": "Meningitis", "synonyms": ["Brain fever"], "word_synonyms": "fever;headache;stiff neck"},
+    {"primary_name": "Influenza", "synonyms": ["Flu"], "word_synonyms": "fever;feverish;headache"},
+    {"primary_name": "Heatstroke", "synonyms": [], "word_synonyms": "fever;heat exhaustion"},
+]
+
+
+def test_prefix_suggestions_are_ranked_by_use():
+    index = PrefixIndex(RECORDS)
+    assert index.suggest("fe") == ["fever", "feverish"]
+    assert index.suggest("HEA")[:2] == ["headache", "heat"]
+    assert index.suggest("he", limit=1) == ["headache"]
+
+
+def test_short_and_missing_prefixes():
+    index = PrefixIndex(RECORDS)
+    assert index.suggest("") == []
+    assert index.suggest("zz") == []
+    # Terms shorter than three letters are not indexed
+    assert "flu" in index.suggest("fl")
+
+
+class Fetcher:
+    def __init__(self, result=("Chills",), error=None):
+        self.result = list(result)
+        self.error = error
+        self.queries = []
+        self.release = threading.Event()
+        self.release.set()
+        self.done = threading.Event()
+
+    def __call__(self, query):
+        self.queries.append(query)
+        self.release.wait(5)
+        try:
+            if self.error:
+                raise self.error
+            return self.result
+        finally:
+            self.done.set()
+
+
+def settle(enricher):
+    enricher._executor.shutdown(wait=True)
+
+
+def test_lookup_never_waits_and_serves_the_fetch_later():
+    fetch = Fetcher()
+    enricher = SuggestionEnricher(fetch)
+    assert enricher.lookup("fev") == []
+    assert fetch.done.wait(5)
+    settle(enricher)
+    assert enricher.lookup("fev ") == ["chills"]
+    assert fetch.queries == ["fev"]
+
+
+def test_short_queries_are_not_fetched():
+    fetch = Fetcher()
+    enricher = SuggestionEnricher(fetch, min_query_length=3)
+    assert enricher.lookup(" fe ") == []
+    settle(enricher)
+    assert fetch.queries == []
+
+
+def test_failures_are_remembered():
+    fetch = Fetcher(error=RuntimeError("model down"))
+    enricher = SuggestionEnricher(fetch)
+    enricher.lookup("fever")
+    assert fetch.done.wait(5)
+    settle(enricher)
+    assert enricher.lookup("fever") == []
+    assert fetch.queries == ["fever"]
+
+
+def test_fetches_beyond_max_pending_are_dropped():
+    fetch = Fetcher()
+    fetch.release.clear()
+    enricher = SuggestionEnricher(fetch, max_workers=1, max_pending=2)
+    for query in ("aaa", "bbb", "ccc", "aaa"):
+        enricher.lookup(query)
+    fetch.release.set()
+    settle(enricher)
+    assert enricher.dropped == 1
+    assert sorted(fetch.queries) == ["aaa", "bbb"]
@@ -0,0 +1,89 @@
+import pytest
+
+from common.batch import MAX_BATCH_SIZE, batch_inputs, diagnose_batch
+from common.llm_cache import ResponseCache
+from common.ranking import SymptomRanker
+from common.resilience import ModelUnavailable
+
+RECORDS = [
+    {"key_id": "1", "primary_name": "Meningitis", "synonyms": [], "word_synonyms": "fever;stiff neck;headache"},
+    {"key_id": "2", "primary_name": "Migraine", "synonyms": [], "word_synonyms": "headache;nausea"},
+    {"key_id": "3", "primary_name": "Influenza", "synonyms": [], "word_synonyms": "fever;cough;aches;chills"},
+]
+
+
+@pytest.fixture
+def ranker():
+    return SymptomRanker(RECORDS)
+
+
+class Model:
+    """Answers every query with the first candidate, recording each call."""
+
+    def __init__(self, error=None, skip=()):
+        self.calls = []
+        self.error = error
+        self.skip = set(skip)
+
+    def __call__(self, candidates, queries):
+        self.calls.append(([record["key_id"] for record in candidates], [query["index"] for query in queries]))
+        if self.error:
+            raise self.error
+        return [{"index": query["index"], "diagnoses": [candidates[0]["primary_name"]]}
+                for query in queries if query["index"] not in self.skip]
+
+
+def test_batch_inputs():
+    assert batch_inputs({"symptoms": ["fever"]}) == ["fever"]
+    assert batch_inputs(["fever"]) == ["fever"]
+    for payload in ({}, {"symptoms": []}, "fever", {"symptoms": ["x"] * (MAX_BATCH_SIZE + 1)}):
+        with pytest.raises(ValueError):
+            batch_inputs(payload)
+
+
+def test_results_come_back_in_input_order(ranker):
+    model = Model()
+    results = diagnose_batch(model, ranker, ["Fever, stiff neck", "nausea", ""], group_size=8)
+    assert results[0] == {"symptoms": "fever, stiff neck", "diagnosis": ["Meningitis"]}
+    assert results[1]["diagnosis"]
+    assert "error" in results[2]
+    assert len(model.calls) == 1
+
+
+def test_sets_are_grouped(ranker):
+    model = Model()
+    diagnose_batch(model, ranker, ["fever", "cough", "nausea"], group_size=2)
+    assert sorted(indexes for _, indexes in model.calls) == [[0, 1], [2]]
+
+
+def test_unmatched_set_is_asked_with_default_candidates(ranker):
+    model = Model()
+    results = diagnose_batch(model, ranker, ["zzz"])
+    assert results[0]["diagnosis"]
+    assert model.calls[0][0] == [record["key_id"] for record in ranker.default_candidates()]
+
+
+def test_skipped_failed_and_unavailable_groups(ranker):
+    assert "error" in diagnose_batch(Model(skip={0}), ranker, ["fever"])[0]
+    assert diagnose_batch(Model(error=RuntimeError("bad reply")), ranker, ["fever"])[0]["error"] == "bad reply"
+    degraded = diagnose_batch(Model(error=ModelUnavailable()), ranker, ["fever"])[0]
+    assert degraded["degraded"] is True
+    assert degraded["diagnosis"][0]["degraded"] is True
+
+
+def test_cached_sets_skip_the_model(ranker):
+    cache = ResponseCache()
+    model = Model()
+    diagnose_batch(model, ranker, ["fever"], cache=cache, model="m", prompt_version="1")
+    again = diagnose_batch(model, ranker, ["FEVER"], cache=cache, model="m", prompt_version="1")
+    assert again[0]["diagnosis"] == ["Meningitis"]
+    assert len(model.calls) == 1
+
+
+def test_batch_answers_do_not_share_keys_with_single_diagnoses(ranker):
+    cache = ResponseCache()
+    cache.set(cache.key("fever", "m", "1"), "single /diagnosis answer")
+    model = Model()
+    results = diagnose_batch(model, ranker, ["fever"], cache=cache, model="m", prompt_version="1")
+    assert results[0]["diagnosis"] == ["Meningitis"]
+    assert cache.get(cache.key("fever", "m", "1")) == (True, "single /diagnosis answer")
@@ -0,0 +1,65 @@
+import re
+
+import pytest
+
+from common.bitmap import BitmapIndex, QueryError, searchable_attributes
+
+RECORDS = [
+    {"primary_name": "Meningitis", "word_synonyms": "fever;stiff neck;headache", "synonyms": [],
+     "icd10cm": [{"code": "G03.9"}]},
+    {"primary_name": "Meningitis - fungal", "word_synonyms": "fever;neck pain", "synonyms": []},
+    {"primary_name": "Measles", "word_synonyms": "fever;rash", "synonyms": ["Rubeola"]},
+    {"primary_name": "Migraine", "word_synonyms": "headache;nausea", "synonyms": None},
+]
+
+
+@pytest.fixture
+def index():
+    return BitmapIndex(RECORDS)
+
+
+def names(index, bitmap):
+    return [record["primary_name"] for record in index.get_records(bitmap)]
+
+
+def old_matcher(records, symptoms):
+    """biaca's original loop: any symptom is a substring of any attribute."""
+    return [record for record in records
+            if any(any(re.search(re.escape(symptom.lower()), attribute)
+                       for attribute in searchable_attributes(record)) for symptom in symptoms)]
+
+
+@pytest.mark.parametrize("symptoms", [["fever"], ["neck", "rash"], ["g03"], ["HEAD"], ["xyz"], ["ra"], ["fever "]])
+def test_any_of_matches_the_old_matcher(index, symptoms):
+    assert index.get_records(index.any_of(symptoms)) == old_matcher(RECORDS, symptoms)
+
+
+def test_any_of_over_the_bundled_dataset(diseases):
+    index = BitmapIndex(diseases[:500])
+    for symptoms in (["fever"], ["stiff neck", "vomit"], ["a"]):
+        assert index.get_records(index.any_of(symptoms)) == old_matcher(diseases[:500], symptoms)
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("fever AND rash", ["Measles"]),
+    ("headache OR rash", ["Meningitis", "Measles", "Migraine"]),
+    ("fever NOT fungal", ["Meningitis", "Measles"]),
+    ("fever AND NOT (rash OR fungal)", ["Meningitis"]),
+    ("stiff neck", ["Meningitis"]),
+    ('"neck pain" OR nausea', ["Meningitis - fungal", "Migraine"]),
+    ("NOT fever", ["Migraine"]),
+    ("headache OR NOT nausea", ["Meningitis", "Meningitis - fungal", "Measles", "Migraine"]),
+])
+def test_query(index, expression, expected):
+    assert names(index, index.query(expression)) == expected
+
+
+@pytest.mark.parametrize("expression", ["", "fever AND", "(fever", "fever)", "AND", '""'])
+def test_malformed_queries(index, expression):
+    with pytest.raises(QueryError):
+        index.query(expression)
+
+
+def test_ids_are_in_file_order():
+    assert BitmapIndex.ids(0b1011) == [0, 1, 3]
+    assert BitmapIndex.ids(0) == []
@@ -0,0 +1,60 @@
+import pytest
+
+from common import bm25
+from common.bm25 import BM25Index, requested_ranking
+
+RECORDS = [
+    {"primary_name": "Scarlet fever", "synonyms": ["scarlatina"], "word_synonyms": "fever;rash;sore throat"},
+    {"primary_name": "Common cold", "synonyms": [], "word_synonyms": "cough;sore throat;runny nose"},
+    {"primary_name": "Influenza", "synonyms": ["flu"], "word_synonyms": "fever;feverish;cough;aches"},
+    {"primary_name": "Eczema", "synonyms": [], "word_synonyms": "rash;itching"},
+]
+
+
+@pytest.fixture(params=["bm25", "tfidf"])
+def index(request):
+    return BM25Index(RECORDS, scheme=request.param)
+
+
+def names(results):
+    return [record["primary_name"] for record, _, _ in results]
+
+
+def test_record_matching_every_symptom_ranks_first(index):
+    assert names(index.search("fever, rash"))[0] == "Scarlet fever"
+
+
+def test_results_are_sorted_and_limited(index):
+    results = index.search("fever, cough, rash", k=2)
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1]
+
+
+def test_prefix_expansion_scores_each_query_word_once(index):
+    # "fever" also prefixes "feverish"; Influenza must not score for both
+    groups = index.query_terms("fever")
+    assert groups == [["fever", "feverish"]]
+    results = {record["primary_name"]: score for record, score, _ in index.search("fever")}
+    best = max(index.scores([["fever"]])[2], index.scores([["feverish"]])[2])
+    assert results["Influenza"] == pytest.approx(round(float(best), 4))
+
+
+def test_matched_terms_are_reported(index):
+    record, _, terms = index.search("rash")[0]
+    assert "rash" in terms
+
+
+def test_no_match_returns_nothing(index):
+    assert index.search("xylophone") == []
+    assert index.search("") == []
+
+
+def test_requested_ranking():
+    assert requested_ranking({"rank": "TFIDF"}) == "tfidf"
+    assert requested_ranking({"rank": "nonsense"}) == "match"
+
+
+@pytest.mark.parametrize("args, expected", [({"limit": "5"}, 5), ({"limit": "0"}, 1), ({"limit": "x"}, 20), ({}, 20)])
+def test_requested_top_k(args, expected, monkeypatch):
+    monkeypatch.setattr(bm25, "DEFAULT_TOP_K", 20)
+    assert bm25.requested_top_k(args) == expected
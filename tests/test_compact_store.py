@@ -0,0 +1,69 @@
+import json
+import os
+import stat
+
+import pytest
+
+from common.compact_store import CompactDataset, CompactRecord, build, is_current, open_dataset
+from common.search_index import SearchIndex
+
+
+@pytest.fixture
+def source(tmp_path, diseases):
+    path = tmp_path / "diseases.json"
+    path.write_text(json.dumps(diseases[:300]), encoding="utf-8")
+    return path
+
+
+def test_records_read_back_like_the_json(source):
+    dataset = CompactDataset(build(str(source)))
+    records = json.loads(source.read_text(encoding="utf-8"))
+    assert len(dataset) == len(records)
+    assert [record.to_dict() for record in dataset] == records
+    assert dataset[-1]["key_id"] == records[-1]["key_id"]
+    with pytest.raises(IndexError):
+        dataset[len(records)]
+
+
+def test_built_file_is_readable_by_other_users(source):
+    mode = stat.S_IMODE(os.stat(build(str(source))).st_mode)
+    assert mode == 0o644
+
+
+def test_open_dataset_maps_a_current_file(source):
+    build(str(source))
+    dataset = open_dataset(str(source))
+    assert isinstance(dataset, CompactDataset)
+    assert isinstance(dataset[0], CompactRecord)
+
+
+def test_open_dataset_never_builds(source, tmp_path):
+    records = open_dataset(str(source))
+    assert isinstance(records, list)
+    assert not (tmp_path / "diseases.dzc").exists()
+
+
+def test_stale_file_falls_back_to_the_json(source):
+    compact = build(str(source))
+    source.write_text(json.dumps([{"key_id": "new"}]), encoding="utf-8")
+    assert not is_current(str(source), compact)
+    assert open_dataset(str(source)) == [{"key_id": "new"}]
+
+
+def test_unmappable_file_falls_back_to_the_json(source, monkeypatch):
+    build(str(source))
+
+    def broken(self, path):
+        raise OSError("permission denied")
+
+    monkeypatch.setattr(CompactDataset, "__init__", broken)
+    assert isinstance(open_dataset(str(source)), list)
+
+
+def test_index_without_cached_values_matches(source):
+    records = json.loads(source.read_text(encoding="utf-8"))
+    plain = SearchIndex(records)
+    compact = SearchIndex(CompactDataset(build(str(source))), cache_values=False)
+    for query in ["fever", "pain", "a", "stiff neck", "xylophone", ""]:
+        assert compact.search_ids(query) == plain.search_ids(query)
+        assert compact.search_page(query, 20).ids == plain.search_page(query, 20).ids
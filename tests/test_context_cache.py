@@ -0,0 +1,164 @@
+import pytest
+
+from common.context_cache import ContextCache, LocalBackend, is_cache_gone
+
+PREFIX = ["the dataset"]
+
+
+def make_cache(backend, **options):
+    return ContextCache(backend, "model", PREFIX, **options)
+
+
+def test_prefix_is_cached_once_and_reused():
+    backend = LocalBackend(lambda contents: " | ".join(contents))
+    cache = make_cache(backend)
+    assert cache.generate_content(["first"]).text == "the dataset | first"
+    assert cache.generate_content(["second"]).text == "the dataset | second"
+    assert len(backend.caches) == 1
+    assert [call["cache"] for call in backend.calls] == [cache.handle()] * 2
+    assert cache.stats()["cached_requests"] == 2
+
+
+def test_cache_dropped_upstream_is_recreated():
+    backend = LocalBackend(lambda contents: " | ".join(contents))
+    cache = make_cache(backend)
+    cache.generate_content(["first"])
+    backend.caches.clear()
+    assert cache.generate_content(["second"]).text == "the dataset | second"
+    assert cache.stats()["inline_requests"] == 1
+    assert cache.generate_content(["third"]).text == "the dataset | third"
+    assert cache.stats()["created"] == 2
+
+
+def test_other_errors_keep_the_cache():
+    calls = []
+
+    def respond(contents):
+        calls.append(contents)
+        if len(calls) == 2:
+            raise TimeoutError("slow model")
+        return "ok"
+
+    backend = LocalBackend(respond)
+    cache = make_cache(backend)
+    cache.generate_content(["first"])
+    handle = cache.handle()
+    with pytest.raises(TimeoutError):
+        cache.generate_content(["second"])
+    assert cache.handle() == handle
+    assert handle in backend.caches
+
+
+def test_expiring_cache_is_extended(monkeypatch):
+    from common import context_cache
+    now = [1000.0]
+    monkeypatch.setattr(context_cache.time, "time", lambda: now[0])
+    backend = LocalBackend()
+    cache = make_cache(backend, ttl=600, refresh_margin=60)
+    handle = cache.handle()
+    now[0] += 550
+    assert cache.handle() == handle
+    assert cache.stats()["refreshed"] == 1
+
+
+def test_failed_create_sends_prefix_inline_and_backs_off(monkeypatch):
+    backend = LocalBackend(lambda contents: " | ".join(contents))
+    attempts = []
+
+    def create_cache(model, contents, ttl):
+        attempts.append(1)
+        raise RuntimeError("caching not supported")
+
+    monkeypatch.setattr(backend, "create_cache", create_cache)
+    cache = make_cache(backend)
+    assert cache.generate_content(["a"]).text == "the dataset | a"
+    assert cache.generate_content(["b"]).text == "the dataset | b"
+    assert len(attempts) == 1
+    assert cache.stats()["failures"] == 1
+
+
+def test_changed_version_replaces_the_cache():
+    version = ["v1"]
+    data = {"v1": ["old data"], "v2": ["new data"]}
+    backend = LocalBackend(lambda contents: " | ".join(contents))
+    cache = ContextCache(backend, "model", lambda: data[version[0]], version=lambda: version[0])
+    assert cache.generate_content(["q"]).text == "old data | q"
+    version[0] = "v2"
+    assert cache.generate_content(["q"]).text == "new data | q"
+    assert len(backend.caches) == 1
+
+
+def test_callable_prefix_needs_a_version():
+    with pytest.raises(ValueError):
+        ContextCache(LocalBackend(), "model", lambda: PREFIX)
+
+
+class Status(Exception):
+    def __init__(self, code):
+        self.code = code
+
+
+@pytest.mark.parametrize("error, gone", [
+    (Status(404), True),
+    (Status(403), True),
+    (Status(429), False),
+    (Status(500), False),
+    (TimeoutError(), False),
+    (type("PermissionDenied", (Exception,), {})(), True),
+])
+def test_is_cache_gone(error, gone):
+    assert is_cache_gone(error) is gone
+
+
+def expiring_cache(monkeypatch, backend):
+    from common import context_cache
+    now = [1000.0]
+    monkeypatch.setattr(context_cache.time, "time", lambda: now[0])
+    cache = make_cache(backend, ttl=600, refresh_margin=60)
+    return cache, now
+
+
+def test_transient_extend_failure_keeps_the_cache(monkeypatch):
+    backend = LocalBackend()
+    cache, now = expiring_cache(monkeypatch, backend)
+    handle = cache.handle()
+    attempts = []
+
+    def extend_cache(handle, ttl):
+        attempts.append(handle)
+        raise Status(429)
+
+    monkeypatch.setattr(backend, "extend_cache", extend_cache)
+    now[0] += 550
+    assert cache.handle() == handle
+    # Not retried on every request
+    assert cache.handle() == handle
+    assert len(attempts) == 1
+    now[0] += 30
+    assert cache.handle() == handle
+    assert len(attempts) == 2
+    assert cache.stats()["created"] == 1
+    assert handle in backend.caches
+
+
+def test_gone_cache_on_extend_is_replaced(monkeypatch):
+    backend = LocalBackend()
+    cache, now = expiring_cache(monkeypatch, backend)
+    handle = cache.handle()
+    del backend.caches[handle]
+    now[0] += 550
+    assert cache.handle() not in (None, handle)
+    assert cache.stats()["created"] == 2
+
+
+def test_expired_cache_is_replaced_after_failed_extends(monkeypatch):
+    backend = LocalBackend()
+    cache, now = expiring_cache(monkeypatch, backend)
+    handle = cache.handle()
+
+    def extend_cache(handle, ttl):
+        raise TimeoutError()
+
+    monkeypatch.setattr(backend, "extend_cache", extend_cache)
+    now[0] += 601
+    assert cache.handle() not in (None, handle)
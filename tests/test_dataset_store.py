@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from common.dataset_store import DatasetStore
+
+
+def write(path, records, mtime):
+    path.write_text(json.dumps(records), encoding="utf-8")
+    os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "diseases.json"
+    write(path, [{"key_id": "1"}], 1_000_000_000)
+    return path
+
+
+def test_records_are_parsed_once(data_file):
+    store = DatasetStore(str(data_file), check_interval=0)
+    first = store.snapshot()
+    assert first.records == ({"key_id": "1"},)
+    assert store.snapshot() is first
+
+
+def test_changed_file_is_reloaded_and_listeners_run(data_file):
+    store = DatasetStore(str(data_file), check_interval=0)
+    old = store.snapshot()
+    seen = []
+    store.on_reload(seen.append)
+    write(data_file, [{"key_id": "1"}, {"key_id": "2"}], 2_000_000_000)
+    new = store.snapshot()
+    assert len(new.records) == 2
+    assert new.digest != old.digest
+    assert seen == [new]
+    # A request holding the old snapshot keeps a consistent view
+    assert len(old.records) == 1
+
+
+def test_touched_but_unchanged_file_is_not_parsed_again(data_file):
+    store = DatasetStore(str(data_file), check_interval=0)
+    old = store.snapshot()
+    seen = []
+    store.on_reload(seen.append)
+    os.utime(data_file, ns=(3_000_000_000, 3_000_000_000))
+    new = store.snapshot()
+    assert new.records is old.records
+    assert new.mtime == 3_000_000_000
+    assert not seen
+
+
+def test_half_written_or_missing_file_keeps_the_last_snapshot(data_file):
+    store = DatasetStore(str(data_file), check_interval=0)
+    old = store.snapshot()
+    data_file.write_text('[{"key_id": ', encoding="utf-8")
+    os.utime(data_file, ns=(4_000_000_000, 4_000_000_000))
+    assert store.snapshot().records == old.records
+    data_file.unlink()
+    assert store.snapshot().records == old.records
+
+
+def test_file_is_checked_at_most_once_per_interval(data_file):
+    store = DatasetStore(str(data_file), check_interval=3600)
+    store.snapshot()
+    write(data_file, [], 5_000_000_000)
+    assert len(store.records) == 1
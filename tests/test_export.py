@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from flask import Flask, request
+
+from common import export
+from common.export import export_options, export_response, icd10_codes, iter_records
+
+RECORDS = [
+    {"key_id": "1", "primary_name": "Meningitis", "is_procedure": False, "icd10cm": [{"code": "G03.9"}]},
+    {"key_id": "2", "primary_name": "Appendectomy", "is_procedure": True, "icd10cm_codes": "K35.80, K37"},
+    {"key_id": "3", "primary_name": "Measles", "is_procedure": False},
+]
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route("/diseases")
+    def diseases():
+        return export_response(RECORDS, request)
+
+    @app.route("/broken")
+    def broken():
+        return export_response({"error": "Could not load data"}, request)
+
+    return app.test_client()
+
+
+def test_icd10_codes_reads_either_field():
+    assert icd10_codes(RECORDS[0]) == ["G03.9"]
+    assert icd10_codes(RECORDS[1]) == ["K35.80", "K37"]
+    assert icd10_codes(RECORDS[2]) == []
+
+
+def test_export_options():
+    assert export_options({}) == {"format": "json", "fields": None, "is_procedure": None, "icd": None}
+    assert export_options({}, "application/x-ndjson")["format"] == "ndjson"
+    options = export_options({"fields": " key_id, ,primary_name", "is_procedure": "No", "icd": " k35 "})
+    assert options == {"format": "json", "fields": ["key_id", "primary_name"], "is_procedure": False, "icd": "K35"}
+
+
+@pytest.mark.parametrize("args", [{"format": "xml"}, {"is_procedure": "maybe"}])
+def test_export_options_rejects_bad_values(args):
+    with pytest.raises(ValueError):
+        export_options(args)
+
+
+def test_iter_records_filters_and_projects():
+    assert [r["key_id"] for r in iter_records(RECORDS, is_procedure=False)] == ["1", "3"]
+    assert [r["key_id"] for r in iter_records(RECORDS, icd="K3")] == ["2"]
+    assert list(iter_records(RECORDS[:1], fields=["primary_name", "missing"])) == [
+        {"primary_name": "Meningitis", "missing": None}]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 200])
+def test_json_export_is_the_same_array(client, monkeypatch, batch_size):
+    monkeypatch.setattr(export, "BATCH_SIZE", batch_size)
+    response = client.get("/diseases")
+    assert response.mimetype == "application/json"
+    assert json.loads(response.get_data(as_text=True)) == RECORDS
+
+
+def test_empty_json_export(client):
+    response = client.get("/diseases?icd=Z99")
+    assert json.loads(response.get_data(as_text=True)) == []
+
+
+@pytest.mark.parametrize("batch_size", [2, 200])
+def test_ndjson_export(client, monkeypatch, batch_size):
+    monkeypatch.setattr(export, "BATCH_SIZE", batch_size)
+    response = client.get("/diseases", headers={"Accept": "application/x-ndjson"})
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == RECORDS
+
+
+def test_bad_parameters_answer_400(client):
+    response = client.get("/diseases?format=csv")
+    assert response.status_code == 400
+    assert "format" in response.get_json()["error"]
+
+
+def test_non_list_data_is_returned_as_before(client):
+    assert client.get("/broken").get_json() == {"error": "Could not load data"}
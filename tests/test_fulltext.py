@@ -0,0 +1,48 @@
+import pytest
+
+from common.fulltext import FullTextIndex
+
+QUERIES = ["fever", "g03", "a", "ab", "xyz", "stiff neck", "http", "'code'", "true", ""]
+
+
+@pytest.fixture(scope="module")
+def index(diseases):
+    return FullTextIndex(diseases)
+
+
+def linear_search(records, query):
+    """The per-request scan FullTextIndex replaced."""
+    hits = []
+    for record_id, record in enumerate(records):
+        for field, value in record.items():
+            if query in str(value).lower():
+                hits.append((record_id, field))
+                break
+    return hits
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_matches_linear_scan(diseases, index, query):
+    assert index.search(query) == linear_search(diseases, query)
+
+
+def test_search_is_case_insensitive(index):
+    assert index.search("FEVER") == index.search("fever")
+
+
+def test_candidates_are_a_superset_of_the_hits(index):
+    for query in QUERIES:
+        candidates = set(index.candidates(query))
+        assert {record_id for record_id, _ in index.search(query)} <= candidates
+
+
+def test_matches_inside_nested_values():
+    records = [
+        {"primary_name": "Meningitis", "icd10cm": [{"code": "G03.9", "name": "Meningitis, unspecified"}]},
+        {"primary_name": "Measles", "info_link_data": [["https://example.org/measles", "Measles facts"]]},
+    ]
+    index = FullTextIndex(records)
+    assert index.search("unspecified") == [(0, "icd10cm")]
+    assert index.search("facts") == [(1, "info_link_data")]
+    assert index.search("meningitis") == [(0, "primary_name")]
+    assert len(index) == 2
@@ -0,0 +1,68 @@
+import pytest
+
+from common.fuzzy import MAX_REQUESTED_DISTANCE, FuzzyIndex, edit_distance, requested_max_distance, trigrams
+
+RECORDS = [
+    {"primary_name": "Meningitis", "synonyms": ["Brain fever"]},
+    {"primary_name": "Meningitis - fungal", "synonyms": []},
+    {"primary_name": "Tuberculosis", "synonyms": ["TB", "Consumption"]},
+    {"primary_name": "Asthma", "synonyms": None},
+]
+
+
+@pytest.fixture
+def index():
+    return FuzzyIndex(RECORDS)
+
+
+def names(results):
+    return [record["primary_name"] for record, _, _ in results]
+
+
+def test_typos_find_the_record(index):
+    assert names(index.search("menengitis"))[:2] == ["Meningitis", "Meningitis - fungal"]
+    assert names(index.search("tuberclosis")) == ["Tuberculosis"]
+    assert names(index.search("astma")) == ["Asthma"]
+
+
+def test_exact_match_scores_one(index):
+    record, similarity, term = index.search("asthma")[0]
+    assert (record["primary_name"], similarity, term) == ("Asthma", 1.0, "asthma")
+
+
+def test_synonyms_and_words_are_indexed(index):
+    assert names(index.search("consumptoin")) == ["Tuberculosis"]
+    assert names(index.search("fevr")) == ["Meningitis"]
+
+
+def test_max_distance_limits_matches(index):
+    assert index.search("menengitis", max_distance=0) == []
+    assert index.search("zzzz") == []
+    assert index.search("") == []
+
+
+def test_limit(index):
+    assert len(index.search("meningitis", limit=1)) == 1
+
+
+def test_edit_distance_stops_past_the_limit():
+    assert edit_distance("kitten", "sitting", 5) == 3
+    assert edit_distance("kitten", "sitting", 1) == 2
+    assert edit_distance("a", "abcdef", 2) == 3
+
+
+def test_trigrams_pad_short_words():
+    assert trigrams("tb") == {"  t", " tb", "tb "}
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), ("", None), ("2", 2), (3, 3), ("-4", 0), (99, MAX_REQUESTED_DISTANCE),
+])
+def test_requested_max_distance(value, expected):
+    assert requested_max_distance(value) == expected
+
+
+@pytest.mark.parametrize("value", ["abc", "1.5", True, [1]])
+def test_requested_max_distance_rejects_non_integers(value):
+    with pytest.raises(ValueError):
+        requested_max_distance(value)
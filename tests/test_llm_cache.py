@@ -0,0 +1,67 @@
+from common import llm_cache
+from common.llm_cache import ResponseCache, canonical_symptoms, data_version
+
+
+def test_symptom_order_case_and_duplicates_share_a_key():
+    cache = ResponseCache()
+    assert canonical_symptoms("Fever, headache; fever") == ("fever", "headache")
+    assert cache.key("fever, headache", "m") == cache.key("Headache,FEVER", "m")
+    assert cache.key("fever", "m", "1") != cache.key("fever", "m", "2")
+    assert cache.key("fever", "m") != cache.key("fever", "other model")
+
+
+def test_get_or_call_calls_once():
+    cache = ResponseCache()
+    calls = []
+    for _ in range(3):
+        assert cache.get_or_call("fever", "m", "1", lambda: calls.append(1) or ["flu"]) == ["flu"]
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(ttl=10)
+    cache.set("a", 1)
+    now[0] += 9
+    assert cache.get("a") == (True, 1)
+    now[0] += 2
+    assert cache.get("a") == (False, None)
+
+
+def test_changed_data_version_drops_the_cache():
+    version = ["v1"]
+    cache = ResponseCache(version=lambda: version[0])
+    dropped = []
+    cache.on_invalidate(lambda: dropped.append(1))
+    cache.set("a", 1)
+    assert cache.get("a") == (True, 1)
+    version[0] = "v2"
+    assert cache.get("a") == (False, None)
+    assert dropped == [1]
+    assert cache.stats()["data_version"] == "v2"
+
+
+def test_fixed_data_version_never_invalidates():
+    records = [{"key_id": "1", "primary_name": "Flu"}]
+    cache = ResponseCache(version=data_version(records))
+    cache.set("a", 1)
+    assert cache.get("a") == (True, 1)
+    assert cache.stats()["invalidations"] == 0
+
+
+def test_data_version_follows_the_content():
+    assert data_version([{"a": 1, "b": 2}]) == data_version([{"b": 2, "a": 1}])
+    assert data_version([{"a": 1}]) != data_version([{"a": 2}])
@@ -0,0 +1,48 @@
+from common.lookup import RecordLookup
+
+RECORDS = [
+    {"key_id": "1", "primary_name": "Meningitis", "synonyms": ["Brain fever"], "term_icd9_code": "322.9",
+     "icd10cm": [{"code": "G03.9", "name": "Meningitis, unspecified"}]},
+    {"key_id": "2", "primary_name": "Meningitis - fungal", "synonyms": [], "term_icd9_code": "",
+     "icd10cm": [{"code": "G03.9", "name": "Meningitis, unspecified"}, {"code": "B45.1", "name": "Cerebral"}]},
+    {"key_id": "1", "primary_name": "Duplicate", "synonyms": None},
+]
+
+
+def test_get_returns_the_first_record_with_a_key_id():
+    lookup = RecordLookup(RECORDS)
+    assert lookup.get("1") is RECORDS[0]
+    assert lookup.get("missing") is None
+
+
+def test_icd10_ignores_case_and_whitespace():
+    lookup = RecordLookup(RECORDS)
+    assert lookup.icd10(" g03.9 ") == RECORDS[:2]
+    assert lookup.icd10("B45.1") == [RECORDS[1]]
+    assert lookup.icd10("Z99") == []
+
+
+def test_icd9_skips_empty_codes():
+    lookup = RecordLookup(RECORDS)
+    assert lookup.icd9("322.9") == [RECORDS[0]]
+    assert lookup.icd9("") == []
+
+
+def test_name_matches_primary_names_and_synonyms():
+    lookup = RecordLookup(RECORDS)
+    assert lookup.name("BRAIN FEVER") == [RECORDS[0]]
+    assert lookup.name("meningitis") == [RECORDS[0]]
+    assert lookup.name("duplicate") == [RECORDS[2]]
+
+
+def test_results_are_fresh_lists():
+    lookup = RecordLookup(RECORDS)
+    lookup.icd10("G03.9").clear()
+    assert len(lookup.icd10("G03.9")) == 2
+
+
+def test_over_the_bundled_dataset(diseases):
+    lookup = RecordLookup(diseases)
+    for record in diseases[::97]:
+        assert lookup.get(record["key_id"])["key_id"] == record["key_id"]
+        assert record in lookup.name(record["primary_name"])
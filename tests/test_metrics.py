@@ -0,0 +1,128 @@
+import json
+import os
+
+import pytest
+from flask import Flask
+
+from common.metrics import Metrics, payload_size
+
+
+class Usage:
+    prompt_token_count = 120
+    candidates_token_count = 30
+    cached_content_token_count = 100
+
+
+class Reply:
+    text = "héllo"
+    usage_metadata = Usage()
+
+
+def samples(text):
+    """``{sample line without value: value}`` from the exposition text."""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+@pytest.fixture
+def metrics(tmp_path):
+    return Metrics("test", directory=str(tmp_path), flush_interval=0)
+
+
+def test_payload_size():
+    assert payload_size(None) == 0
+    assert payload_size("é") == 2
+    assert payload_size(["ab", ["c"]]) == 3
+    assert payload_size({"a": 1}) == len('{"a": 1}')
+
+
+def test_counters_and_histograms(metrics):
+    metrics.inc("http_requests_total", {"endpoint": "search", "method": "GET", "status": 200}, 2)
+    metrics.observe("http_request_duration_seconds", {"endpoint": "search"}, 0.02)
+    metrics.observe("http_request_duration_seconds", {"endpoint": "search"}, 100)
+    values = samples(metrics.render())
+    assert values['http_requests_total{endpoint="search",method="GET",status="200"}'] == 2
+    assert values['http_request_duration_seconds_bucket{endpoint="search",le="0.025"}'] == 1
+    assert values['http_request_duration_seconds_bucket{endpoint="search",le="60"}'] == 1
+    assert values['http_request_duration_seconds_bucket{endpoint="search",le="+Inf"}'] == 2
+    assert values['http_request_duration_seconds_count{endpoint="search"}'] == 2
+    assert values['http_request_duration_seconds_sum{endpoint="search"}'] == pytest.approx(100.02)
+
+
+def test_label_values_are_escaped(metrics):
+    metrics.inc("model_calls_total", {"site": 'a"b\\c\nd', "outcome": "ok"})
+    assert 'model_calls_total{outcome="ok",site="a\\"b\\\\c\\nd"} 1' in metrics.render()
+
+
+def test_wrap_records_model_calls(metrics):
+    reply = metrics.wrap("diagnosis", lambda contents: Reply())(contents=["abc"])
+    assert isinstance(reply, Reply)
+
+    def down(contents):
+        raise RuntimeError("model down")
+
+    with pytest.raises(RuntimeError):
+        metrics.wrap("diagnosis", down)(["abc"])
+    values = samples(metrics.render())
+    assert values['model_calls_total{outcome="ok",site="diagnosis"}'] == 1
+    assert values['model_calls_total{outcome="error",site="diagnosis"}'] == 1
+    assert values['model_prompt_bytes_count{site="diagnosis"}'] == 2
+    assert values['model_response_bytes_sum{site="diagnosis"}'] == 6
+    assert values['model_prompt_tokens_total{site="diagnosis"}'] == 120
+    assert values['model_response_tokens_total{site="diagnosis"}'] == 30
+    assert values['model_cached_tokens_total{site="diagnosis"}'] == 100
+
+
+def test_registered_stats_and_hit_ratio(metrics):
+    metrics.register("cache", lambda: {"hits": 3, "misses": 1, "model": "gemini"}, ("hits", "misses", "model"))
+    metrics.register("admission", lambda: {"model": {"active": 2}, "local": {"active": 0}}, ("active",),
+                     group="route_class")
+    metrics.register("broken", lambda: 1 / 0, ("value",))
+    values = samples(metrics.render())
+    assert values["cache_hits"] == 3
+    assert values["cache_hit_ratio"] == 0.75
+    assert "cache_model" not in values
+    assert values['admission_active{route_class="model"}'] == 2
+    assert values['admission_active{route_class="local"}'] == 0
+
+
+def test_merges_live_workers_and_drops_exited_ones(metrics):
+    metrics.inc("model_calls_total", {"site": "diagnosis", "outcome": "ok"})
+    other = {"pid": os.getppid(), "types": {},
+             "counters": [["model_calls_total", [["outcome", "ok"], ["site", "diagnosis"]], 4]],
+             "gauges": [], "histograms": []}
+    live = os.path.join(metrics.directory, f"{os.getppid()}.json")
+    with open(live, "w", encoding="utf-8") as f:
+        json.dump(other, f)
+    # No process has a pid this large
+    exited = os.path.join(metrics.directory, "4194400.json")
+    with open(exited, "w", encoding="utf-8") as f:
+        json.dump(dict(other, pid=4194400), f)
+    values = samples(metrics.render())
+    assert values['model_calls_total{outcome="ok",site="diagnosis"}'] == 5
+    assert os.path.exists(live)
+    assert not os.path.exists(exited)
+
+
+def test_flask_integration(metrics):
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route("/search")
+    def search():
+        return "ok"
+
+    client = app.test_client()
+    client.get("/search").close()
+    client.get("/missing").close()
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    values = samples(response.get_data(as_text=True))
+    assert values['http_requests_total{endpoint="search",method="GET",status="200"}'] == 1
+    assert values['http_requests_total{endpoint="unmatched",method="GET",status="404"}'] == 1
+    assert values['http_requests_in_flight{endpoint="search"}'] == 0
+    assert values['http_requests_in_flight{endpoint="metrics"}'] == 1
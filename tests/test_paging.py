@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from common.paging import CONTAINS, EXACT, PREFIX, Page, page_params, relevance, top_k
+from common.search_index import SearchIndex
+
+
+@pytest.fixture(scope="module")
+def index(diseases):
+    return SearchIndex(diseases)
+
+
+def test_page_params_defaults_and_clamps():
+    assert page_params({}, default_limit=50, max_limit=200) == (50, 0)
+    assert page_params({"limit": "10", "offset": "20"}) == (10, 20)
+    assert page_params({"limit": 0, "offset": -5}, max_limit=200) == (1, 0)
+    assert page_params({"limit": "1000"}, max_limit=200) == (200, 0)
+
+
+@pytest.mark.parametrize("args", [{"limit": "ten"}, {"offset": "1.5"}, {"limit": None}])
+def test_page_params_rejects_non_integers(args):
+    with pytest.raises(ValueError):
+        page_params(args)
+
+
+def test_relevance():
+    assert relevance("fever", ["rash", "fever"]) == EXACT
+    assert relevance("fever", ["fever with rash", "hay fever"]) == PREFIX
+    assert relevance("fever", ["hay fever"]) == CONTAINS
+    assert relevance("fever", ["rash"]) == 0
+
+
+def brute_force(items, limit, offset):
+    ranked = sorted((item for item in items if item[0]), key=lambda item: (-item[0], item[1]))
+    return [record_id for _, record_id in ranked[offset:offset + limit]]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("limit, offset", [(1, 0), (5, 0), (5, 5), (50, 0), (10, 95)])
+def test_top_k_matches_a_full_sort(seed, limit, offset):
+    rng = random.Random(seed)
+    items = [(rng.choice([0, 0, CONTAINS, PREFIX, EXACT]), record_id) for record_id in range(100)]
+    page = top_k(iter(items), limit, offset)
+    assert page.ids == brute_force(items, limit, offset)
+    if page.total_exact:
+        assert page.total == sum(1 for score, _ in items if score)
+
+
+def test_top_k_counts_every_match_when_the_scan_completes():
+    items = [(CONTAINS if record_id % 3 else 0, record_id) for record_id in range(30)]
+    page = top_k(iter(items), 5, bound=CONTAINS + 1)
+    assert page.total_exact
+    assert page.total == 20
+    assert page.ids == [1, 2, 4, 5, 7]
+
+
+def test_top_k_stops_early_and_estimates_the_total():
+    seeds = [(EXACT, 7)]
+    scored = [(PREFIX if record_id % 2 else 0, record_id) for record_id in range(100) if record_id != 7]
+    consumed = []
+
+    def tracked():
+        for item in scored:
+            consumed.append(item)
+            yield item
+
+    page = top_k(tracked(), 3, seeds=seeds, bound=PREFIX, candidates=len(scored))
+    assert page.ids == [7, 1, 3]
+    assert not page.total_exact
+    assert len(consumed) < len(scored)
+    # About half of the remaining candidates match
+    assert 40 <= page.total <= 60
+
+
+def test_page_headers():
+    headers = Page([1, 2], 12, False, 2, 4).headers()
+    assert headers == {"X-Total-Count": "12", "X-Total-Exact": "false", "X-Limit": "2", "X-Offset": "4"}
+
+
+@pytest.mark.parametrize("fields", [None, ("word_synonyms", "synonyms"), ("primary_name",)])
+@pytest.mark.parametrize("query", ["fever", "headache", "stiff neck", "a", "xylophone"])
+def test_search_page_has_the_same_matches(index, query, fields):
+    expected = index.search_ids(query, fields)
+    page = index.search_page(query, len(expected) + 1, fields=fields)
+    assert sorted(page.ids) == expected
+    assert page.total == len(expected)
+
+
+@pytest.mark.parametrize("query", ["fever", "pain", "a"])
+def test_search_page_pages_are_disjoint_and_ranked(index, query):
+    total = len(index.search_ids(query))
+    first = index.search_page(query, 10)
+    second = index.search_page(query, 10, offset=10)
+    assert len(first.ids) == min(10, total)
+    assert not set(first.ids) & set(second.ids)
+    assert set(first.ids + second.ids) <= set(index.search_ids(query))
+
+
+def test_search_page_puts_whole_entry_matches_first(diseases, index):
+    name = diseases[0]["primary_name"]
+    page = index.search_page(name, 5, fields=("primary_name",))
+    assert diseases[page.ids[0]]["primary_name"].lower() == name.lower()
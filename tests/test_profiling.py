@@ -0,0 +1,101 @@
+import os
+import pstats
+
+import pytest
+from flask import Flask, Response
+
+from common.profiling import StackSampler, install_profiler
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+
+    @app.route("/search")
+    def search():
+        return {"total": sum(range(1000))}
+
+    @app.route("/stream")
+    def stream():
+        return Response((str(i) for i in range(3)), mimetype="text/plain")
+
+    app.profiler = install_profiler(app, "test", directory=str(tmp_path), token=TOKEN, sample_n=0, keep=2)
+    return app
+
+
+def saved(app):
+    return sorted(os.listdir(app.profiler.directory))
+
+
+def test_requests_are_not_profiled_by_default(app):
+    response = app.test_client().get("/search")
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert saved(app) == []
+
+
+def test_the_header_token_profiles_a_request(app):
+    response = app.test_client().get("/search", headers={"X-Profile": TOKEN})
+    response.close()
+    profile_id = response.headers["X-Profile-Id"]
+    assert saved(app) == [f"{profile_id}.collapsed", f"{profile_id}.pstats"]
+    stats = pstats.Stats(os.path.join(app.profiler.directory, f"{profile_id}.pstats"))
+    assert any(function == "search" for _, _, function in stats.stats)
+
+
+@pytest.mark.parametrize("headers, query", [({"X-Profile": "wrong"}, ""), ({}, f"?_profile={TOKEN}")])
+def test_wrong_or_query_string_tokens_are_refused(app, headers, query):
+    response = app.test_client().get("/search" + query, headers=headers)
+    response.close()
+    assert "X-Profile-Id" not in response.headers
+    assert saved(app) == []
+
+
+def test_no_token_configured_disables_the_header(tmp_path):
+    app = Flask(__name__)
+    app.add_url_rule("/", "index", lambda: "ok")
+    middleware = install_profiler(app, "test", directory=str(tmp_path), token="", sample_n=0)
+    response = app.test_client().get("/", headers={"X-Profile": ""})
+    response.close()
+    assert "X-Profile-Id" not in response.headers
+    assert not middleware.authorized({"HTTP_X_PROFILE": ""})
+
+
+def test_streamed_bodies_are_profiled_until_closed(app):
+    response = app.test_client().get("/stream", headers={"X-Profile": TOKEN})
+    assert response.get_data(as_text=True) == "012"
+    response.close()
+    assert len(saved(app)) == 2
+    # The lock is released, so the next request can be profiled
+    assert app.profiler.active.acquire(blocking=False)
+    app.profiler.active.release()
+
+
+def test_only_the_newest_profiles_are_kept(app):
+    client = app.test_client()
+    for _ in range(3):
+        client.get("/search", headers={"X-Profile": TOKEN}).close()
+    assert len(saved(app)) == 4
+
+
+def test_profile_routes_require_the_token(app):
+    client = app.test_client()
+    response = client.get("/search", headers={"X-Profile": TOKEN})
+    response.close()
+    profile_id = response.headers["X-Profile-Id"]
+    assert client.get("/_profiles").status_code == 404
+    assert client.get(f"/_profiles?_profile={TOKEN}").status_code == 404
+    listing = client.get("/_profiles", headers={"X-Profile": TOKEN}).get_json()
+    assert [profile["id"] for profile in listing] == [profile_id]
+    download = client.get(f"/_profiles/{profile_id}.collapsed", headers={"X-Profile": TOKEN})
+    assert download.status_code == 200
+    download.close()
+    assert client.get("/_profiles/../secrets.txt", headers={"X-Profile": TOKEN}).status_code == 404
+
+
+def test_stack_sampler_collapses_stacks():
+    sampler = StackSampler(0)
+    sampler.counts = {"main (app.py:1);search (app.py:5)": 3}
+    assert sampler.collapsed() == "main (app.py:1);search (app.py:5) 3\n"
@@ -0,0 +1,80 @@
+import pytest
+
+from common import ranking
+from common.ranking import SymptomRanker, diagnose_with_shortlist, is_low_confidence, split_symptoms
+
+RECORDS = [
+    {"key_id": "1", "primary_name": "Meningitis", "synonyms": [], "word_synonyms": "fever;stiff neck;headache"},
+    {"key_id": "2", "primary_name": "Migraine", "synonyms": [], "word_synonyms": "headache;nausea"},
+    {"key_id": "3", "primary_name": "Influenza", "synonyms": ["flu"], "word_synonyms": "fever;cough;aches;chills"},
+    {"key_id": "4", "primary_name": "Gastritis", "synonyms": [], "word_synonyms": "vomiting;abdominal pain"},
+]
+
+
+@pytest.fixture
+def ranker():
+    return SymptomRanker(RECORDS)
+
+
+def test_split_symptoms():
+    assert split_symptoms("Fever; stiff neck,, Headache ") == ["fever", "stiff neck", "headache"]
+
+
+def test_records_matching_more_symptoms_rank_first(ranker):
+    assert [record["key_id"] for record in ranker.shortlist("fever, stiff neck")][:2] == ["1", "3"]
+
+
+def test_long_words_match_words_they_prefix(ranker):
+    assert [record["key_id"] for record in ranker.shortlist("vomit")] == ["4"]
+
+
+def test_shortlist_many_matches_single_shortlists(ranker):
+    sets = ["fever", "headache, nausea", "zzz"]
+    assert ranker.shortlist_many(sets, 2) == [ranker.shortlist(symptoms, 2) for symptoms in sets]
+
+
+def test_default_candidates_are_the_broadest_records(ranker):
+    assert [record["key_id"] for record in ranker.default_candidates(2)] == ["3", "1"]
+
+
+def test_is_low_confidence():
+    candidates = RECORDS[:2]
+    assert is_low_confidence([], candidates)
+    assert is_low_confidence([{"key_id": "4"}], candidates)
+    assert not is_low_confidence([{"key_id": "2"}], candidates)
+
+
+def test_shortlist_is_widened_while_the_answer_is_weak(ranker):
+    sizes = []
+
+    def ask(candidates):
+        sizes.append(len(candidates))
+        return [{"key_id": "none of them"}]
+
+    diagnose_with_shortlist(ask, ranker, "fever, headache, cough, vomiting", size=1, max_size=4)
+    assert sizes == [1, 4]
+
+
+def test_unmatched_symptoms_are_asked_with_default_candidates(ranker):
+    asked = []
+
+    def ask(candidates):
+        asked.append([record["key_id"] for record in candidates])
+        return [{"key_id": "3"}]
+
+    assert diagnose_with_shortlist(ask, ranker, "zzz", size=2) == [{"key_id": "3"}]
+    assert asked == [["3", "1"]]
+
+
+def test_widening_stops_when_the_budget_is_spent(ranker, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(ranking.time, "monotonic", lambda: clock[0])
+    calls = []
+
+    def ask(candidates):
+        calls.append(len(candidates))
+        clock[0] += 20
+        return []
+
+    diagnose_with_shortlist(ask, ranker, "fever, headache, cough, vomiting", size=1, max_size=16, budget=30)
+    assert calls == [1]
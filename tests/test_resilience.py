@@ -0,0 +1,300 @@
+import pytest
+
+from common import resilience
+from common.resilience import (CircuitBreaker, CircuitOpenError, ModelGuard, ModelUnavailable, genai_timeout,
+                               generativeai_timeout)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def breaker(**options):
+    settings = dict(window=10, min_calls=4, error_rate=0.5, slow_rate=0.5, slow_seconds=5, open_seconds=30)
+    settings.update(options)
+    return CircuitBreaker(**settings)
+
+
+def test_stays_closed_below_min_calls(clock):
+    circuit = breaker()
+    for _ in range(3):
+        circuit.record(False, 0.1)
+    assert circuit.state == "closed"
+    assert circuit.allow()
+
+
+def test_opens_on_error_rate(clock):
+    circuit = breaker()
+    for ok in (True, False, True, False):
+        circuit.record(ok, 0.1)
+    assert circuit.state == "open"
+    assert not circuit.allow()
+    assert circuit.stats()["trips"] == 1
+
+
+def test_opens_on_slow_rate(clock):
+    circuit = breaker()
+    for seconds in (6, 6, 0.1, 0.1):
+        circuit.record(True, seconds)
+    assert circuit.state == "open"
+
+
+def test_half_open_allows_a_single_trial(clock):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False, 0.1)
+    clock.now += 30
+    assert circuit.state == "half-open"
+    assert circuit.allow()
+    assert not circuit.allow()
+
+
+def test_successful_trial_closes(clock):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False, 0.1)
+    clock.now += 30
+    trial = circuit.allow()
+    assert trial
+    circuit.record(True, 0.1, trial)
+    assert circuit.state == "closed"
+    assert circuit.stats()["recent_calls"] == 0
+
+
+@pytest.mark.parametrize("ok, seconds", [(False, 0.1), (True, 6)])
+def test_failed_or_slow_trial_reopens(clock, ok, seconds):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False, 0.1)
+    clock.now += 30
+    trial = circuit.allow()
+    assert trial
+    circuit.record(ok, seconds, trial)
+    assert circuit.state == "open"
+    clock.now += 29
+    assert not circuit.allow()
+    clock.now += 1
+    assert circuit.allow()
+
+
+def test_late_calls_do_not_decide_the_trial(clock):
+    circuit = breaker()
+    admitted_before_opening = circuit.allow()
+    for _ in range(4):
+        circuit.record(False, 0.1)
+    clock.now += 30
+    trial = circuit.allow()
+    # A call admitted while closed finishes during the trial
+    circuit.record(True, 0.1, admitted_before_opening)
+    assert circuit.state == "half-open"
+    assert not circuit.allow()
+    circuit.record(False, 0.1, admitted_before_opening)
+    assert circuit.state == "half-open"
+    circuit.record(True, 0.1, trial)
+    assert circuit.state == "closed"
+
+
+def test_released_trial_lets_the_next_call_try(clock):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False, 0.1)
+    clock.now += 30
+    circuit.release(circuit.allow())
+    assert circuit.state == "half-open"
+    assert circuit.allow()
+
+
+def test_lost_trial_is_replaced_after_the_cooldown(clock):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False, 0.1)
+    clock.now += 30
+    lost = circuit.allow()
+    clock.now += 29
+    assert not circuit.allow()
+    clock.now += 1
+    trial = circuit.allow()
+    assert trial and trial is not lost
+    circuit.record(False, 0.1, lost)
+    assert circuit.state == "half-open"
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+class BadRequest(Exception):
+    code = 400
+
+
+@pytest.mark.parametrize("error", [BadRequest(), ValueError("blocked for safety")])
+def test_client_errors_do_not_open_the_breaker(error):
+    circuit = breaker(min_calls=1)
+    guard = ModelGuard("test", breaker=circuit)
+
+    def refused():
+        raise error
+
+    for _ in range(5):
+        with pytest.raises(type(error)):
+            guard.call(refused)
+    assert circuit.state == "closed"
+    assert circuit.stats()["recent_calls"] == 0
+
+
+def test_client_error_during_the_trial_keeps_it_half_open(clock):
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False, 0.1)
+    clock.now += 30
+    guard = ModelGuard("test", breaker=circuit)
+
+    def refused():
+        raise BadRequest()
+
+    with pytest.raises(BadRequest):
+        guard.call(refused)
+    assert circuit.state == "half-open"
+    assert guard.call(lambda: "ok") == "ok"
+    assert circuit.state == "closed"
+
+
+def test_guard_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Unavailable()
+        return "ok"
+
+    guard = ModelGuard("test", retries=2, breaker=breaker(min_calls=100))
+    assert guard.call(flaky) == "ok"
+    assert len(attempts) == 3
+
+
+def test_guard_gives_up_after_retries(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+    guard = ModelGuard("test", retries=1, breaker=breaker(min_calls=100))
+
+    def down():
+        raise Unavailable()
+
+    with pytest.raises(ModelUnavailable):
+        guard.call(down)
+
+
+def test_guard_raises_other_errors_unchanged():
+    guard = ModelGuard("test", breaker=breaker(min_calls=100))
+
+    def broken():
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        guard.call(broken)
+
+
+def test_guard_refuses_while_open():
+    circuit = breaker(min_calls=1)
+    circuit.record(False, 0.1)
+    guard = ModelGuard("test", breaker=circuit)
+    with pytest.raises(CircuitOpenError):
+        guard.call(lambda: "never")
+
+
+def test_guard_passes_the_deadline_to_the_sdk():
+    seen = {}
+
+    def generate(prompt, **kwargs):
+        seen.update(kwargs)
+        return prompt
+
+    guard = ModelGuard("test", generativeai_timeout, timeout=3, breaker=breaker())
+    assert guard.call(generate, "hi") == "hi"
+    assert seen == {"request_options": {"timeout": 3}}
+
+
+def test_genai_timeout_sets_http_options_in_milliseconds():
+    kwargs = genai_timeout({"config": {"temperature": 0}}, 2.5)
+    assert kwargs["config"]["http_options"]["timeout"] == 2500
+    assert kwargs["config"]["temperature"] == 0
+
+
+class LazyStream:
+    """Like the SDKs' streams: nothing is sent until the first chunk is read."""
+
+    def __init__(self, chunks, fail_at=None, error=None):
+        self.chunks = chunks
+        self.fail_at = fail_at
+        self.error = error
+        self.started = False
+
+    def __iter__(self):
+        self.started = True
+        for position, chunk in enumerate(self.chunks):
+            if position == self.fail_at:
+                raise self.error
+            yield chunk
+
+
+def test_stream_fetches_the_first_chunk_under_the_guard(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+    streams = [LazyStream(["a"], fail_at=0, error=Unavailable()), LazyStream(["a", "b"])]
+    guard = ModelGuard("test", retries=2, breaker=breaker(min_calls=100))
+    chunks = guard.stream(lambda: streams.pop(0))
+    # The failed first request was retried before stream() returned
+    assert not streams
+    assert list(chunks) == ["a", "b"]
+
+
+def test_stream_failing_before_the_first_chunk_raises_model_unavailable(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+    guard = ModelGuard("test", retries=1, breaker=breaker(min_calls=100))
+    with pytest.raises(ModelUnavailable):
+        guard.stream(lambda: LazyStream(["a"], fail_at=0, error=Unavailable()))
+
+
+def test_stream_records_success_when_it_ends():
+    circuit = breaker()
+    guard = ModelGuard("test", breaker=circuit)
+    chunks = guard.stream(lambda: LazyStream(["a", "b"]))
+    assert circuit.stats()["recent_calls"] == 0
+    assert list(chunks) == ["a", "b"]
+    assert circuit._calls[-1] == (True, False)
+
+
+def test_stream_records_a_failure_mid_stream():
+    circuit = breaker()
+    guard = ModelGuard("test", breaker=circuit)
+    chunks = guard.stream(lambda: LazyStream(["a", "b"], fail_at=1, error=Unavailable()))
+    assert next(chunks) == "a"
+    with pytest.raises(Unavailable):
+        next(chunks)
+    assert circuit._calls[-1] == (False, False)
+
+
+def test_stream_client_error_mid_stream_is_not_a_failure():
+    circuit = breaker()
+    guard = ModelGuard("test", breaker=circuit)
+    chunks = guard.stream(lambda: LazyStream(["a", "b"], fail_at=1, error=BadRequest()))
+    assert next(chunks) == "a"
+    with pytest.raises(BadRequest):
+        next(chunks)
+    assert circuit.stats()["recent_calls"] == 0
+
+
+def test_empty_stream():
+    guard = ModelGuard("test", breaker=breaker())
+    assert list(guard.stream(lambda: LazyStream([]))) == []
@@ -0,0 +1,54 @@
+import pytest
+
+from common.search_index import SearchIndex, field_elements, field_values, tokenize
+
+QUERIES = ["fever", "headache", "rash", "stiff neck", "a", "ab", "pain", "vomit", "xylophone", ""]
+FIELD_SETS = [None, ("word_synonyms", "synonyms"), ("primary_name",)]
+
+
+@pytest.fixture(scope="module")
+def index(diseases):
+    return SearchIndex(diseases)
+
+
+def linear_search(records, query, fields):
+    """The scan SearchIndex replaced."""
+    return [record_id for record_id, record in enumerate(records)
+            if any(query in value for field in fields for value in field_values(record, field))]
+
+
+@pytest.mark.parametrize("fields", FIELD_SETS)
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_ids_matches_linear_scan(diseases, index, query, fields):
+    assert index.search_ids(query, fields) == linear_search(diseases, query, fields or index.fields)
+
+
+def test_search_returns_records_in_file_order(diseases, index):
+    records = index.search("FEVER", fields=("word_synonyms", "synonyms"))
+    assert records
+    positions = [diseases.index(record) for record in records]
+    assert positions == sorted(positions)
+
+
+def test_field_values_accept_comma_separated_synonyms():
+    record = {"primary_name": "Flu", "synonyms": "Grippe,Influenza", "word_synonyms": "fever;cough"}
+    assert field_values(record, "synonyms") == ["grippe", "influenza"]
+    assert field_values({"primary_name": None}, "primary_name") == [""]
+    assert field_elements(record, "word_synonyms") == ["fever", "cough"]
+
+
+def test_whole_entry_and_token_lookups():
+    records = [
+        {"primary_name": "Flu", "synonyms": ["Influenza"], "word_synonyms": "fever;dry cough"},
+        {"primary_name": "Cold", "synonyms": [], "word_synonyms": "cough;runny nose"},
+    ]
+    index = SearchIndex(records)
+    assert index.lookup_ids("Cough", "word_synonyms") == [1]
+    assert index.token_ids("cough") == {0, 1}
+    assert index.token_ids("nothing") == set()
+    assert "influenza" in index.vocabulary()
+    assert index.vocabulary() == sorted(index.vocabulary())
+
+
+def test_tokenize():
+    assert tokenize("Stiff-neck, Fever 39C") == ["stiff", "neck", "fever", "39c"]
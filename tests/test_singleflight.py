@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+
+import pytest
+
+from common import singleflight
+from common.singleflight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, callers):
+    results = []
+    errors = []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def slow(value, started):
+    def fn():
+        started.set()
+        time.sleep(0.2)
+        return value
+    return fn
+
+
+def test_concurrent_callers_share_one_call(tmp_path):
+    flight = SingleFlight("test", lock_dir=str(tmp_path))
+    executed = []
+
+    def fn():
+        executed.append(1)
+        time.sleep(0.2)
+        return {"answer": 42}
+
+    results, errors = run_concurrently(flight, "key", fn, 8)
+    assert not errors
+    assert results == [{"answer": 42}] * 8
+    assert len(executed) == 1
+    stats = flight.stats()
+    assert stats["calls"] == 8
+    assert stats["executed"] == 1
+    assert stats["coalesced"] == 7
+    assert stats["in_flight"] == 0
+
+
+def test_errors_reach_every_waiter(tmp_path):
+    flight = SingleFlight("test", lock_dir=str(tmp_path))
+
+    def fn():
+        time.sleep(0.2)
+        raise RuntimeError("model down")
+
+    results, errors = run_concurrently(flight, "key", fn, 4)
+    assert not results
+    assert len(errors) == 4
+    assert flight.stats()["errors"] == 1
+
+
+def test_nothing_is_cached_after_a_call(tmp_path):
+    flight = SingleFlight("test", lock_dir=str(tmp_path))
+    values = iter([1, 2])
+    assert flight.do("key", lambda: next(values)) == 1
+    assert flight.do("key", lambda: next(values)) == 2
+
+
+def test_another_worker_reuses_a_result_written_while_it_waited(tmp_path):
+    # Two instances stand in for two gunicorn workers sharing the lock directory
+    first = SingleFlight("test", lock_dir=str(tmp_path))
+    second = SingleFlight("test", lock_dir=str(tmp_path))
+    started = threading.Event()
+    leader = threading.Thread(target=first.do, args=("key", slow("shared", started)))
+    leader.start()
+    started.wait()
+    assert second.do("key", lambda: "own call") == "shared"
+    leader.join()
+    assert second.stats()["coalesced_cross_worker"] == 1
+
+
+def test_in_process_only_without_lock_dir():
+    flight = SingleFlight("test", lock_dir=None)
+    assert flight.lock_dir is None
+    assert flight.do("key", lambda: "value") == "value"
+
+
+def test_lock_files_are_removed_after_a_call(tmp_path):
+    flight = SingleFlight("test", lock_dir=str(tmp_path))
+    for key in ("a", "b", "c"):
+        flight.do(key, lambda: key)
+    assert not [path for path in os.listdir(flight.lock_dir) if path.endswith(".lock")]
+
+
+def test_failed_calls_remove_their_lock_file(tmp_path):
+    flight = SingleFlight("test", lock_dir=str(tmp_path))
+
+    def fn():
+        raise RuntimeError("model down")
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", fn)
+    assert os.listdir(flight.lock_dir) == []
+
+
+def test_old_results_are_swept(tmp_path, monkeypatch):
+    monkeypatch.setattr(singleflight, "SWEEP_INTERVAL", 0)
+    flight = SingleFlight("test", lock_dir=str(tmp_path), lock_wait=60)
+    flight.do("old", lambda: "old")
+    (old,) = os.listdir(flight.lock_dir)
+    stale = time.time() - 120
+    os.utime(os.path.join(flight.lock_dir, old), (stale, stale))
+    flight.do("new", lambda: "new")
+    remaining = os.listdir(flight.lock_dir)
+    assert old not in remaining
+    assert len(remaining) == 1
+
+
+def test_waiter_on_a_deleted_lock_file_runs_its_own_call_after_a_failure(tmp_path):
+    first = SingleFlight("test", lock_dir=str(tmp_path))
+    second = SingleFlight("test", lock_dir=str(tmp_path))
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError("model down")
+
+    errors = []
+
+    def lead():
+        try:
+            first.do("key", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait()
+    assert second.do("key", lambda: "own call") == "own call"
+    leader.join()
+    assert errors
+    assert second.stats()["executed"] == 1
+    assert not [path for path in os.listdir(second.lock_dir) if path.endswith(".lock")]
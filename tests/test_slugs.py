@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from common.slugs import MAX_PATTERN_LENGTH, SlugIndex, compile_pattern, is_safe_pattern, slugify
+
+
+@pytest.mark.parametrize("pattern", [
+    "Asthma",
+    "Heart.*attack",
+    "^Meningitis-(fungal|viral)$",
+    "diabetes-type-[12]",
+    "(ab)+c",
+    "a{2,3}b",
+    r"\(a+\)+",
+    "[(a+)+]",
+])
+def test_safe_patterns(pattern):
+    assert is_safe_pattern(pattern)
+
+
+@pytest.mark.parametrize("pattern", [
+    "(a+)+$",
+    "(a*)*b",
+    "(.*)*!",
+    "(.|.)*!",
+    "(a|aa)+$",
+    "(?:a+){2,}",
+    "((ab)*c)+",
+    r"(a)\1",
+    "(?P<x>a)(?P=x)",
+    "a*b*c*d*",
+    "a" * (MAX_PATTERN_LENGTH + 1),
+])
+def test_unsafe_patterns(pattern):
+    assert not is_safe_pattern(pattern)
+
+
+def test_unsafe_pattern_is_matched_literally():
+    assert compile_pattern("(a+)+$").pattern == r"\(a\+\)\+\$"
+    assert compile_pattern("Heart.*attack").search("heart-attack")
+
+
+def test_invalid_regex_falls_back_to_literal():
+    assert compile_pattern("a(b").search("xa(by")
+
+
+def test_slugify():
+    assert slugify("Meningitis(fungal)") == "Meningitis-fungal"
+    assert slugify("Meningitis (fungal)") == "Meningitis--fungal"
+    assert slugify("Heart attack/stroke") == "Heart-attack-stroke"
+
+
+def test_find_prefers_exact_slug_then_file_order():
+    records = [{"primary_name": "Asthma attack"}, {"primary_name": "Asthma"}, {"primary_name": "Heart attack"}]
+    index = SlugIndex(records)
+    assert index.find("asthma") is records[1]
+    assert index.find("attack") is records[0]
+    assert index.find("^Heart.*k$") is records[2]
+    assert index.find("no-such-disease") is None
+
+
+def test_hostile_pattern_finishes_quickly():
+    records = [{"primary_name": "a" * 40 + " %d" % i} for i in range(2000)]
+    index = SlugIndex(records)
+    started = time.perf_counter()
+    assert index.find("(a+)+!") is None
+    assert time.perf_counter() - started < 1
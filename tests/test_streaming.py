@@ -0,0 +1,94 @@
+import json
+
+import pytest
+from flask import Flask
+
+from common.streaming import chunk_texts, prefetch, sse_event, sse_response, stream_text, wants_stream
+
+
+class Chunk:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if isinstance(self._text, Exception):
+            raise self._text
+        return self._text
+
+
+def events(body):
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        parsed.append((lines.get("event"), json.loads(lines["data"])))
+    return parsed
+
+
+def test_sse_event_keeps_newlines_inside_the_payload():
+    assert sse_event("a\nb") == 'data: "a\\nb"\n\n'
+    assert sse_event({"x": 1}, event="done") == 'event: done\ndata: {"x": 1}\n\n'
+
+
+def test_chunk_texts_skips_empty_and_textless_chunks():
+    chunks = [Chunk("a"), Chunk(""), Chunk(ValueError("safety")), Chunk("b")]
+    assert list(chunk_texts(chunks)) == ["a", "b"]
+
+
+def test_stream_text_ends_with_done_and_reports_the_full_text():
+    completed = []
+    body = "".join(stream_text(iter(["Hel", "lo"]), "test", on_complete=completed.append))
+    parsed = events(body)
+    assert parsed[:2] == [(None, "Hel"), (None, "lo")]
+    assert parsed[2][0] == "done"
+    assert completed == ["Hello"]
+
+
+def test_stream_text_reports_failures_as_an_error_event():
+    def texts():
+        yield "partial"
+        raise RuntimeError("connection reset")
+
+    completed = []
+    parsed = events("".join(stream_text(texts(), "test", on_complete=completed.append)))
+    assert parsed == [(None, "partial"), ("error", "connection reset")]
+    assert completed == []
+
+
+def test_prefetch_relays_items_and_errors():
+    assert list(prefetch(lambda: iter([1, 2, 3]))) == [1, 2, 3]
+
+    def failing():
+        yield 1
+        raise ValueError("boom")
+
+    relayed = prefetch(failing)
+    assert next(relayed) == 1
+    with pytest.raises(ValueError):
+        next(relayed)
+
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({"query_string": {"stream": "1"}}, True),
+    ({"headers": {"Accept": "text/event-stream"}}, True),
+    ({"json": {"stream": True}, "method": "POST"}, True),
+    ({"data": {"stream": "yes"}, "method": "POST"}, True),
+    ({}, False),
+])
+def test_wants_stream(kwargs, expected):
+    app = Flask(__name__)
+    with app.test_request_context("/", **kwargs):
+        assert wants_stream() is expected
+
+
+def test_sse_response_streams_without_buffering():
+    app = Flask(__name__)
+
+    @app.route("/")
+    def index():
+        return sse_response(stream_text(iter(["x"]), "test"))
+
+    response = app.test_client().get("/")
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["X-Accel-Buffering"] == "no"
+    assert events(response.get_data(as_text=True))[0] == (None, "x")
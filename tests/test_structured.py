@@ -0,0 +1,90 @@
+import pytest
+from pydantic import BaseModel
+
+from common.structured import StructuredOutputError, StructuredParser, repair_json
+
+
+class Item(BaseModel):
+    primary_name: str
+    description: str
+
+
+def test_repair_json_valid_reply_is_not_truncated():
+    assert repair_json('[{"a": 1}]') == ([{"a": 1}], False)
+
+
+def test_repair_json_strips_fences_and_chatter():
+    text = 'Here you go:\n```json\n{"a": [1, 2]}\n```\nAnything else?'
+    assert repair_json(text) == ({"a": [1, 2]}, False)
+
+
+def test_repair_json_drops_trailing_commas():
+    assert repair_json('{"a": [1, 2,], "b": 3,}') == ({"a": [1, 2], "b": 3}, False)
+
+
+def test_repair_json_truncated_list_keeps_complete_elements():
+    value, truncated = repair_json('[{"a": 1}, {"a": 2}, {"a": 3, "b": "cut')
+    assert truncated
+    assert value == [{"a": 1}, {"a": 2}]
+
+
+def test_repair_json_truncated_number_is_not_trusted():
+    # 0.25 cut to 0.2 would still parse, but the element is unfinished
+    value, truncated = repair_json('[0.5, 0.2')
+    assert truncated
+    assert value == [0.5]
+
+
+def test_repair_json_truncated_before_first_element():
+    assert repair_json('[{"a": "cu') == ([], True)
+
+
+def test_repair_json_garbage_raises():
+    with pytest.raises(StructuredOutputError):
+        repair_json("no json here")
+
+
+def test_parse_list_completes_truncated_reply_without_duplicates():
+    parser = StructuredParser(list[Item])
+    calls = []
+
+    def complete(have, missing):
+        calls.append((len(have), missing))
+        return '[{"primary_name": "A", "description": "again"}, {"primary_name": "C", "description": "c"}]'
+
+    text = '[{"primary_name": "A", "description": "a"}, {"primary_name": "B", "description": "b"}, {"primary'
+    items = parser.parse(text, complete, expected=3)
+    assert calls == [(2, 1)]
+    assert [item["primary_name"] for item in items] == ["A", "B", "C"]
+
+
+def test_parse_list_short_valid_reply_is_not_completed():
+    parser = StructuredParser(list[Item])
+
+    def complete(have, missing):
+        raise AssertionError("complete should not be called")
+
+    items = parser.parse('[{"primary_name": "A", "description": "a"}]', complete, expected=3)
+    assert len(items) == 1
+
+
+def test_parse_list_keeps_partial_items_when_completion_fails():
+    parser = StructuredParser(list[Item])
+
+    def complete(have, missing):
+        raise RuntimeError("model down")
+
+    items = parser.parse('[{"primary_name": "A", "description": "a"}, {"primary_name": "B"}]', complete, expected=2)
+    assert [item["primary_name"] for item in items] == ["A"]
+
+
+def test_parse_object_asks_only_for_missing_fields():
+    parser = StructuredParser(Item)
+    asked = []
+
+    def complete(have, missing):
+        asked.append(missing)
+        return '{"description": "filled in"}'
+
+    assert parser.parse('{"primary_name": "A"}', complete) == {"primary_name": "A", "description": "filled in"}
+    assert asked == [["description"]]
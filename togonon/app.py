@@ -1,6 +1,7 @@
 from flask import Flask, render_template, request, jsonify
 import json
 import os
+import sys
 from dotenv import load_dotenv
 import google.generativeai as genai
 
@@ -15,8 +16,18 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, "frontend")
 DATA_PATH = os.path.join(BASE_DIR, "diseases.json")
 
+sys.path.append(os.path.dirname(BASE_DIR))
+from common.lookup import RecordLookup
+from common.profiling import install_profiler
+from common.resilience import ModelGuard, ModelUnavailable, generativeai_timeout
+from common.search_index import SearchIndex
+
 # Initialize Flask app
 app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder="assets")
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "togonon")
+# Deadlines, retries and circuit breaker for the Gemini calls
+gemini = ModelGuard("togonon", generativeai_timeout)
 
 # Load diseases JSON data
 try:
@@ -27,6 +38,10 @@ except (FileNotFoundError, json.JSONDecodeError) as e:
     print(f"❌ Error loading diseases.json: {e}")
     diseases_data = []
 
+# Build the symptom search index once instead of scanning on every request
+disease_index = SearchIndex(diseases_data)
+disease_lookup = RecordLookup(diseases_data)
+
 # Function to find matching diseases from JSON
 def find_matching_diseases(symptom):
     if not symptom:
@@ -35,11 +50,7 @@ def find_matching_diseases(symptom):
     symptom = symptom.lower().strip()
 
     # **Corrected Matching Logic**
-    matching_diseases = [
-        d for d in diseases_data
-        if symptom in d.get("word_synonyms", "").lower() or 
-           any(symptom in synonym.lower() for synonym in d.get("synonyms", []))
-    ]
+    matching_diseases = disease_index.search(symptom, fields=("word_synonyms", "synonyms"))
 
     print(f"🔍 Found {len(matching_diseases)} matching diseases for symptom: {symptom}")
     return matching_diseases
@@ -51,10 +62,13 @@ def generate_disease_analysis(disease_name):
 
     try:
         model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(
+        response = gemini.call(
+            model.generate_content,
             f"Provide a detailed medical analysis of the disease {disease_name}, including causes, symptoms, treatments, and risk factors."
         )
         return response.text if response and response.text else "No AI-generated analysis available."
+    except ModelUnavailable:
+        return "AI analysis is unavailable right now, please try again shortly."
     except Exception as e:
         print(f"❌ AI Error: {e}")
         return "Error generating AI details."
@@ -75,7 +89,7 @@ def index():
 
     disease_id = request.args.get("disease_id")
     if disease_id:
-        disease_data = next((d for d in diseases_data if d["key_id"] == disease_id), None)
+        disease_data = disease_lookup.get(disease_id)
 
         if disease_data:
             ai_analysis = generate_disease_analysis(disease_data["primary_name"])
@@ -1,5 +1,11 @@
 from flask import Flask, render_template, request
 import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.lookup import RecordLookup
+from common.search_index import SearchIndex
 
 app = Flask(__name__, template_folder="frontend", static_folder="assets")
 
@@ -8,6 +14,8 @@ def load_diseases():
         return json.load(file)
 
 diseases = load_diseases()
+disease_index = SearchIndex(diseases)
+disease_lookup = RecordLookup(diseases)
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -17,12 +25,11 @@ def index():
 
     if request.method == "POST":
         user_symptom = request.form.get("symptom", "").strip().lower()
-        matched_diseases = [d for d in diseases if user_symptom in d.get("word_synonyms", "").lower() or 
-                             any(user_symptom in synonym.lower() for synonym in d.get("synonyms", []))]
+        matched_diseases = disease_index.search(user_symptom, fields=("word_synonyms", "synonyms"))
     
     disease_id = request.args.get("disease_id")
     if disease_id:
-        disease_data = next((d for d in diseases if d["key_id"] == disease_id), None)
+        disease_data = disease_lookup.get(disease_id)
     
     return render_template("index.html", symptom=user_symptom, diseases=matched_diseases, disease=disease_data)
 
@@ -2,8 +2,19 @@ from flask import Flask, jsonify, request, render_template, url_for
 from flask_cors import CORS 
 import json 
 import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.export import export_response
+from common.fuzzy import FuzzyIndex, requested_max_distance
+from common.lookup import RecordLookup
+from common.paging import page_params
+from common.profiling import install_profiler
+from common.search_index import SearchIndex
 
 app = Flask(__name__)
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "trojillo")
 CORS(app)
 
 # Load the data from the JSON file
@@ -11,6 +22,13 @@ json_path = os.path.join(os.path.dirname(__file__), 'diseases.json')
 with open(json_path) as file:
     data = json.load(file)
 
+# Index primary names, synonyms and keywords once for /search
+disease_index = SearchIndex(data)
+# key_id lookups for /info
+disease_lookup = RecordLookup(data)
+# Typo-tolerant matching for /search?mode=fuzzy
+fuzzy_index = FuzzyIndex(data)
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -18,7 +36,7 @@ def home():
 @app.route('/info/<key_id>', methods=['GET'])
 def get_info(key_id):
     """Fetch information by key_id."""
-    result = next((item for item in data if item['key_id'] == key_id), None)
+    result = disease_lookup.get(key_id)
     if result:
         return jsonify(result)
     else:
@@ -26,18 +44,32 @@ def get_info(key_id):
 
 @app.route('/search', methods=['GET'])
 def search():
-    """Search diseases or procedures by primary name, synonyms, or keywords."""
+    """Search diseases or procedures by primary name, synonyms, or keywords.
+
+    With mode=fuzzy, names and synonyms within max_distance edits of the
+    query are returned best first with a similarity score.
+
+    Results are paged with limit/offset; for substring searches the total
+    number of matches is in the X-Total-Count header.
+    """
     query = request.args.get('query', '').lower()
     if not query:
         return jsonify({"error": "Query parameter is required."}), 400
+    try:
+        limit, offset = page_params(request.args)
+        max_distance = requested_max_distance(request.args.get('max_distance'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    results = [
-        item for item in data
-        if query in item['primary_name'].lower() or
-           any(query in synonym.lower() for synonym in item.get('synonyms', [])) or
-           query in item.get('word_synonyms', '').lower()
-    ]
-    return jsonify(results if results else {"message": "No results found."})
+    headers = {}
+    if request.args.get('mode') == 'fuzzy':
+        matches = fuzzy_index.search(query, limit=offset + limit, max_distance=max_distance)
+        results = [dict(item, similarity=score, matched_term=term) for item, score, term in matches[offset:]]
+    else:
+        page = disease_index.search_page(query, limit, offset)
+        results = disease_index.get_records(page.ids)
+        headers = page.headers()
+    return jsonify(results if results else {"message": "No results found."}), 200, headers
 
 @app.route('/categories', methods=['GET'])
 def list_categories():
@@ -51,7 +83,7 @@ def list_categories():
 @app.route('/all', methods=['GET'])
 def get_all():
     """Retrieve all diseases and procedures."""
-    return jsonify(data)
+    return export_response(data, request)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
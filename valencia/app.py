@@ -4,6 +4,19 @@ from google import genai
 import json
 from pydantic import BaseModel
 import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.admission import AdmissionControl
+from common.batch import batch_inputs, diagnose_batch
+from common.export import export_response
+from common.llm_cache import ResponseCache, data_version
+from common.metrics import Metrics
+from common.paging import page_params
+from common.profiling import install_profiler
+from common.ranking import SymptomRanker, diagnose_with_shortlist
+from common.resilience import DEGRADED_HEADERS, ModelGuard, ModelUnavailable, degraded_results, genai_timeout, unavailable_response
+from common.search_index import SearchIndex
 
 class Diagnosis(BaseModel):
     key_id: str
@@ -13,6 +26,10 @@ class Diagnosis(BaseModel):
     synonyms: list[str]
     info_link_data: list[list[str]]
 
+class BatchDiagnosis(BaseModel):
+    index: int
+    diagnoses: list[Diagnosis]
+
 # Load environment variables from .env (for local development)
 load_dotenv()
 
@@ -24,14 +41,41 @@ if not api_key:
 
 # Initialize the Gemini client
 client = genai.Client(api_key=api_key)
+# Deadlines, retries and circuit breaker for every Gemini call
+gemini = ModelGuard("valencia", genai_timeout)
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='static', template_folder='templates')
+# Opt-in request profiling, see common/profiling.py
+install_profiler(app, "valencia")
+# Request and model call metrics, served at /metrics
+metrics = Metrics("valencia")
+metrics.init_app(app)
+# Keep handlers free for local routes while model calls pile up
+admission = AdmissionControl(app, "valencia", {"get_chat", "get_diagnosis", "get_batch_diagnosis"})
+# 503 + Retry-After for model calls without a local fallback
+app.register_error_handler(ModelUnavailable, unavailable_response)
 
 # Load data from diseases.json file
 with open('diseases.json') as f:
     diseases = json.load(f)
 
+# Index primary names, synonyms and keywords once for /search
+disease_index = SearchIndex(diseases)
+# Local ranker that picks the candidate records sent to Gemini
+disease_ranker = SymptomRanker(diseases, disease_index)
+
+DIAGNOSIS_MODEL = "gemini-2.0-flash"
+# Bump when the diagnosis prompt changes so cached answers are not reused
+DIAGNOSIS_PROMPT_VERSION = "1"
+# Cached diagnoses per symptom set, tied to the records loaded above
+diagnosis_cache = ResponseCache(version=data_version(diseases))
+metrics.register("diagnosis_cache", diagnosis_cache.stats,
+                 ("hits", "misses", "size", "evictions", "invalidations"))
+metrics.register("circuit_breaker", gemini.breaker.stats, ("trips", "recent_calls"))
+metrics.register("admission", admission.stats,
+                 ("in_flight", "admitted", "queued", "rejected", "timed_out"), group="class")
+
 @app.route("/")
 def home():
     """Home route that renders a modernized minimalist template."""
@@ -40,12 +84,13 @@ def home():
 @app.route('/diseases', methods=['GET'])
 def get_diseases():
     """Retrieve the list of all diseases from local JSON."""
-    return jsonify(diseases)
+    return export_response(diseases, request)
 
 @app.route('/chat', methods=['GET'])
 def get_chat():
     """Generate a basic diagnostic example."""
-    response = client.models.generate_content(
+    response = gemini.call(
+        metrics.wrap("chat", client.models.generate_content),
         model="gemini-2.0-flash",
         contents=[
             "You are a medical diagnostic expert.",
@@ -63,42 +108,93 @@ def get_diagnosis():
     if not symptoms:
         return jsonify({"error": "Symptoms parameter is required."}), 400
 
-    # Generate diagnosis with confidence levels
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[
-            f"This is the existing data in JSON format: {json.dumps(diseases)}",
-            f"Match the closest disease with the following symptoms: {symptoms}",
-            "Provide the most likely disease with a confidence percentage.",
-            "List the next three closest diseases with their confidence levels.",
-            "Include the info_link_data for all matches in the response."
-        ],
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": list[Diagnosis]
-        }
-    )
+    def ask(candidates):
+        # Generate diagnosis with confidence levels
+        response = gemini.call(
+            metrics.wrap("diagnosis", client.models.generate_content),
+            model=DIAGNOSIS_MODEL,
+            contents=[
+                f"This is the existing data in JSON format: {json.dumps(candidates)}",
+                f"Match the closest disease with the following symptoms: {symptoms}",
+                "Provide the most likely disease with a confidence percentage.",
+                "List the next three closest diseases with their confidence levels.",
+                "Include the info_link_data for all matches in the response."
+            ],
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": list[Diagnosis]
+            }
+        )
+        return json.loads(response.text)
+
     try:
-        # Parse and format response
-        diagnosis = json.loads(response.text)
+        # Only the locally ranked shortlist goes into the prompt
+        diagnosis = diagnosis_cache.get_or_call(
+            symptoms, DIAGNOSIS_MODEL, DIAGNOSIS_PROMPT_VERSION,
+            lambda: diagnose_with_shortlist(ask, disease_ranker, symptoms)
+        )
         return jsonify(diagnosis)
+    except ModelUnavailable:
+        # Model is down or too slow: answer from the local ranker instead
+        return jsonify(degraded_results(disease_ranker, symptoms)), 200, DEGRADED_HEADERS
     except Exception as e:
         return jsonify({"error": "Failed to parse response from Gemini API.", "details": str(e)}), 500
 
+@app.route('/diagnosis/batch', methods=['POST'])
+def get_batch_diagnosis():
+    """Diagnose a list of symptom sets, grouping several sets per Gemini call."""
+    try:
+        symptom_sets = batch_inputs(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def ask_group(candidates, queries):
+        response = gemini.call(
+            metrics.wrap("diagnosis_batch", client.models.generate_content),
+            model=DIAGNOSIS_MODEL,
+            contents=[
+                f"This is the existing data in JSON format: {json.dumps(candidates)}",
+                f"These are numbered symptom sets: {json.dumps(queries)}",
+                "For each symptom set, match the closest diseases from the data.",
+                "Return the index of the symptom set with the most likely disease first "
+                "and the next three closest diseases after it.",
+                "Include the info_link_data for all matches in the response."
+            ],
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": list[BatchDiagnosis]
+            }
+        )
+        return json.loads(response.text)
+
+    return jsonify({"results": diagnose_batch(
+        ask_group, disease_ranker, symptom_sets,
+        cache=diagnosis_cache, model=DIAGNOSIS_MODEL, prompt_version=DIAGNOSIS_PROMPT_VERSION
+    )})
+
+@app.route('/diagnosis/cache', methods=['GET'])
+def diagnosis_cache_stats():
+    """Hit/miss counters for the diagnosis cache."""
+    return jsonify(diagnosis_cache.stats())
+
 @app.route('/search', methods=['GET'])
 def search():
-    """Search diseases or procedures by primary name, synonyms, or keywords."""
+    """Search diseases or procedures by primary name, synonyms, or keywords.
+
+    Returns one page of the best matches (limit/offset); the total number of
+    matches is in the X-Total-Count header.
+    """
     query = request.args.get('query', '').lower()
     if not query:
         return jsonify({"error": "Query parameter is required."}), 400
+    try:
+        limit, offset = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    results = [
-        item for item in diseases
-        if query in item['primary_name'].lower() or
-           any(query in synonym.lower() for synonym in item.get('synonyms', [])) or
-           query in item.get('word_synonyms', '').lower()
-    ]
-    return jsonify(results if results else {"message": "No results found."})
+    page = disease_index.search_page(query, limit, offset)
+    results = disease_index.get_records(page.ids)
+    return jsonify(results if results else {"message": "No results found."}), 200, page.headers()
 
 if __name__ == '__main__':
     app.run(debug=True)